@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Scalability benchmark of the watchdog against a fake buffer fleet.
+
+Starts a child process serving Savant-buffer-style ``/metrics`` pages for
+N buffers, one port per buffer, and a fake Docker API on a Unix socket.
+Then runs the real watchdog ``main`` against them for a fixed duration and
+reports scrapes/sec, CPU per scrape, RSS, polling-interval drift and
+detection-to-action latency.
+
+Run from the repository root:
+
+    python -m benchmarks.fleet --buffers 200 --duration 30
+
+Each buffer takes a listening socket and a connection, raise ``ulimit -n``
+for large fleets.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+import yaml
+from aiohttp import web
+
+BUFFER_LABEL = 'watchdog.buffer'
+QUEUE_LENGTH = 100
+TIMESTAMP = 1720441634544
+
+
+class FakeFleet:
+    """Buffers serving metrics pages and the Docker API receiving actions."""
+
+    def __init__(self, args: argparse.Namespace):
+        self._args = args
+        self._violating = set(
+            random.Random(0).sample(
+                range(args.buffers), int(args.buffers * args.violating)
+            )
+        )
+        self._ports: Dict[int, int] = {}
+        self._filler = self._generate_filler(args.page_series)
+        # time the first violating page is served since the last action
+        self._detected_at: Dict[int, float] = {}
+        self.action_latencies: List[float] = []
+        self.pages = 0
+        self.failures = 0
+
+    @staticmethod
+    def _generate_filler(series: int) -> bytes:
+        lines = [
+            '# HELP latency_seconds Message latency',
+            '# TYPE latency_seconds histogram',
+        ]
+        for i in range(series):
+            lines.append(
+                f'latency_seconds_bucket{{adapter="buffer",source_id="source-{i // 10}",'
+                f'le="{i % 10}.0"}} {i}.0 {TIMESTAMP}'
+            )
+        return ('\n'.join(lines) + '\n').encode()
+
+    async def handle_metrics(self, request: web.Request) -> web.StreamResponse:
+        buffer = self._ports[request.transport.get_extra_info('sockname')[1]]
+        if self._args.latency:
+            await asyncio.sleep(self._args.latency)
+        if random.random() < self._args.failure_rate:
+            self.failures += 1
+            # abort the connection, as a crashed buffer does
+            request.transport.abort()
+            return web.Response()
+
+        self.pages += 1
+        size = QUEUE_LENGTH * 10 if buffer in self._violating else 0
+        if size > QUEUE_LENGTH:
+            self._detected_at.setdefault(buffer, time.time())
+        now = time.time()
+        # every page is a refreshed sample, so no check is skipped
+        timestamp = int(now * 1000)
+        # the watched gauges follow the filler, the worst case for early stop
+        gauges = (
+            f'buffer_size{{adapter="buffer"}} {size}.0 {timestamp}\n'
+            f'last_sent_message{{adapter="buffer"}} {now} {timestamp}\n'
+            f'last_received_message{{adapter="buffer"}} {now} {timestamp}\n'
+        )
+        return web.Response(body=self._filler + gauges.encode())
+
+    async def handle_version(self, request: web.Request) -> web.Response:
+        return web.json_response({'ApiVersion': '1.41'})
+
+    async def handle_events(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        await response.prepare(request)
+        # no container changes, the stream stays open
+        await asyncio.Event().wait()
+        return response
+
+    async def handle_list(self, request: web.Request) -> web.Response:
+        containers = [
+            {'Id': f'container-{i}', 'Labels': {BUFFER_LABEL: f'buffer-{i}'}}
+            for i in range(self._args.buffers)
+        ]
+        filters = json.loads(request.query.get('filters', '{}'))
+        for label in filters.get('label', []):
+            name, _, value = label.partition('=')
+            containers = [
+                x
+                for x in containers
+                if name in x['Labels'] and (not value or x['Labels'][name] == value)
+            ]
+        return web.json_response(containers)
+
+    async def handle_action(self, request: web.Request) -> web.Response:
+        buffer = int(request.match_info['id'].rsplit('-', 1)[1])
+        detected_at = self._detected_at.pop(buffer, None)
+        if detected_at is not None:
+            self.action_latencies.append(time.time() - detected_at)
+        return web.Response(status=204)
+
+    async def start(self, docker_socket: str) -> List[str]:
+        """Starts the servers.
+
+        :return: Urls of the buffers.
+        """
+
+        buffers = web.Application()
+        buffers.router.add_get('/metrics', self.handle_metrics)
+        runner = web.AppRunner(buffers, access_log=None)
+        await runner.setup()
+        urls = []
+        for i in range(self._args.buffers):
+            sock = socket.socket()
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+            await web.SockSite(runner, sock).start()
+            self._ports[port] = i
+            urls.append(f'127.0.0.1:{port}')
+
+        docker = web.Application()
+        docker.router.add_get('/version', self.handle_version)
+        docker.router.add_get('/{version}/events', self.handle_events)
+        docker.router.add_get('/{version}/containers/json', self.handle_list)
+        docker.router.add_post(
+            '/{version}/containers/{id}/{action}', self.handle_action
+        )
+        runner = web.AppRunner(docker, access_log=None)
+        await runner.setup()
+        await web.UnixSite(runner, docker_socket).start()
+
+        return urls
+
+
+def run_fleet(args: argparse.Namespace, docker_socket: str, conn):
+    # aborted scrapes are expected
+    logging.getLogger('aiohttp').setLevel(logging.CRITICAL)
+
+    async def serve():
+        fleet = FakeFleet(args)
+        conn.send(await fleet.start(docker_socket))
+        # wait for the watchdog to finish
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        conn.send(
+            {
+                'pages': fleet.pages,
+                'failures': fleet.failures,
+                'action_latencies': fleet.action_latencies,
+            }
+        )
+
+    asyncio.run(serve())
+
+
+def write_config(path: str, urls: List[str], args: argparse.Namespace):
+    watch = []
+    for i, url in enumerate(urls):
+        container = [{'labels': f'{BUFFER_LABEL}=buffer-{i}'}]
+        watch.append(
+            {
+                'buffer': url,
+                'queue': {
+                    'action': 'restart',
+                    'length': QUEUE_LENGTH,
+                    'cooldown': f'{args.cooldown}s',
+                    'polling_interval': f'{args.polling_interval}s',
+                    'container': container,
+                    **(
+                        {'min_polling_interval': f'{args.min_polling_interval}s'}
+                        if args.min_polling_interval
+                        else {}
+                    ),
+                },
+            }
+        )
+    with open(path, 'w') as file:
+        yaml.dump({'watch': watch}, file)
+
+
+def histogram_stats(histogram) -> Dict[str, float]:
+    """Merges the histogram series into the count, mean and p99 upper bound."""
+
+    series = histogram.series()
+    count = sum(x.count for x in series)
+    if not count:
+        return {'count': 0, 'mean': 0.0, 'p99': 0.0}
+
+    counts = [sum(x) for x in zip(*(x.counts for x in series))]
+    bounds = histogram.buckets + (float('inf'),)
+    cumulative = 0
+    p99 = bounds[-1]
+    for bound, bucket_count in zip(bounds, counts):
+        cumulative += bucket_count
+        if cumulative >= 0.99 * count:
+            p99 = bound
+            break
+
+    return {
+        'count': count,
+        'mean': sum(x.sum for x in series) / count,
+        'p99': p99,
+    }
+
+
+def get_rss_mb() -> float:
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--buffers', type=int, default=100)
+    arg_parser.add_argument('--page-series', type=int, default=1000)
+    arg_parser.add_argument(
+        '--latency', type=float, default=0, help='Response latency in seconds.'
+    )
+    arg_parser.add_argument(
+        '--failure-rate', type=float, default=0, help='Share of aborted scrapes.'
+    )
+    arg_parser.add_argument(
+        '--violating', type=float, default=0.1, help='Share of full buffers.'
+    )
+    arg_parser.add_argument('--polling-interval', type=int, default=1)
+    arg_parser.add_argument(
+        '--min-polling-interval',
+        type=int,
+        default=0,
+        help='Enables the adaptive polling down to the interval.',
+    )
+    arg_parser.add_argument('--cooldown', type=int, default=5)
+    arg_parser.add_argument('--duration', type=float, default=30)
+    args = arg_parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='watchdog-fleet-')
+    docker_socket = os.path.join(tmp_dir, 'docker.sock')
+    config_path = os.path.join(tmp_dir, 'config.yml')
+
+    conn, child_conn = multiprocessing.Pipe()
+    fleet = multiprocessing.Process(
+        target=run_fleet, args=(args, docker_socket, child_conn), daemon=True
+    )
+    fleet.start()
+    write_config(config_path, conn.recv(), args)
+
+    os.environ['CONFIG_FILE_PATH'] = config_path
+    os.environ['DOCKER_HOST'] = f'unix://{docker_socket}'
+    os.environ.setdefault('LOGLEVEL', 'ERROR')
+    # the stats are read from the telemetry of this process
+    os.environ['WATCHDOG_SHARDS'] = '1'
+    # the watchdog reads the environment on import
+    from src.pipeline_watchdog import run, telemetry
+
+    def stop():
+        raise KeyboardInterrupt()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.call_later(args.duration, stop)
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    run.main()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    conn.send('stop')
+    fleet_stats = conn.recv()
+    fleet.join()
+
+    scrapes = histogram_stats(telemetry.SCRAPE_DURATION)
+    parse = histogram_stats(telemetry.PARSE_DURATION)
+    drift = histogram_stats(telemetry.CHECK_DELAY)
+    errors = sum(x.value for x in telemetry.SCRAPE_ERRORS.series())
+    latencies = sorted(fleet_stats['action_latencies'])
+
+    print(f'buffers:                  {args.buffers}')
+    print(f'page series:              {args.page_series}')
+    print(f'duration, s:              {wall:.1f}')
+    print(f'scrapes/sec:              {scrapes["count"] / wall:.1f}')
+    print(f'scrape errors:            {errors:.0f} ({fleet_stats["failures"]} aborted)')
+    print(f'scrape latency mean, ms:  {scrapes["mean"] * 1e3:.2f}')
+    print(f'parse time mean, ms:      {parse["mean"] * 1e3:.3f}')
+    print(f'CPU utilization, %:       {cpu / wall * 100:.1f}')
+    if scrapes['count']:
+        print(f'CPU per scrape, ms:       {cpu / scrapes["count"] * 1e3:.3f}')
+    print(f'RSS, MB:                  {get_rss_mb():.1f}')
+    print(
+        f'peak RSS, MB:             '
+        f'{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f}'
+    )
+    print(f'polling drift mean, ms:   {drift["mean"] * 1e3:.2f}')
+    print(f'polling drift p99 <=, ms: {drift["p99"] * 1e3:.0f}')
+    if latencies:
+        print(f'actions:                  {len(latencies)}')
+        print(
+            f'detection-to-action median, ms: {statistics.median(latencies) * 1e3:.2f}'
+        )
+        print(f'detection-to-action max, ms:    {latencies[-1] * 1e3:.2f}')
+
+
+if __name__ == '__main__':
+    main()
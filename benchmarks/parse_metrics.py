@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the metrics parsers.
+
+Compares the regex parser, that extracts every metric of the exposition,
+with the selective line parser, that extracts only the watched metrics.
+
+Run from the repository root:
+
+    python -m benchmarks.parse_metrics --series 1000
+"""
+
+import argparse
+import re
+import timeit
+from typing import Dict, Iterable, List
+
+from src.pipeline_watchdog.buffer_metrics import MetricsParser, Selector
+
+METRIC_PATTERN = re.compile(r'(\w+){[^}]*} ([0-9.e+-]+) \d+')
+WATCHED_METRICS = ['buffer_size', 'last_sent_message', 'last_received_message']
+WATCHED_SELECTORS = [(x, ()) for x in WATCHED_METRICS]
+TIMESTAMP = 1720441634544
+
+
+def generate_exposition(series: int, watched_first: bool) -> str:
+    """Generates a buffer exposition page with the watched gauges and
+    a histogram with the given number of series."""
+
+    watched = []
+    for name in WATCHED_METRICS:
+        watched += [
+            f'# HELP {name} {name}',
+            f'# TYPE {name} gauge',
+            f'{name}{{adapter="buffer"}} 1.0 {TIMESTAMP}',
+        ]
+
+    histogram = [
+        '# HELP latency_seconds Message latency',
+        '# TYPE latency_seconds histogram',
+    ]
+    for i in range(series):
+        histogram.append(
+            f'latency_seconds_bucket{{adapter="buffer",source_id="source-{i // 10}",'
+            f'le="{i % 10}.0"}} {i}.0 {TIMESTAMP}'
+        )
+
+    lines = watched + histogram if watched_first else histogram + watched
+    return '\n'.join(lines) + '\n'
+
+
+def parse_metrics(content: str) -> Dict[str, float]:
+    """Baseline regex parser of the whole exposition, the last series
+    of a metric wins."""
+
+    metrics = {}
+    for match in METRIC_PATTERN.finditer(content):
+        metric, value = match.groups()
+        metrics[metric] = float(value)
+    return metrics
+
+
+def run_selective(lines: List[bytes], selectors: Iterable[Selector]):
+    parser = MetricsParser(selectors)
+    for line in lines:
+        if parser.feed(line):
+            break
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--series', type=int, default=1000)
+    arg_parser.add_argument('--number', type=int, default=200)
+    args = arg_parser.parse_args()
+
+    print(f'{"case":<40} {"us/parse":>10}')
+    for watched_first in (True, False):
+        content = generate_exposition(args.series, watched_first)
+        lines = content.encode().splitlines(keepends=True)
+        position = 'first' if watched_first else 'last'
+        cases = [
+            ('regex, all metrics', lambda: parse_metrics(content)),
+            (
+                'line parser, watched metrics',
+                lambda: run_selective(lines, WATCHED_SELECTORS),
+            ),
+        ]
+        for name, func in cases:
+            elapsed = timeit.timeit(func, number=args.number)
+            print(
+                f'{f"{name} ({position})":<40} ' f'{elapsed / args.number * 1e6:>10.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Startup-time benchmark of the watchdog.
+
+Generates configuration files with the given numbers of watch entries and
+measures, each in a fresh interpreter, the time to import the watchdog and
+to load the configuration without the cache, i.e. a first start or a changed
+file, and from the cache, i.e. a restart with an unchanged file. Files with
+interpolations are measured separately, as they are resolved by OmegaConf.
+
+Run from the repository root:
+
+    python -m benchmarks.startup --watches 100 1000 5000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+import yaml
+
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+from src.pipeline_watchdog import run
+imported = time.perf_counter()
+run.load_buffers(sys.argv[1])
+loaded = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'load': loaded - imported,
+    'omegaconf': 'omegaconf' in sys.modules,
+}))
+'''
+
+
+def write_config(path: str, watches: int, interpolated: bool):
+    polling_interval = '${oc.env:POLLING_INTERVAL}' if interpolated else '10s'
+    watch = []
+    for i in range(watches):
+        container = [{'labels': [f'app=pipeline-{i}', 'role=buffer']}]
+        watch.append(
+            {
+                'buffer': f'buffer-{i}:8000',
+                'queue': {
+                    'action': 'restart',
+                    'length': 1000,
+                    'cooldown': '60s',
+                    'polling_interval': polling_interval,
+                    'container': container,
+                },
+                'egress': {
+                    'action': 'restart',
+                    'idle': '100s',
+                    'cooldown': '60s',
+                    'container': container,
+                },
+                'ingress': {
+                    'action': 'restart',
+                    'idle': '100s',
+                    'cooldown': '60s',
+                    'container': container,
+                },
+            }
+        )
+    with open(path, 'w') as file:
+        yaml.dump({'watch': watch}, file)
+
+
+def measure(config_path: str, cache_dir: str) -> Dict[str, float]:
+    env = dict(
+        os.environ,
+        CONFIG_CACHE_DIR=cache_dir,
+        POLLING_INTERVAL='10s',
+        LOGLEVEL='ERROR',
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE, config_path],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--watches', type=int, nargs='+', default=[100, 1000])
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='watchdog-startup-')
+    print(
+        f'{"watches":>8} {"interp.":>8} {"import, ms":>11} '
+        f'{"cold load, ms":>14} {"cached load, ms":>16}'
+    )
+    for watches in args.watches:
+        for interpolated in (False, True):
+            config_path = os.path.join(tmp_dir, f'config-{watches}-{interpolated}.yml')
+            write_config(config_path, watches, interpolated)
+
+            imports: List[float] = []
+            cold: List[float] = []
+            cached: List[float] = []
+            for i in range(args.repeat):
+                cache_dir = os.path.join(tmp_dir, f'cache-{watches}-{interpolated}-{i}')
+                result = measure(config_path, cache_dir)
+                imports.append(result['import'])
+                cold.append(result['load'])
+                result = measure(config_path, cache_dir)
+                imports.append(result['import'])
+                cached.append(result['load'])
+                assert not result['omegaconf'], 'cached load imported OmegaConf'
+
+            print(
+                f'{watches:>8} {"yes" if interpolated else "no":>8} '
+                f'{statistics.median(imports) * 1e3:>11.1f} '
+                f'{statistics.median(cold) * 1e3:>14.1f} '
+                f'{statistics.median(cached) * 1e3:>16.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmark of the buffer watch loops waiting for their ticks.
+
+Runs the real ``watch_buffer`` loops of N buffers against a metrics client
+returning a healthy sample at once, so that the CPU is spent on the loops
+themselves, with each loop sleeping on its own event loop timer and with
+all loops sleeping on the shared scheduler. Reports the checks/sec and the
+CPU time per check.
+
+Run from the repository root:
+
+    python -m benchmarks.watch_loop --buffers 1000 10000 --duration 10
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import List, Optional
+from unittest.mock import Mock
+
+from src.pipeline_watchdog.buffer_metrics import Samples
+from src.pipeline_watchdog.config import Action, FlowConfig, QueueConfig, WatchConfig
+from src.pipeline_watchdog.run import watch_buffer
+from src.pipeline_watchdog.scheduler import Scheduler, get_phase
+
+
+class StubMetricsClient:
+    """Metrics client returning the sample of a healthy buffer."""
+
+    def __init__(self):
+        self.scrapes = 0
+
+    async def scrape(self, buffer, selectors) -> Samples:
+        self.scrapes += 1
+        now = time.time()
+        samples = Samples()
+        samples.add('buffer_size', (), 10.0)
+        samples.add('last_sent_message', (), now)
+        samples.add('last_received_message', (), now)
+        return samples
+
+
+def create_configs(buffers: int, interval: float) -> List[WatchConfig]:
+    configs = []
+    for i in range(buffers):
+        container_labels = [[f'app=pipeline-{i}']]
+        configs.append(
+            WatchConfig(
+                buffer=f'buffer-{i}:8000',
+                queue=QueueConfig(Action.RESTART, 1000, 60, interval, container_labels),
+                egress=FlowConfig(Action.RESTART, 100, 60, interval, container_labels),
+                ingress=FlowConfig(Action.RESTART, 100, 60, interval, container_labels),
+            )
+        )
+    return configs
+
+
+async def run_loops(
+    configs: List[WatchConfig], scheduler: Optional[Scheduler], duration: float
+):
+    """Runs the watch loops for the duration, as ``BufferWatches`` does."""
+
+    metrics_client = StubMetricsClient()
+    tasks = [
+        asyncio.create_task(
+            watch_buffer(
+                Mock(),
+                metrics_client,
+                [config],
+                asyncio.Queue(),
+                scheduler=scheduler,
+                phase=get_phase(config.buffer),
+            )
+        )
+        for config in configs
+    ]
+    # the watches are built before the measurement
+    await asyncio.sleep(0)
+    start = time.process_time()
+    await asyncio.sleep(duration)
+    cpu = time.process_time() - start
+    scrapes = metrics_client.scrapes
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return scrapes, cpu
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--buffers', type=int, nargs='+', default=[1000, 10000])
+    arg_parser.add_argument('--interval', type=float, default=1)
+    arg_parser.add_argument('--duration', type=float, default=10)
+    args = arg_parser.parse_args()
+    logging.getLogger('PipelineWatchdog').setLevel(logging.WARNING)
+
+    print(f'{"buffers":>8} {"case":<20} {"checks/s":>10} {"CPU us/check":>13}')
+    for buffers in args.buffers:
+        configs = create_configs(buffers, args.interval)
+        for name, scheduler in (
+            ('event loop timers', None),
+            ('scheduler', Scheduler()),
+        ):
+            scrapes, cpu = asyncio.run(run_loops(configs, scheduler, args.duration))
+            # the conditions of a buffer are checked on every scrape
+            checks = scrapes * 3
+            print(
+                f'{buffers:>8} {name:<20} {checks / args.duration:>10.0f} '
+                f'{cpu / max(checks, 1) * 1e6:>13.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# key of the global bucket, label set keys are never empty
+GLOBAL_KEY = ''
+
+
+def take_token(
+    bucket: Optional[List[float]], capacity: int, window: float, now: float
+) -> Optional[List[float]]:
+    """Takes a token from a bucket of ``capacity`` tokens refilled evenly
+    over ``window`` seconds.
+
+    :param bucket: Tokens left and the time they were counted at, a full
+        bucket if None.
+    :return: The bucket after the token is taken, None if it is empty.
+    """
+
+    if bucket is None:
+        tokens = float(capacity)
+    else:
+        tokens, updated = bucket
+        # a clock going back does not drain the bucket
+        elapsed = max(now - updated, 0)
+        tokens = min(tokens + elapsed * capacity / window, capacity)
+
+    if tokens < 1:
+        return None
+    return [tokens - 1, now]
+
+
+class ActionBudget:
+    """Limits the rate of actions on containers by token buckets, a global one
+    and one per label sets of the action.
+
+    With a path, the buckets are kept in a file locked with ``flock`` while
+    updated, so that the budget is shared by the processes.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        limit_per_labels: int,
+        window: float,
+        path: Optional[str] = None,
+    ):
+        """
+        :param limit: Maximum number of actions per window, unlimited if 0.
+        :param limit_per_labels: Maximum number of actions per window on
+            the containers of the same label sets, unlimited if 0.
+        :param window: Window in seconds the limits are refilled over.
+        :param path: File to share the buckets with other processes.
+        """
+
+        self._limit = limit
+        self._limit_per_labels = limit_per_labels
+        self._window = window
+        self._path = path
+        self._buckets: Dict[str, List[float]] = {}
+
+    def try_take(self, labels: List[List[str]]) -> bool:
+        """Takes an action from the budget.
+
+        :param labels: Label sets of the containers the action is applied to.
+        :return: False if the global or the label sets budget is exhausted.
+        """
+
+        key = repr(labels)
+        with self._locked():
+            now = time.time()
+            updated = {}
+            for bucket_key, limit in (
+                (GLOBAL_KEY, self._limit),
+                (key, self._limit_per_labels),
+            ):
+                if not limit:
+                    continue
+                bucket = take_token(
+                    self._buckets.get(bucket_key), limit, self._window, now
+                )
+                if bucket is None:
+                    return False
+                updated[bucket_key] = bucket
+
+            self._buckets.update(updated)
+            # full buckets are dropped to keep the state small
+            self._buckets = {
+                k: v for k, v in self._buckets.items() if now - v[1] < self._window
+            }
+        return True
+
+    @contextmanager
+    def _locked(self):
+        if self._path is None:
+            yield
+            return
+
+        fd = os.open(self._path, os.O_CREAT | os.O_RDWR)
+        try:
+            # the lock is held only to update the buckets
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), 'r+') as file:
+                try:
+                    self._buckets = json.loads(file.read() or '{}')
+                except ValueError:
+                    # a corrupted state resets the budget
+                    self._buckets = {}
+                yield
+                file.seek(0)
+                file.truncate()
+                json.dump(self._buckets, file)
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Generic, Set, TypeVar
+
+from src.pipeline_watchdog.config import Action
+from src.pipeline_watchdog.telemetry import ACTIONS_COALESCED
+
+T = TypeVar('T')
+
+logger = logging.getLogger('PipelineWatchdog')
+
+
+@dataclass
+class PendingAction(Generic[T]):
+    action: Action
+    """Action to apply, the strongest of the merged ones."""
+
+    apply: Callable[[], Awaitable[T]]
+    """Function that applies the action."""
+
+    result: asyncio.Future
+    """Result shared by the merged requests."""
+
+
+class ActionCoalescer(Generic[T]):
+    """Merges the actions requested for the same container.
+
+    An action is applied after the window since the first request for the
+    container, the actions requested in the meantime are merged into it and
+    ``stop`` supersedes ``restart``. An action requested for a container that
+    is being acted on is skipped. The merged and skipped requests share the
+    result of the applied action.
+    """
+
+    def __init__(self, window: float):
+        """
+        :param window: Time in seconds to wait for other actions on
+            the container before applying the action.
+        """
+
+        self._window = window
+        self._pending: Dict[str, PendingAction[T]] = {}
+        self._running: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(
+        self, container_id: str, action: Action, apply: Callable[[], Awaitable[T]]
+    ) -> T:
+        """Requests the action on the container.
+
+        :param apply: Function that applies the action.
+        :return: Result of the applied action.
+        """
+
+        running = self._running.get(container_id)
+        if running is not None:
+            logger.info(
+                'Container %s is being acted on, skipping %s',
+                container_id,
+                action.value,
+            )
+            ACTIONS_COALESCED.labels(action.value).inc()
+            return await asyncio.shield(running)
+
+        pending = self._pending.get(container_id)
+        if pending is None:
+            result = asyncio.get_running_loop().create_future()
+            # the result is not retrieved if all the requests are cancelled
+            result.add_done_callback(lambda x: x.cancelled() or x.exception())
+            pending = self._pending[container_id] = PendingAction(action, apply, result)
+            task = asyncio.create_task(self._apply(container_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            logger.info(
+                'Merging %s of container %s with pending %s',
+                action.value,
+                container_id,
+                pending.action.value,
+            )
+            ACTIONS_COALESCED.labels(action.value).inc()
+            if action == Action.STOP and pending.action != Action.STOP:
+                pending.action = action
+                pending.apply = apply
+
+        return await asyncio.shield(pending.result)
+
+    async def _apply(self, container_id: str):
+        pending = self._pending[container_id]
+        try:
+            await asyncio.sleep(self._window)
+            del self._pending[container_id]
+            self._running[container_id] = pending.result
+            pending.result.set_result(await pending.apply())
+        except asyncio.CancelledError:
+            pending.result.cancel()
+            raise
+        except Exception as e:
+            pending.result.set_exception(e)
+        finally:
+            self._pending.pop(container_id, None)
+            self._running.pop(container_id, None)
+
+    def close(self):
+        """Cancels the pending and running actions."""
+
+        for task in self._tasks:
+            task.cancel()
@@ -1,26 +1,298 @@
 import re
-from typing import Dict
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
 
-import aiohttp
+from src.pipeline_watchdog.telemetry import (
+    PARSE_DURATION,
+    SCRAPE_DURATION,
+    SCRAPE_ERRORS,
+)
+from src.pipeline_watchdog.utils import lazy_import
 
-METRIC_PATTERN = re.compile(r'(\w+){[^}]*} ([0-9.e+-]+) \d+')
+aiohttp = lazy_import('aiohttp')
 
+LABEL_PATTERN = re.compile(rb'(\w+)="((?:[^"\\]|\\.)*)"')
 
-async def get_metrics(buffer_url: str) -> str:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f'http://{buffer_url}/metrics') as response:
-            content = await response.text()
-            return content
+# Maximum number of distinct raw label sets kept parsed between scrapes
+LABELS_CACHE_SIZE = 10000
 
+Labels = Tuple[Tuple[str, str], ...]
+"""Label set of a series as (name, value) pairs sorted by name."""
 
-async def parse_metrics(content: str) -> Dict[str, float]:
-    metrics = {}
+Selector = Tuple[str, Labels]
+"""Metric name and label matchers to select series."""
 
-    try:
-        for match in METRIC_PATTERN.finditer(content):
-            metric, value = match.groups()
-            metrics[metric] = float(value)
-    except TypeError as e:
-        raise RuntimeError(f'Failed to parse metrics: {e}')
 
-    return metrics
+class Samples:
+    """Metric samples of a single scrape keyed by metric name and label set."""
+
+    def __init__(self):
+        self._series: Dict[str, Dict[Labels, float]] = {}
+        self._timestamps: Dict[str, Dict[Labels, float]] = {}
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Samples)
+            and self._series == other._series
+            and self._timestamps == other._timestamps
+        )
+
+    def __repr__(self):
+        return f'Samples({self._series}, timestamps={self._timestamps})'
+
+    def add(
+        self,
+        name: str,
+        labels: Labels,
+        value: float,
+        timestamp: Optional[float] = None,
+    ):
+        """
+        :param timestamp: Exposition timestamp of the sample in seconds.
+        """
+
+        self._series.setdefault(name, {})[labels] = value
+        if timestamp is not None:
+            self._timestamps.setdefault(name, {})[labels] = timestamp
+
+    def series(self, name: str) -> Dict[Labels, float]:
+        """Returns values of all series of the metric keyed by label set."""
+
+        return self._series.get(name, {})
+
+    def get(self, name: str, matchers: Labels = ()) -> float:
+        """Returns the value of the first series of the metric matching
+        all the label matchers.
+
+        :raises KeyError: No series of the metric matches the label matchers.
+        """
+
+        for labels, value in self.series(name).items():
+            if match_labels(labels, matchers):
+                return value
+        raise KeyError(name)
+
+    def select(self, matchers: Labels = ()) -> Dict[str, float]:
+        """Returns values of the first series of each metric matching
+        all the label matchers."""
+
+        metrics = {}
+        for name, series in self._series.items():
+            for labels, value in series.items():
+                if match_labels(labels, matchers):
+                    metrics[name] = value
+                    break
+        return metrics
+
+    def select_timestamp(self, matchers: Labels = ()) -> Optional[float]:
+        """Returns the latest exposition timestamp in seconds of the series
+        ``select`` returns, None if they have no timestamps."""
+
+        latest = None
+        for name, series in self._series.items():
+            for labels in series:
+                if match_labels(labels, matchers):
+                    timestamp = self._timestamps.get(name, {}).get(labels)
+                    if timestamp is not None and (latest is None or timestamp > latest):
+                        latest = timestamp
+                    break
+        return latest
+
+
+def match_labels(labels: Labels, matchers: Labels) -> bool:
+    return all(x in labels for x in matchers)
+
+
+def unescape_label_value(value: bytes) -> str:
+    value = value.decode()
+    if '\\' not in value:
+        return value
+    return re.sub(r'\\(.)', lambda m: '\n' if m[1] == 'n' else m[1], value)
+
+
+def to_labels(labels: Dict[str, str]) -> Labels:
+    """Converts a label dictionary to the label set representation."""
+
+    return tuple(sorted(labels.items()))
+
+
+class MetricsParser:
+    """Incremental parser of the Prometheus exposition format that extracts
+    only the requested series.
+
+    Lines are fed one by one, a line with an unrequested metric is skipped
+    after its name is read, without parsing the rest of it. Parsed label sets
+    are interned, so equal label sets share one object across scrapes.
+    """
+
+    def __init__(
+        self,
+        selectors: Iterable[Selector],
+        labels_cache: Optional[Dict[bytes, Labels]] = None,
+    ):
+        """
+        :param selectors: Metric names with label matchers of the series
+            to extract.
+        :param labels_cache: Cache of parsed label sets to share between parsers.
+        """
+
+        self._names: Dict[bytes, str] = {}
+        self._pending: Dict[str, List[Labels]] = {}
+        self._remaining = 0
+        for name, matchers in set(selectors):
+            self._names[name.encode()] = name
+            self._pending.setdefault(name, []).append(matchers)
+            self._remaining += 1
+        self._labels_cache = labels_cache if labels_cache is not None else {}
+        self.samples = Samples()
+
+    @property
+    def done(self) -> bool:
+        """Whether all requested series are found."""
+
+        return self._remaining == 0
+
+    def _parse_labels(self, raw_labels: bytes) -> Labels:
+        labels = self._labels_cache.get(raw_labels)
+        if labels is None:
+            if len(self._labels_cache) >= LABELS_CACHE_SIZE:
+                self._labels_cache.clear()
+            labels = tuple(
+                sorted(
+                    (sys.intern(k.decode()), sys.intern(unescape_label_value(v)))
+                    for k, v in LABEL_PATTERN.findall(raw_labels)
+                )
+            )
+            self._labels_cache[raw_labels] = labels
+        return labels
+
+    def feed(self, line: bytes) -> bool:
+        """Parses a single line of the exposition.
+
+        :param line: Line of the exposition.
+        :return: True when all requested series are found.
+        """
+
+        line = line.strip()
+        if line.startswith(b'#'):
+            return self.done
+
+        labels_start = line.find(b'{')
+        if labels_start < 0:
+            # a sample without labels, e.g. ``pushed_messages_total 42``
+            name_end = line.find(b' ')
+            labels_end = name_end - 1
+        else:
+            name_end = labels_start
+            labels_end = line.rfind(b'} ')
+            if labels_end < labels_start:
+                return self.done
+        if name_end <= 0:
+            return self.done
+
+        metric = self._names.get(line[:name_end])
+        if metric is None:
+            return self.done
+
+        fields = line[labels_end + 2 :].split(b' ', 2)
+        try:
+            value = float(fields[0])
+        except ValueError:
+            return self.done
+        timestamp = None
+        if len(fields) > 1:
+            try:
+                # milliseconds since the epoch
+                timestamp = int(fields[1]) / 1000
+            except ValueError:
+                pass
+
+        labels = ()
+        if labels_start >= 0:
+            labels = self._parse_labels(line[labels_start + 1 : labels_end])
+        self.samples.add(metric, labels, value, timestamp)
+
+        pending = self._pending.get(metric)
+        if pending:
+            matched = [x for x in pending if match_labels(labels, x)]
+            for matchers in matched:
+                pending.remove(matchers)
+            self._remaining -= len(matched)
+
+        return self.done
+
+
+class MetricsClient:
+    """Long-lived HTTP client to scrape buffer metrics.
+
+    All scrapes share one session, so connections to the buffers are kept
+    alive and reused, and DNS lookups are cached.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5,
+        read_timeout: float = 10,
+        scrape_timeout: float = 15,
+        limit: int = 100,
+        limit_per_host: int = 2,
+        dns_cache_ttl: int = 300,
+    ):
+        self._timeout = aiohttp.ClientTimeout(
+            total=scrape_timeout, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._dns_cache_ttl = dns_cache_ttl
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._labels_cache: Dict[bytes, Labels] = {}
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        # the session must be created within the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                ttl_dns_cache=self._dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self._timeout
+            )
+        return self._session
+
+    async def scrape(self, buffer_url: str, selectors: Iterable[Selector]) -> Samples:
+        """Retrieves and parses the buffer metrics line by line as the response
+        arrives. Parsing stops as soon as all requested series are found.
+
+        :param buffer_url: Buffer url to retrieve metrics.
+        :param selectors: Metric names with label matchers of the series
+            to extract.
+        :return: Parsed samples.
+        """
+
+        start = time.perf_counter()
+        parse_time = 0.0
+        try:
+            session = self._get_session()
+            parser = MetricsParser(selectors, self._labels_cache)
+            async with session.get(f'http://{buffer_url}/metrics') as response:
+                async for line in response.content:
+                    feed_start = time.perf_counter()
+                    done = parser.feed(line)
+                    parse_time += time.perf_counter() - feed_start
+                    if done:
+                        break
+                # drain the rest of the response to keep the connection reusable
+                await response.content.read()
+        except Exception:
+            SCRAPE_ERRORS.labels(buffer_url).inc()
+            raise
+
+        SCRAPE_DURATION.labels(buffer_url).observe(time.perf_counter() - start)
+        PARSE_DURATION.labels(buffer_url).observe(parse_time)
+        return parser.samples
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
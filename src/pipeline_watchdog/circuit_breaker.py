@@ -0,0 +1,67 @@
+import random
+from typing import Optional
+
+
+class CircuitBreaker:
+    """Tracks consecutive scrape failures of a buffer.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    scrapes are postponed for an exponentially growing, jittered delay.
+    A successful scrape closes the circuit.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        base_delay: float = 10,
+        max_delay: float = 300,
+        jitter: float = 0.2,
+    ):
+        """
+        :param failure_threshold: Number of consecutive failures to open the circuit.
+        :param base_delay: Delay in seconds after the circuit opens.
+        :param max_delay: Maximum delay in seconds between attempts.
+        :param jitter: Relative random deviation of the delay.
+        """
+
+        self._failure_threshold = failure_threshold
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self.failures = 0
+        self.failing_since: Optional[float] = None
+        self.retry_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.retry_at is not None
+
+    def record_success(self):
+        self.failures = 0
+        self.failing_since = None
+        self.retry_at = None
+
+    def record_failure(self, now: float):
+        """Records a failed attempt.
+
+        :param now: Monotonic time of the attempt.
+        """
+
+        self.failures += 1
+        if self.failing_since is None:
+            self.failing_since = now
+
+        if self.failures < self._failure_threshold:
+            return
+
+        delay = min(
+            self._base_delay * 2 ** (self.failures - self._failure_threshold),
+            self._max_delay,
+        )
+        delay *= random.uniform(1 - self._jitter, 1 + self._jitter)
+        self.retry_at = now + delay
+
+    def unreachable_for(self, now: float) -> float:
+        """Returns the time in seconds since the first failed attempt in a row."""
+
+        return now - self.failing_since if self.failing_since is not None else 0
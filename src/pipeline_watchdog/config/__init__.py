@@ -1 +1,9 @@
-from .config import Action, FlowConfig, QueueConfig, WatchConfig
+from .config import (
+    Action,
+    FlowConfig,
+    QueueConfig,
+    RuleConfig,
+    ThroughputConfig,
+    UnreachableConfig,
+    WatchConfig,
+)
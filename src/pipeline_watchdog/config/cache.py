@@ -0,0 +1,82 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Optional
+
+from src.pipeline_watchdog import utils
+from src.pipeline_watchdog.config import config, parser, rule
+from src.pipeline_watchdog.config.config import Config
+
+CACHE_SUFFIX = '.config.pickle'
+
+
+class ConfigCache:
+    """Parsed configurations pickled to a directory, keyed by the hash of
+    the configuration file, so that an unchanged file is not parsed again.
+
+    The key also covers the configuration classes and the parser, so that
+    a cache written by another version of the watchdog is not used, and the
+    environment when the file has interpolations, which may read it. The
+    cached configs are unpickled, so the directory must be writable only by
+    the watchdog.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Directory of the cache, created if missing.
+        """
+
+        self._path = path
+
+    @staticmethod
+    def get_key(config_path: str) -> str:
+        """Returns the cache key of the configuration file."""
+
+        digest = hashlib.sha256()
+        for path in (config.__file__, parser.__file__, rule.__file__, utils.__file__):
+            with open(path, 'rb') as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+
+        with open(config_path, 'rb') as file:
+            content = file.read()
+        digest.update(content)
+        if b'${' in content:
+            for name, value in sorted(os.environ.items()):
+                digest.update(f'{name}={value}\0'.encode())
+
+        return digest.hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self._path, f'{key}{CACHE_SUFFIX}')
+
+    def get(self, key: str) -> Optional[Config]:
+        """Returns the cached configuration, None if there is no valid one."""
+
+        try:
+            with open(self._get_path(key), 'rb') as file:
+                cached = pickle.load(file)
+        except Exception:
+            return None
+
+        return cached if isinstance(cached, Config) else None
+
+    def put(self, key: str, cached: Config):
+        """Caches the configuration, replacing the configurations of other keys."""
+
+        os.makedirs(self._path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._path)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(cached, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._get_path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        for name in os.listdir(self._path):
+            if name.endswith(CACHE_SUFFIX) and name != f'{key}{CACHE_SUFFIX}':
+                try:
+                    os.unlink(os.path.join(self._path, name))
+                except OSError:
+                    pass
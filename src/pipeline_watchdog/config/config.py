@@ -1,7 +1,9 @@
 # This file contains the configuration classes for the pipeline watchdog
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from src.pipeline_watchdog.config.rule import Rule
 
 
 def validate_container_labels(labels: List[List[str]]):
@@ -9,6 +11,16 @@ def validate_container_labels(labels: List[List[str]]):
         raise ValueError(f'Container labels cannot be empty.')
 
 
+def validate_min_polling_interval(
+    min_polling_interval: Optional[int], polling_interval: int
+):
+    if min_polling_interval is not None and min_polling_interval > polling_interval:
+        raise ValueError(
+            f'Min polling interval "{min_polling_interval}" cannot exceed '
+            f'polling interval "{polling_interval}".'
+        )
+
+
 class Action(Enum):
     STOP = 'stop'
     RESTART = 'restart'
@@ -33,8 +45,33 @@ class QueueConfig:
     container_labels: List[List[str]]
     """List of labels to filter the containers to which the action is applied."""
 
+    concurrency: Optional[int] = None
+    """Maximum number of containers the action is applied to at the same time."""
+
+    timeout: Optional[int] = None
+    """Timeout in seconds to apply the action to a container."""
+
+    time_to_full: Optional[int] = None
+    """Projected time in seconds until the queue reaches the maximum length
+    below which the action is taken. Only the length is checked if None."""
+
+    growth_window: Optional[int] = None
+    """Time window in seconds to compute the queue fill rate over."""
+
+    min_polling_interval: Optional[int] = None
+    """Interval in seconds the checks tighten to as the queue length approaches
+    the maximum. The polling interval is fixed if None."""
+
+    trigger_after: int = 1
+    """Number of violated checks in a row to take the action after."""
+
+    recover_after: int = 1
+    """Number of passed checks in a row after which the queue is healthy again
+    and the next violation takes ``trigger_after`` checks to act on."""
+
     def __post_init__(self):
         validate_container_labels(self.container_labels)
+        validate_min_polling_interval(self.min_polling_interval, self.polling_interval)
 
 
 @dataclass
@@ -56,6 +93,139 @@ class FlowConfig:
     container_labels: List[List[str]]
     """List of labels to filter the containers to which the action is applied."""
 
+    concurrency: Optional[int] = None
+    """Maximum number of containers the action is applied to at the same time."""
+
+    timeout: Optional[int] = None
+    """Timeout in seconds to apply the action to a container."""
+
+    min_polling_interval: Optional[int] = None
+    """Interval in seconds the checks tighten to as the idle time approaches
+    the maximum. The polling interval is fixed if None."""
+
+    trigger_after: int = 1
+    """Number of violated checks in a row to take the action after."""
+
+    recover_after: int = 1
+    """Number of passed checks in a row after which the traffic is healthy again
+    and the next violation takes ``trigger_after`` checks to act on."""
+
+    def __post_init__(self):
+        validate_container_labels(self.container_labels)
+        validate_min_polling_interval(self.min_polling_interval, self.polling_interval)
+
+
+@dataclass
+class ThroughputConfig:
+    """Configuration to watch a buffer message throughput."""
+
+    action: Action
+    """Action to take when buffer throughput is low."""
+
+    cooldown: int
+    """Interval in seconds to wait after applying the action."""
+
+    polling_interval: int
+    """Interval in seconds between buffer throughput checks."""
+
+    window: int
+    """Time window in seconds to compute the throughput over."""
+
+    container_labels: List[List[str]]
+    """List of labels to filter the containers to which the action is applied."""
+
+    min_rate: Optional[float] = None
+    """Minimum egress throughput in messages per second."""
+
+    min_ratio: Optional[float] = None
+    """Minimum ratio of egress to ingress throughput."""
+
+    egress_metric: str = 'sent_messages_total'
+    """Counter of the messages sent by the buffer."""
+
+    ingress_metric: str = 'received_messages_total'
+    """Counter of the messages received by the buffer."""
+
+    concurrency: Optional[int] = None
+    """Maximum number of containers the action is applied to at the same time."""
+
+    timeout: Optional[int] = None
+    """Timeout in seconds to apply the action to a container."""
+
+    def __post_init__(self):
+        validate_container_labels(self.container_labels)
+        if self.min_rate is None and self.min_ratio is None:
+            raise ValueError('Throughput config must include min_rate or min_ratio.')
+        if self.min_rate is not None and self.min_rate <= 0:
+            raise ValueError(f'Min rate "{self.min_rate}" must be positive.')
+        if self.min_ratio is not None and not 0 < self.min_ratio <= 1:
+            raise ValueError(f'Min ratio "{self.min_ratio}" must be in (0, 1].')
+
+
+@dataclass
+class RuleConfig:
+    """Configuration to watch a buffer by a rule over its metrics."""
+
+    name: str
+    """Name of the rule, unique within the watch config."""
+
+    rule: Rule
+    """Compiled rule expression, the rule is violated when it is true."""
+
+    action: Action
+    """Action to take when the rule is violated."""
+
+    cooldown: int
+    """Interval in seconds to wait after applying the action."""
+
+    polling_interval: int
+    """Interval in seconds between rule checks."""
+
+    window: int
+    """Time window in seconds to compute the rates and slopes of the rule over."""
+
+    container_labels: List[List[str]]
+    """List of labels to filter the containers to which the action is applied."""
+
+    concurrency: Optional[int] = None
+    """Maximum number of containers the action is applied to at the same time."""
+
+    timeout: Optional[int] = None
+    """Timeout in seconds to apply the action to a container."""
+
+    trigger_after: int = 1
+    """Number of violated checks in a row to take the action after."""
+
+    recover_after: int = 1
+    """Number of passed checks in a row after which the rule is healthy again
+    and the next violation takes ``trigger_after`` checks to act on."""
+
+    def __post_init__(self):
+        validate_container_labels(self.container_labels)
+
+
+@dataclass
+class UnreachableConfig:
+    """Configuration to act when buffer metrics cannot be retrieved."""
+
+    action: Action
+    """Action to take when buffer is unreachable."""
+
+    duration: int
+    """Time in seconds the buffer can be unreachable."""
+
+    cooldown: int
+    """Interval in seconds to wait after applying the action."""
+
+    container_labels: List[List[str]]
+    """List of labels to filter the containers to which the action is applied."""
+
+    concurrency: Optional[int] = None
+    """Maximum number of containers the action is applied to at the same time."""
+
+    timeout: Optional[int] = None
+    """Timeout in seconds to apply the action to a container."""
+
     def __post_init__(self):
         validate_container_labels(self.container_labels)
 
@@ -76,6 +246,18 @@ class WatchConfig:
     ingress: Optional[FlowConfig]
     """Ingress traffic watch configuration."""
 
+    metric_labels: Dict[str, str] = field(default_factory=dict)
+    """Labels to select the buffer series when the endpoint exposes several."""
+
+    unreachable: Optional[UnreachableConfig] = None
+    """Unreachable buffer action configuration."""
+
+    throughput: Optional[ThroughputConfig] = None
+    """Throughput watch configuration."""
+
+    rules: List[RuleConfig] = field(default_factory=list)
+    """Rule watch configurations."""
+
 
 @dataclass
 class Config:
@@ -1,9 +1,36 @@
-from omegaconf import DictConfig, ListConfig, OmegaConf
-from omegaconf.errors import ConfigKeyError
+import io
+
+import yaml
 
 from src.pipeline_watchdog.config.config import *
 from src.pipeline_watchdog.utils import convert_to_seconds
 
+# Default number of polling intervals to compute the queue fill rate
+# and the throughput over
+GROWTH_WINDOW_POLLS = 5
+
+# libyaml loader is an order of magnitude faster if available
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class MissingFieldError(KeyError):
+    pass
+
+
+class Section(dict):
+    """Config section that raises MissingFieldError on a missing field."""
+
+    def __missing__(self, key):
+        raise MissingFieldError(key)
+
+
+def to_sections(value):
+    if isinstance(value, dict):
+        return Section((k, to_sections(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [to_sections(x) for x in value]
+    return value
+
 
 class ConfigParser:
 
@@ -13,7 +40,7 @@ class ConfigParser:
     @staticmethod
     def __parse_labels(labels_list: list) -> list:
         container_labels = []
-        for label_dict in OmegaConf.to_object(labels_list):
+        for label_dict in labels_list:
             labels = label_dict.get('labels')
             if labels is not None:
                 if isinstance(labels, list):
@@ -22,17 +49,90 @@ class ConfigParser:
                     container_labels.append([labels])
         return container_labels
 
+    @staticmethod
+    def __parse_concurrency(value) -> Optional[int]:
+        if value is None:
+            return None
+
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f'Concurrency "{value}" must be a positive integer.')
+        return value
+
+    @staticmethod
+    def __parse_checks(name: str, value) -> int:
+        if value is None:
+            return 1
+
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f'{name} "{value}" must be a positive integer.')
+        return value
+
+    @staticmethod
+    def __parse_positive_seconds(name: str, value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+
+        seconds = convert_to_seconds(value)
+        if seconds < 1:
+            raise ValueError(f'{name} "{value}" must be positive.')
+        return seconds
+
+    @staticmethod
+    def __parse_metric_labels(labels) -> Dict[str, str]:
+        if labels is None:
+            return {}
+
+        if not isinstance(labels, list):
+            labels = [labels]
+
+        metric_labels = {}
+        for label in labels:
+            name, sep, value = str(label).partition('=')
+            if not sep or not name:
+                raise ValueError(
+                    f'Metric label "{label}" must be in the format name=value.'
+                )
+            metric_labels[name] = value
+        return metric_labels
+
     @staticmethod
     def __parse_queue_config(queue_config: dict):
         if queue_config is None:
             return None
 
+        polling_interval = convert_to_seconds(queue_config['polling_interval'])
+        time_to_full = ConfigParser.__parse_positive_seconds(
+            'Time to full', queue_config.get('time_to_full')
+        )
+        growth_window = ConfigParser.__parse_positive_seconds(
+            'Growth window', queue_config.get('growth_window')
+        )
+        if time_to_full is not None and growth_window is None:
+            growth_window = polling_interval * GROWTH_WINDOW_POLLS
+
         return QueueConfig(
             action=Action(queue_config['action']),
             length=queue_config['length'],
             cooldown=convert_to_seconds(queue_config['cooldown']),
-            polling_interval=convert_to_seconds(queue_config['polling_interval']),
+            polling_interval=polling_interval,
             container_labels=ConfigParser.__parse_labels(queue_config['container']),
+            concurrency=ConfigParser.__parse_concurrency(
+                queue_config.get('concurrency')
+            ),
+            timeout=ConfigParser.__parse_positive_seconds(
+                'Timeout', queue_config.get('timeout')
+            ),
+            time_to_full=time_to_full,
+            growth_window=growth_window,
+            min_polling_interval=ConfigParser.__parse_positive_seconds(
+                'Min polling interval', queue_config.get('min_polling_interval')
+            ),
+            trigger_after=ConfigParser.__parse_checks(
+                'Trigger after', queue_config.get('trigger_after')
+            ),
+            recover_after=ConfigParser.__parse_checks(
+                'Recover after', queue_config.get('recover_after')
+            ),
         )
 
     @staticmethod
@@ -51,6 +151,119 @@ class ConfigParser:
                 convert_to_seconds(polling_interval) if polling_interval else idle
             ),
             container_labels=ConfigParser.__parse_labels(flow_config['container']),
+            concurrency=ConfigParser.__parse_concurrency(
+                flow_config.get('concurrency')
+            ),
+            timeout=ConfigParser.__parse_positive_seconds(
+                'Timeout', flow_config.get('timeout')
+            ),
+            min_polling_interval=ConfigParser.__parse_positive_seconds(
+                'Min polling interval', flow_config.get('min_polling_interval')
+            ),
+            trigger_after=ConfigParser.__parse_checks(
+                'Trigger after', flow_config.get('trigger_after')
+            ),
+            recover_after=ConfigParser.__parse_checks(
+                'Recover after', flow_config.get('recover_after')
+            ),
+        )
+
+    @staticmethod
+    def __parse_throughput_config(throughput_config: dict):
+        if throughput_config is None:
+            return None
+
+        polling_interval = convert_to_seconds(throughput_config['polling_interval'])
+        window = ConfigParser.__parse_positive_seconds(
+            'Window', throughput_config.get('window')
+        )
+        min_rate = throughput_config.get('min_rate')
+        min_ratio = throughput_config.get('min_ratio')
+
+        return ThroughputConfig(
+            action=Action(throughput_config['action']),
+            cooldown=convert_to_seconds(throughput_config['cooldown']),
+            polling_interval=polling_interval,
+            window=window or polling_interval * GROWTH_WINDOW_POLLS,
+            container_labels=ConfigParser.__parse_labels(
+                throughput_config['container']
+            ),
+            min_rate=float(min_rate) if min_rate is not None else None,
+            min_ratio=float(min_ratio) if min_ratio is not None else None,
+            egress_metric=throughput_config.get(
+                'egress_metric', ThroughputConfig.egress_metric
+            ),
+            ingress_metric=throughput_config.get(
+                'ingress_metric', ThroughputConfig.ingress_metric
+            ),
+            concurrency=ConfigParser.__parse_concurrency(
+                throughput_config.get('concurrency')
+            ),
+            timeout=ConfigParser.__parse_positive_seconds(
+                'Timeout', throughput_config.get('timeout')
+            ),
+        )
+
+    @staticmethod
+    def __parse_rule_config(rule_config: dict):
+        polling_interval = convert_to_seconds(rule_config['polling_interval'])
+        window = ConfigParser.__parse_positive_seconds(
+            'Window', rule_config.get('window')
+        )
+
+        return RuleConfig(
+            name=str(rule_config['name']),
+            rule=Rule(str(rule_config['expr'])),
+            action=Action(rule_config['action']),
+            cooldown=convert_to_seconds(rule_config['cooldown']),
+            polling_interval=polling_interval,
+            window=window or polling_interval * GROWTH_WINDOW_POLLS,
+            container_labels=ConfigParser.__parse_labels(rule_config['container']),
+            concurrency=ConfigParser.__parse_concurrency(
+                rule_config.get('concurrency')
+            ),
+            timeout=ConfigParser.__parse_positive_seconds(
+                'Timeout', rule_config.get('timeout')
+            ),
+            trigger_after=ConfigParser.__parse_checks(
+                'Trigger after', rule_config.get('trigger_after')
+            ),
+            recover_after=ConfigParser.__parse_checks(
+                'Recover after', rule_config.get('recover_after')
+            ),
+        )
+
+    @staticmethod
+    def __parse_rule_configs(rule_configs: Optional[list]) -> List[RuleConfig]:
+        if rule_configs is None:
+            return []
+
+        rules = [ConfigParser.__parse_rule_config(x) for x in rule_configs]
+        names = set()
+        for rule in rules:
+            if rule.name in names:
+                raise ValueError(f'Rule name "{rule.name}" is duplicated.')
+            names.add(rule.name)
+        return rules
+
+    @staticmethod
+    def __parse_unreachable_config(unreachable_config: dict):
+        if unreachable_config is None:
+            return None
+
+        return UnreachableConfig(
+            action=Action(unreachable_config['action']),
+            duration=convert_to_seconds(unreachable_config['duration']),
+            cooldown=convert_to_seconds(unreachable_config['cooldown']),
+            container_labels=ConfigParser.__parse_labels(
+                unreachable_config['container']
+            ),
+            concurrency=ConfigParser.__parse_concurrency(
+                unreachable_config.get('concurrency')
+            ),
+            timeout=ConfigParser.__parse_positive_seconds(
+                'Timeout', unreachable_config.get('timeout')
+            ),
         )
 
     @staticmethod
@@ -60,27 +273,49 @@ class ConfigParser:
             queue=ConfigParser.__parse_queue_config(watch_config.get('queue')),
             egress=ConfigParser.__parse_flow_config(watch_config.get('egress')),
             ingress=ConfigParser.__parse_flow_config(watch_config.get('ingress')),
+            metric_labels=ConfigParser.__parse_metric_labels(
+                watch_config.get('metric_labels')
+            ),
+            unreachable=ConfigParser.__parse_unreachable_config(
+                watch_config.get('unreachable')
+            ),
+            throughput=ConfigParser.__parse_throughput_config(
+                watch_config.get('throughput')
+            ),
+            rules=ConfigParser.__parse_rule_configs(watch_config.get('rules')),
+        )
+
+    @staticmethod
+    def __load(content: str):
+        if '${' not in content:
+            # OmegaConf nodes are slow to build and access on large files,
+            # the file without interpolations is loaded as plain YAML
+            return yaml.load(content, Loader=YAML_LOADER)
+
+        # imported on demand, as most restarts load the file from cache
+        from omegaconf import OmegaConf
+
+        # the interpolations are resolved once
+        return OmegaConf.to_container(
+            OmegaConf.load(io.StringIO(content)), resolve=True
         )
 
     def parse(self) -> Config:
         with open(self._config_path, 'r') as file:
-            parsed_yaml = OmegaConf.load(file)
-            watch = (
-                parsed_yaml.get('watch')
-                if isinstance(parsed_yaml, DictConfig)
-                else None
-            )
+            parsed_yaml = to_sections(self.__load(file.read()))
 
-            if not watch:
-                raise ValueError(
-                    'No watch configs found in the config file. Please specify at least one.'
-                )
+        watch = parsed_yaml.get('watch') if isinstance(parsed_yaml, dict) else None
 
-            try:
-                config = Config([self.__parse_watch_config(w) for w in watch])
-            except ConfigKeyError as e:
-                raise ValueError(
-                    f'Field "{e.key}" must be specified in the watch config.'
-                )
+        if not watch:
+            raise ValueError(
+                'No watch configs found in the config file. Please specify at least one.'
+            )
+
+        try:
+            config = Config([self.__parse_watch_config(w) for w in watch])
+        except MissingFieldError as e:
+            raise ValueError(
+                f'Field "{e.args[0]}" must be specified in the watch config.'
+            )
 
         return config
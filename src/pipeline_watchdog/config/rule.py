@@ -0,0 +1,165 @@
+# This file contains the compiler of the watch rule expressions
+import ast
+from typing import Callable, Dict, Tuple
+
+# Functions of the metrics that can be called in the rule expressions
+FUNCTIONS = ('rate', 'slope', 'age')
+
+BOOL_OPS = (ast.And, ast.Or)
+UNARY_OPS = (ast.Not, ast.USub, ast.UAdd)
+BINARY_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+COMPARE_OPS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+# Name of the metrics argument of the compiled function
+METRICS_ARG = '_metrics'
+
+
+class _Compiler(ast.NodeTransformer):
+    """Checks that the expression uses only the allowed syntax and rewrites
+    the metric names to lookups in the metrics and the function arguments
+    to the metric names."""
+
+    def __init__(self, expr: str):
+        self._expr = expr
+        self.metric_names: Dict[str, None] = {}
+        self.functions: Dict[str, None] = {}
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f'Rule "{self._expr}" is invalid: {message}.')
+
+    def generic_visit(self, node):
+        if isinstance(node, BOOL_OPS + UNARY_OPS + BINARY_OPS + COMPARE_OPS):
+            return node
+        if isinstance(node, ast.Expression):
+            return super().generic_visit(node)
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, BOOL_OPS):
+            return super().generic_visit(node)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, UNARY_OPS):
+            return super().generic_visit(node)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, BINARY_OPS):
+            return super().generic_visit(node)
+        if isinstance(node, ast.Compare) and all(
+            isinstance(x, COMPARE_OPS) for x in node.ops
+        ):
+            return super().generic_visit(node)
+        raise self._error(f'{type(node).__name__} is not supported')
+
+    def visit_Constant(self, node: ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise self._error(f'constant {node.value!r} is not a number')
+        return node
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in FUNCTIONS:
+            raise self._error(f'function {node.id} must be called')
+        self.metric_names[node.id] = None
+        return ast.Subscript(
+            value=ast.Name(id=METRICS_ARG, ctx=ast.Load()),
+            slice=ast.Constant(value=node.id),
+            ctx=ast.Load(),
+        )
+
+    def visit_Call(self, node: ast.Call):
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name not in FUNCTIONS:
+            raise self._error(
+                f'function {ast.unparse(node.func)} is not one of {", ".join(FUNCTIONS)}'
+            )
+        if (
+            len(node.args) != 1
+            or node.keywords
+            or not isinstance(node.args[0], ast.Name)
+        ):
+            raise self._error(f'function {name} takes a metric name')
+        metric = node.args[0].id
+        self.metric_names[metric] = None
+        self.functions[name] = None
+        return ast.Call(
+            func=ast.Name(id=name, ctx=ast.Load()),
+            args=[ast.Constant(value=metric)],
+            keywords=[],
+        )
+
+
+class Rule:
+    """Boolean expression over the buffer metrics, compiled to a Python
+    function once when the configuration is loaded.
+
+    The expression is a Python expression of numbers, metric names,
+    arithmetic, comparisons, ``and``, ``or``, ``not`` and the calls of
+    ``rate``, ``slope`` and ``age`` of a metric. A pickled rule keeps only
+    the expression and is compiled again when unpickled.
+    """
+
+    def __init__(self, expr: str):
+        """
+        :param expr: Rule expression, e.g. ``buffer_size > 800 and
+            rate(pushed_messages_total) < 5``.
+        :raise ValueError: The expression is invalid.
+        """
+
+        self.expr = expr
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f'Rule "{expr}" is invalid: {e.msg}.')
+
+        compiler = _Compiler(expr)
+        body = compiler.visit(tree).body
+        self.metric_names: Tuple[str, ...] = tuple(compiler.metric_names)
+        """Names of the metrics the rule reads, directly or by the functions."""
+
+        self.functions: Tuple[str, ...] = tuple(compiler.functions)
+        """Names of the functions the rule calls."""
+
+        function = ast.Expression(
+            ast.Lambda(
+                args=ast.arguments(
+                    posonlyargs=[],
+                    args=[ast.arg(arg=x) for x in (METRICS_ARG,) + FUNCTIONS],
+                    kwonlyargs=[],
+                    kw_defaults=[],
+                    defaults=[],
+                ),
+                body=body,
+            )
+        )
+        self._function: Callable[..., object] = eval(
+            compile(ast.fix_missing_locations(function), '<rule>', 'eval'),
+            {'__builtins__': {}},
+        )
+
+    def evaluate(
+        self,
+        metrics: Dict[str, float],
+        rate: Callable[[str], float],
+        slope: Callable[[str], float],
+        age: Callable[[str], float],
+    ) -> bool:
+        """Evaluates the rule against the metrics of a sample.
+
+        :param metrics: Metric values by name.
+        :param rate: Function that returns the rate of a counter per second.
+        :param slope: Function that returns the rate of change of a gauge
+            per second.
+        :param age: Function that returns the time in seconds since the time
+            a metric holds.
+        :raise KeyError: A metric of the rule is missing in the sample.
+        """
+
+        return bool(self._function(metrics, rate, slope, age))
+
+    def __getstate__(self):
+        return {'expr': self.expr}
+
+    def __setstate__(self, state):
+        self.__init__(state['expr'])
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and self.expr == other.expr
+
+    def __hash__(self):
+        return hash(self.expr)
+
+    def __repr__(self):
+        return f'Rule({self.expr!r})'
@@ -3,8 +3,15 @@ from src.pipeline_watchdog.config.config import Config
 
 def validate(config: Config):
     if any(
-        [not w.queue and not w.ingress and not w.egress for w in config.watch_configs]
+        [
+            not w.queue
+            and not w.ingress
+            and not w.egress
+            and not w.throughput
+            and not w.rules
+            for w in config.watch_configs
+        ]
     ):
         raise ValueError(
-            'Watch config must include at least one of the following: queue, ingress, or egress.'
+            'Watch config must include at least one of the following: queue, ingress, egress, throughput, or rules.'
         )
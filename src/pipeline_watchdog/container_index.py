@@ -0,0 +1,56 @@
+from typing import Dict, List, Set
+
+
+class ContainerIndex:
+    """In-memory index of containers by label.
+
+    Containers are indexed both by label name and by ``name=value`` pair,
+    so a label filter in the Docker format resolves with set lookups.
+    """
+
+    def __init__(self):
+        self._labels: Dict[str, Dict[str, str]] = {}
+        self._ids: Dict[str, Set[str]] = {}
+
+    def __len__(self):
+        return len(self._labels)
+
+    @staticmethod
+    def _keys(labels: Dict[str, str]) -> List[str]:
+        return [k for name, value in labels.items() for k in (name, f'{name}={value}')]
+
+    def add(self, container_id: str, labels: Dict[str, str]):
+        """Adds the container to the index or updates its labels."""
+
+        self.remove(container_id)
+        self._labels[container_id] = labels
+        for key in self._keys(labels):
+            self._ids.setdefault(key, set()).add(container_id)
+
+    def remove(self, container_id: str):
+        labels = self._labels.pop(container_id, None)
+        if labels is None:
+            return
+
+        for key in self._keys(labels):
+            ids = self._ids[key]
+            ids.discard(container_id)
+            if not ids:
+                del self._ids[key]
+
+    def clear(self):
+        self._labels.clear()
+        self._ids.clear()
+
+    def find(self, labels: List[str]) -> List[str]:
+        """Returns ids of the containers that have all the labels.
+
+        :param labels: Labels in the Docker filter format, i.e. ``name``
+            or ``name=value``.
+        """
+
+        if not labels:
+            return list(self._labels)
+
+        matches = sorted((self._ids.get(x, set()) for x in labels), key=len)
+        return sorted(matches[0].intersection(*matches[1:]))
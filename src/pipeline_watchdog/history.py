@@ -0,0 +1,151 @@
+import math
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+class MetricHistory:
+    """Fixed-size ring buffer of the recent metric samples of a buffer.
+
+    Timestamps and values of each metric are stored in preallocated arrays,
+    so appending is O(1) and the memory does not grow with uptime. When the
+    buffer is full, the oldest sample is overwritten. A metric missing from
+    a sample is stored as NaN and skipped by the queries.
+    """
+
+    def __init__(self, names: Sequence[str], capacity: int):
+        """
+        :param names: Names of the metrics to keep.
+        :param capacity: Maximum number of samples to keep.
+        """
+
+        if capacity < 1:
+            raise ValueError('History capacity must be positive.')
+
+        self._columns = {name: i for i, name in enumerate(names)}
+        self._capacity = capacity
+        self._timestamps = array('d', [0.0]) * capacity
+        self._values = [array('d', [math.nan]) * capacity for _ in names]
+        # position of the next sample
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._columns)
+
+    def extend(self, names: Sequence[str]):
+        """Starts keeping the metrics not kept yet, the samples appended
+        before miss their values."""
+
+        for name in names:
+            if name not in self._columns:
+                self._columns[name] = len(self._values)
+                self._values.append(array('d', [math.nan]) * self._capacity)
+
+    def append(self, timestamp: float, metrics: Dict[str, float]):
+        """Appends a sample, overwriting the oldest one when full.
+
+        :param timestamp: Monotonic time of the sample.
+        :param metrics: Metric values of the sample, other metrics are ignored.
+        """
+
+        i = self._next
+        self._timestamps[i] = timestamp
+        for name, column in self._columns.items():
+            self._values[column][i] = metrics.get(name, math.nan)
+        self._next = (i + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+
+    def _positions(self, since: float) -> Iterator[int]:
+        """Yields positions of the samples not older than ``since``,
+        from the oldest to the newest."""
+
+        start = self._next - self._size
+        for i in range(start, self._next):
+            i %= self._capacity
+            if self._timestamps[i] >= since:
+                yield i
+
+    def window(
+        self, name: str, since: float = -math.inf
+    ) -> Tuple[List[float], List[float]]:
+        """Returns timestamps and values of the metric samples not older
+        than ``since``, from the oldest to the newest.
+
+        :raises KeyError: The metric is not kept in the history.
+        """
+
+        values = self._values[self._columns[name]]
+        timestamps = []
+        window = []
+        for i in self._positions(since):
+            value = values[i]
+            if not math.isnan(value):
+                timestamps.append(self._timestamps[i])
+                window.append(value)
+        return timestamps, window
+
+    def last(self, name: str) -> Optional[Tuple[float, float]]:
+        """Returns the timestamp and value of the latest sample of the metric."""
+
+        values = self._values[self._columns[name]]
+        for k in range(1, self._size + 1):
+            i = (self._next - k) % self._capacity
+            if not math.isnan(values[i]):
+                return self._timestamps[i], values[i]
+        return None
+
+    def slope(
+        self, name: str, since: float = -math.inf, min_samples: int = 2
+    ) -> Optional[float]:
+        """Returns the rate of change of the metric per second, i.e. the slope
+        of the least squares line through the samples not older than ``since``.
+
+        :param min_samples: Minimum number of samples to fit the line.
+        :return: None if there are fewer samples or they have the same time.
+        """
+
+        timestamps, values = self.window(name, since)
+        if len(values) < max(min_samples, 2):
+            return None
+
+        mean_t = sum(timestamps) / len(timestamps)
+        mean_v = sum(values) / len(values)
+        covariance = sum(
+            (t - mean_t) * (v - mean_v) for t, v in zip(timestamps, values)
+        )
+        variance = sum((t - mean_t) ** 2 for t in timestamps)
+        if not variance:
+            return None
+        return covariance / variance
+
+    def rate(
+        self, name: str, since: float = -math.inf, min_samples: int = 2
+    ) -> Optional[float]:
+        """Returns the average increase per second of a counter over the samples
+        not older than ``since``. A decrease of the counter is taken as a reset
+        to zero, so the value after the reset is the increase.
+
+        :param min_samples: Minimum number of samples to compute the rate.
+        :return: None if there are fewer samples or they have the same time.
+        """
+
+        timestamps, values = self.window(name, since)
+        if len(values) < max(min_samples, 2):
+            return None
+
+        elapsed = timestamps[-1] - timestamps[0]
+        if elapsed <= 0:
+            return None
+
+        increase = 0.0
+        for previous, value in zip(values, values[1:]):
+            increase += value - previous if value >= previous else value
+        return increase / elapsed
@@ -0,0 +1,140 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger('PipelineWatchdog')
+
+
+class LeaderLease:
+    """Leadership of the watchdog instances sharing a lease file.
+
+    The leader holds an exclusive ``flock`` on the lease file until it exits,
+    the lock is released by the OS if the process dies, and a standby takes
+    it over on its next attempt. Only the leader applies actions.
+
+    The leader records in a journal next to the lease file until when each
+    action it applied is in cooldown. A new leader skips the actions still
+    in cooldown by the journal, so that a failover does not apply an action
+    the previous leader has just applied.
+    """
+
+    def __init__(self, path: str, retry_interval: float = 1):
+        """
+        :param path: Lease file on a volume shared by the instances.
+        :param retry_interval: Interval in seconds for a standby to retry
+            taking over the lease.
+        """
+
+        self._path = path
+        self._journal_path = f'{path}.actions'
+        self._retry_interval = retry_interval
+        self._fd: Optional[int] = None
+        # cooldowns recorded by the previous leaders, wall time per action key
+        self._inherited: Dict[str, float] = {}
+        self._journal: Dict[str, float] = {}
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Takes the lease if no other instance holds it.
+
+        :return: Whether the instance is the leader.
+        """
+
+        if self._fd is not None:
+            return True
+
+        fd = os.open(self._path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        self._fd = fd
+        now = time.time()
+        self._inherited = {k: v for k, v in self._read_journal().items() if v > now}
+        self._journal = dict(self._inherited)
+        return True
+
+    async def acquire(self):
+        """Waits until the instance becomes the leader."""
+
+        if not self.try_acquire():
+            logger.info('Standing by, the leader lease %s is held', self._path)
+            while not self.try_acquire():
+                await asyncio.sleep(self._retry_interval)
+        logger.info(
+            'Acquired the leader lease %s, %s actions in cooldown',
+            self._path,
+            len(self._inherited),
+        )
+
+    def release(self):
+        if self._fd is not None:
+            # closing the file releases the lock
+            os.close(self._fd)
+            self._fd = None
+
+    def claim_action(self, key: str, cooldown: float) -> bool:
+        """Checks that the instance may apply the action and records its
+        cooldown in the journal.
+
+        :param key: Identity of the action, the same across the instances.
+        :param cooldown: Cooldown in seconds after the action.
+        :return: False on a standby or when a previous leader applied
+            the action within its cooldown.
+        """
+
+        if self._fd is None:
+            logger.debug('Standing by, skipping action %s', key)
+            return False
+
+        now = time.time()
+        if self._inherited.pop(key, 0) > now:
+            logger.info('Action %s was applied by the previous leader, skipping', key)
+            return False
+
+        self._journal = {k: v for k, v in self._journal.items() if v > now}
+        self._journal[key] = now + cooldown
+        self._write_journal()
+        return True
+
+    def _read_journal(self) -> Dict[str, float]:
+        try:
+            with open(self._journal_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(
+                'Failed to read the action journal. %s: %s', type(e).__name__, e
+            )
+            return {}
+
+    def _write_journal(self):
+        directory = os.path.dirname(self._journal_path) or '.'
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except OSError as e:
+            logger.warning(
+                'Failed to write the action journal. %s: %s', type(e).__name__, e
+            )
+            return
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(self._journal, file)
+            # readers never see a partially written journal
+            os.replace(tmp_path, self._journal_path)
+        except OSError as e:
+            os.unlink(tmp_path)
+            logger.warning(
+                'Failed to write the action journal. %s: %s', type(e).__name__, e
+            )
@@ -1,170 +1,1651 @@
 #!/usr/bin/env python3
 
 import asyncio
+import functools
 import logging
+import math
+import multiprocessing
+import multiprocessing.connection
 import os
+import shutil
 import signal
+import tempfile
 import time
-from typing import List
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import aiodocker
-from aiodocker import DockerError
-from aiodocker.containers import DockerContainer
-
-from src.pipeline_watchdog.buffer_metrics import get_metrics, parse_metrics
-from src.pipeline_watchdog.config import Action, FlowConfig, QueueConfig, WatchConfig
+from src.pipeline_watchdog.action_budget import ActionBudget
+from src.pipeline_watchdog.action_coalescer import ActionCoalescer
+from src.pipeline_watchdog.buffer_metrics import Labels, MetricsClient, to_labels
+from src.pipeline_watchdog.circuit_breaker import CircuitBreaker
+from src.pipeline_watchdog.config import (
+    Action,
+    FlowConfig,
+    QueueConfig,
+    RuleConfig,
+    ThroughputConfig,
+    UnreachableConfig,
+    WatchConfig,
+)
+from src.pipeline_watchdog.config.cache import ConfigCache
 from src.pipeline_watchdog.config.parser import ConfigParser
 from src.pipeline_watchdog.config.validator import validate
-from src.pipeline_watchdog.utils import init_logging
+from src.pipeline_watchdog.container_index import ContainerIndex
+from src.pipeline_watchdog.history import MetricHistory
+from src.pipeline_watchdog.lease import LeaderLease
+from src.pipeline_watchdog.scheduler import Scheduler, get_phase
+from src.pipeline_watchdog.series_clock import SeriesClock
+from src.pipeline_watchdog.sharding import ActionLane, assign_shards, get_shard
+from src.pipeline_watchdog.telemetry import (
+    ACTION_DURATION,
+    ACTIONS,
+    ACTIONS_SUPPRESSED,
+    BUFFER_IDLE,
+    BUFFER_SIZE,
+    CHECK_DELAY,
+    CHECKS_SKIPPED,
+    DOCKER_REQUEST_DURATION,
+    EVENT_LOOP_LAG,
+    LEADER,
+    start_metrics_server,
+)
+from src.pipeline_watchdog.utils import init_logging, lazy_import
+
+if TYPE_CHECKING:
+    from aiodocker.containers import DockerContainer
+
+# the shard supervisor does not talk to Docker
+aiodocker = lazy_import('aiodocker')
 
 LOG_LEVEL = os.environ.get('LOGLEVEL', 'INFO')
+METRICS_CONNECT_TIMEOUT = float(os.environ.get('METRICS_CONNECT_TIMEOUT', 5))
+METRICS_READ_TIMEOUT = float(os.environ.get('METRICS_READ_TIMEOUT', 10))
+METRICS_SCRAPE_TIMEOUT = float(os.environ.get('METRICS_SCRAPE_TIMEOUT', 15))
+METRICS_CONNECTION_LIMIT_PER_HOST = int(
+    os.environ.get('METRICS_CONNECTION_LIMIT_PER_HOST', 2)
+)
+SCRAPE_FAILURE_THRESHOLD = int(os.environ.get('SCRAPE_FAILURE_THRESHOLD', 3))
+SCRAPE_BACKOFF_MAX = float(os.environ.get('SCRAPE_BACKOFF_MAX', 300))
+ACTION_CONCURRENCY = int(os.environ.get('ACTION_CONCURRENCY', 10))
+ACTION_TIMEOUT = float(os.environ.get('ACTION_TIMEOUT', 60))
+ACTION_COALESCE_WINDOW = float(os.environ.get('ACTION_COALESCE_WINDOW', 1))
+ACTION_BUDGET = int(os.environ.get('ACTION_BUDGET', 0))
+ACTION_BUDGET_PER_LABELS = int(os.environ.get('ACTION_BUDGET_PER_LABELS', 0))
+ACTION_BUDGET_WINDOW = float(os.environ.get('ACTION_BUDGET_WINDOW', 60))
+HISTORY_SIZE = int(os.environ.get('HISTORY_SIZE', 360))
+FOLLOW_BUFFER_CLOCK = os.environ.get('FOLLOW_BUFFER_CLOCK', '').lower() in (
+    '1',
+    'true',
+    'yes',
+)
+WATCHDOG_SHARDS = int(os.environ.get('WATCHDOG_SHARDS', 1))
+CONFIG_RELOAD_INTERVAL = float(os.environ.get('CONFIG_RELOAD_INTERVAL', 0))
+CONFIG_CACHE_DIR = os.environ.get('CONFIG_CACHE_DIR')
+WATCHDOG_LEASE_PATH = os.environ.get('WATCHDOG_LEASE_PATH')
+WATCHDOG_LEASE_RETRY_INTERVAL = float(
+    os.environ.get('WATCHDOG_LEASE_RETRY_INTERVAL', 1)
+)
+WATCHDOG_METRICS_HOST = os.environ.get('WATCHDOG_METRICS_HOST', '0.0.0.0')
+WATCHDOG_METRICS_PORT = int(os.environ.get('WATCHDOG_METRICS_PORT', 0))
 
 BUFFER_SIZE_METRIC = 'buffer_size'
 LAST_SENT_MESSAGE_METRIC = 'last_sent_message'
 LAST_RECEIVED_MESSAGE_METRIC = 'last_received_message'
+# Metrics kept in the history of the buffer series besides the watched ones
+HISTORY_METRICS = (
+    BUFFER_SIZE_METRIC,
+    LAST_SENT_MESSAGE_METRIC,
+    LAST_RECEIVED_MESSAGE_METRIC,
+)
+# Minimum number of samples to compute the queue fill rate and the throughput
+GROWTH_MIN_SAMPLES = 3
+# Number of the recent samples logged when an action is fired
+HISTORY_LOG_SAMPLES = 10
 
+# Conditions due within this window (in seconds) are checked on the same scrape
+SCRAPE_COALESCE_WINDOW = 1
+# Checks due within this time in seconds are woken up by the same timer
+SCHEDULER_RESOLUTION = 0.01
+# Time in seconds after the expected refresh of the buffer metrics to scrape them
+REFRESH_MARGIN = 0.1
+
+# Container events that may change the labels of indexed containers
+CONTAINER_INDEX_EVENTS = ['create', 'destroy', 'rename', 'update']
+CONTAINER_EVENTS_RETRY_INTERVAL = 5
+# File of the action budget shared by the shards in the lane directory
+BUDGET_FILE = 'budget.json'
+# Interval in seconds to restart a dead shard worker
+SHARD_RESTART_INTERVAL = 5
+# Time in seconds to wait for the shard workers to shut down
+SHARD_SHUTDOWN_TIMEOUT = 10
+# Interval in seconds to measure the event loop lag
+EVENT_LOOP_LAG_INTERVAL = 1
 
-init_logging(LOG_LEVEL)
 logger = logging.getLogger('PipelineWatchdog')
 
 
+def merge_label_sets(container_labels: List[List[str]]) -> List[List[str]]:
+    """Drops label sets whose containers are already matched by another set.
+
+    Labels of a set are combined with AND, so a set that includes all labels
+    of another set, e.g. ``[a=1, b]`` and ``[a]``, matches a subset of its
+    containers and does not need a separate query.
+    """
+
+    def implies(labels: List[str], label: str) -> bool:
+        return label in labels or (
+            '=' not in label and any(x.startswith(f'{label}=') for x in labels)
+        )
+
+    merged = []
+    for i, labels in enumerate(container_labels):
+        redundant = any(
+            all(implies(labels, x) for x in other)
+            and (not all(implies(other, x) for x in labels) or j < i)
+            for j, other in enumerate(container_labels)
+            if j != i
+        )
+        if not redundant:
+            merged.append(labels)
+
+    return merged
+
+
+class ActionStatus(Enum):
+    DONE = 'done'
+    FAILED = 'failed'
+    TIMED_OUT = 'timed out'
+    SUPPRESSED = 'suppressed'
+
+
 class DockerClient:
 
-    def __init__(self):
+    def __init__(
+        self,
+        action_concurrency: int = 10,
+        action_timeout: float = 60,
+        action_lane: Optional[ActionLane] = None,
+        action_budget: Optional[ActionBudget] = None,
+        action_coalesce_window: float = 0,
+    ):
+        """
+        :param action_concurrency: Maximum number of containers actions
+            are applied to at the same time.
+        :param action_timeout: Default timeout in seconds to apply an action
+            to a container.
+        :param action_lane: Lane to serialize actions on a container with
+            other processes.
+        :param action_budget: Rate limit of the actions, unlimited if None.
+        :param action_coalesce_window: Time in seconds to merge the actions
+            requested for the same container.
+        """
+
         self._client = aiodocker.Docker()
+        self._action_semaphore = asyncio.Semaphore(action_concurrency)
+        self._action_timeout = action_timeout
+        self._action_lane = action_lane
+        self._action_budget = action_budget
+        self._action_coalescer = ActionCoalescer(action_coalesce_window)
+        self._index = ContainerIndex()
+        self._index_ready = False
 
     async def get_containers(
         self, container_labels: List[List[str]]
-    ) -> List[DockerContainer]:
-        containers = []
+    ) -> List['DockerContainer']:
+        """Returns unique containers matching any of the label sets."""
+
+        container_labels = merge_label_sets(container_labels)
+
+        if not self._index_ready:
+            return await self._list_containers(container_labels)
+
+        container_ids = {}
+        for labels in container_labels:
+            container_ids.update(dict.fromkeys(self._index.find(labels)))
+
+        return [self._client.containers.container(x) for x in container_ids]
+
+    async def _list_containers(
+        self, container_labels: List[List[str]]
+    ) -> List['DockerContainer']:
+        containers = {}
         for labels in container_labels:
             try:
-                containers += await self._client.containers.list(
-                    all=True, filters={'label': labels}
-                )
-            except DockerError:
+                with DOCKER_REQUEST_DURATION.labels('list').time():
+                    listed = await self._client.containers.list(
+                        all=True, filters={'label': labels}
+                    )
+                for container in listed:
+                    containers.setdefault(container.id, container)
+            except aiodocker.DockerError:
                 raise RuntimeError(f'Failed to list containers with labels {labels}')
 
-        return containers
+        return list(containers.values())
+
+    async def _sync_index(self):
+        with DOCKER_REQUEST_DURATION.labels('list').time():
+            containers = await self._client.containers.list(all=True)
+        self._index.clear()
+        for container in containers:
+            self._index.add(container.id, container['Labels'] or {})
+        self._index_ready = True
+        logger.debug('Indexed %s containers', len(self._index))
+
+    async def _handle_event(self, event: dict):
+        container_id = event['Actor']['ID']
+
+        if event['Action'] == 'destroy':
+            self._index.remove(container_id)
+            return
+
+        try:
+            with DOCKER_REQUEST_DURATION.labels('inspect').time():
+                container = await self._client.containers.get(container_id)
+        except aiodocker.DockerError:
+            # the container is already removed, its destroy event follows
+            return
+        self._index.add(container_id, container['Config']['Labels'] or {})
+
+    async def watch_containers(self):
+        """Keeps the container index current from the Docker events stream.
+
+        Until the index is populated, and after the stream is interrupted,
+        containers are listed from the daemon on every request.
+        """
+
+        while True:
+            try:
+                subscriber = self._client.events.subscribe(
+                    filters={'type': ['container'], 'event': CONTAINER_INDEX_EVENTS}
+                )
+                # the index is populated after subscribing to not miss events
+                await self._sync_index()
+                while True:
+                    event = await subscriber.get()
+                    if event is None:
+                        break
+                    await self._handle_event(event)
+            except Exception as e:
+                logger.error(
+                    'Failed to watch container events. %s: %s', type(e).__name__, e
+                )
+            finally:
+                self._index_ready = False
+                try:
+                    # stopping re-raises the error of the failed events stream.
+                    # It also swallows a cancellation of its own wait, the shield
+                    # delivers the cancellation of the watch to this task instead
+                    await asyncio.shield(self._client.events.stop())
+                except Exception as e:
+                    logger.debug(
+                        'Container events stream stopped. %s: %s', type(e).__name__, e
+                    )
+
+            logger.warning(
+                'Container events stream is interrupted. Resubscribing in %s seconds',
+                CONTAINER_EVENTS_RETRY_INTERVAL,
+            )
+            await asyncio.sleep(CONTAINER_EVENTS_RETRY_INTERVAL)
 
     @staticmethod
-    async def restart_container(container: DockerContainer):
+    async def restart_container(container: 'DockerContainer') -> bool:
         try:
-            await container.restart()
+            with DOCKER_REQUEST_DURATION.labels('restart').time():
+                await container.restart()
             logger.debug('Container %s restarted', container.id)
-        except DockerError:
+            return True
+        except aiodocker.DockerError:
             logger.error('Failed to restart container %s. Skipping', container.id)
+            return False
 
     @staticmethod
-    async def stop_container(container: DockerContainer):
+    async def stop_container(container: 'DockerContainer') -> bool:
         try:
-            await container.stop()
+            with DOCKER_REQUEST_DURATION.labels('stop').time():
+                await container.stop()
             logger.debug('Container %s stopped', container.id)
-        except DockerError:
+            return True
+        except aiodocker.DockerError:
             logger.error('Failed to stop container %s. Skipping', container.id)
+            return False
+
+    async def apply_action(
+        self,
+        action: Action,
+        container: 'DockerContainer',
+        timeout: Optional[float] = None,
+        container_labels: Optional[List[List[str]]] = None,
+    ) -> ActionStatus:
+        """Applies the action to the container. The number of containers
+        the actions are applied to at the same time is limited globally,
+        and the action is suppressed when the action budget is exhausted.
+
+        Actions requested for the same container within the coalesce window
+        are applied once, ``stop`` superseding ``restart``, and an action on
+        a container that is being acted on is skipped. The merged requests
+        share the status of the applied action.
+
+        :param timeout: Timeout in seconds to apply the action. The client
+            default if None.
+        :param container_labels: Label sets the container was matched by,
+            to take the action from their budget.
+        """
+
+        if action == Action.STOP:
+            operation = self.stop_container
+        elif action == Action.RESTART:
+            operation = self.restart_container
+        else:
+            raise RuntimeError(f'Unknown action: {action}')
+
+        async def apply() -> ActionStatus:
+            return await self._apply_action(
+                action, operation, container, timeout, container_labels
+            )
+
+        return await self._action_coalescer.submit(container.id, action, apply)
+
+    async def _apply_action(
+        self,
+        action: Action,
+        operation: Callable[['DockerContainer'], Awaitable[bool]],
+        container: 'DockerContainer',
+        timeout: Optional[float],
+        container_labels: Optional[List[List[str]]],
+    ) -> ActionStatus:
+        if self._action_budget is not None and not self._action_budget.try_take(
+            container_labels or []
+        ):
+            logger.warning(
+                'Action budget is exhausted, suppressed %s of container %s',
+                action.value,
+                container.id,
+            )
+            ACTIONS_SUPPRESSED.labels(action.value).inc()
+            return ActionStatus.SUPPRESSED
+
+        async def apply() -> bool:
+            if self._action_lane is None:
+                return await operation(container)
+            async with self._action_lane.hold(container.id):
+                return await operation(container)
+
+        timeout = timeout if timeout is not None else self._action_timeout
+        async with self._action_semaphore:
+            try:
+                done = await asyncio.wait_for(apply(), timeout)
+            except asyncio.TimeoutError:
+                logger.error(
+                    'Timed out to %s container %s in %s seconds',
+                    action.value,
+                    container.id,
+                    timeout,
+                )
+                return ActionStatus.TIMED_OUT
+
+        return ActionStatus.DONE if done else ActionStatus.FAILED
 
     async def close(self):
+        self._action_coalescer.close()
         await self._client.close()
 
 
 async def process_action(
-    docker_client: DockerClient, action: Action, container_labels: List[List[str]]
-):
+    docker_client: DockerClient,
+    action: Action,
+    container_labels: List[List[str]],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, ActionStatus]:
+    """Applies the action to the matching containers concurrently.
+
+    :param concurrency: Maximum number of containers the action is applied to
+        at the same time, in addition to the global limit of the client.
+    :param timeout: Timeout in seconds to apply the action to a container.
+    :return: Action status per container id.
+    """
+
+    if action not in (Action.STOP, Action.RESTART):
+        raise RuntimeError(f'Unknown action: {action}')
+
     containers = await docker_client.get_containers(container_labels)
 
     if not containers:
         logger.debug('No containers found with labels %s', container_labels)
-        return
+        return {}
 
-    if action == Action.STOP:
-        logger.debug('Stopping containers')
-        for container in containers:
-            await docker_client.stop_container(container)
-    elif action == Action.RESTART:
-        logger.debug('Restarting containers')
-        for container in containers:
-            await docker_client.restart_container(container)
-    else:
-        raise RuntimeError(f'Unknown action: {action}')
+    logger.debug('Applying action %s to %s containers', action.value, len(containers))
+    semaphore = asyncio.Semaphore(concurrency or len(containers))
 
+    async def apply(container: 'DockerContainer') -> ActionStatus:
+        async with semaphore:
+            return await docker_client.apply_action(
+                action, container, timeout, container_labels
+            )
 
-async def watch_queue(docker_client: DockerClient, buffer: str, config: QueueConfig):
-    await asyncio.sleep(config.polling_interval)
+    statuses = await asyncio.gather(
+        *[apply(x) for x in containers], return_exceptions=True
+    )
 
-    while True:
-        content = await get_metrics(buffer)
-        metrics = await parse_metrics(content)
+    results = {}
+    for container, status in zip(containers, statuses):
+        if isinstance(status, Exception):
+            logger.error(
+                'Failed to %s container %s: %s', action.value, container.id, status
+            )
+            status = ActionStatus.FAILED
+        results[container.id] = status
 
-        buffer_size = metrics[BUFFER_SIZE_METRIC]
+    counts = Counter(results.values())
+    logger.info(
+        'Action %s applied to %s containers: %s',
+        action.value,
+        len(results),
+        ', '.join(f'{counts[x]} {x.value}' for x in ActionStatus if counts[x]),
+    )
 
-        if buffer_size > config.length:
-            logger.debug(
-                'Buffer %s is full, processing action %s', buffer, config.action
+    return results
+
+
+async def apply_watch_action(
+    docker_client: DockerClient,
+    config: Union[QueueConfig, FlowConfig, ThroughputConfig, UnreachableConfig],
+):
+    """Processes the action of the watch. Failures are logged, so that they
+    do not stop the watch."""
+
+    try:
+        with ACTION_DURATION.labels(config.action.value).time():
+            await process_action(
+                docker_client,
+                config.action,
+                config.container_labels,
+                config.concurrency,
+                config.timeout,
             )
-            await process_action(docker_client, config.action, config.container_labels)
-            await asyncio.sleep(config.cooldown)
-        else:
-            await asyncio.sleep(config.polling_interval)
+    except Exception as e:
+        logger.error(
+            'Failed to process action %s. %s: %s', config.action, type(e).__name__, e
+        )
 
 
-async def watch_egress(docker_client: DockerClient, buffer: str, config: FlowConfig):
-    await asyncio.sleep(config.polling_interval)
+def start_watch_action(
+    docker_client: DockerClient,
+    buffer: str,
+    condition: str,
+    config: Union[QueueConfig, FlowConfig, ThroughputConfig, UnreachableConfig],
+    task: Optional[asyncio.Task],
+    lease: Optional[LeaderLease] = None,
+) -> Optional[asyncio.Task]:
+    """Starts the action of the watch in the background, so that it does not
+    delay checks of the other conditions. An action still in progress is not
+    started again.
 
-    while True:
-        content = await get_metrics(buffer)
-        metrics = await parse_metrics(content)
+    :param condition: Name of the violated condition, e.g. ``queue``.
+    :param task: Task of the previous action of the watch.
+    :param lease: Leader lease of the instance, the action is skipped
+        on a standby.
+    """
 
-        last_sent_message = metrics[LAST_SENT_MESSAGE_METRIC]
-        now = time.time()
+    if task is not None and not task.done():
+        logger.warning('Action %s is still in progress, skipping', config.action)
+        return task
 
-        if now - last_sent_message > config.idle:
-            logger.debug(
-                'Egress flow %s is idle, processing action %s', buffer, config.action
-            )
-            await process_action(docker_client, config.action, config.container_labels)
-            await asyncio.sleep(config.cooldown)
-        else:
-            await asyncio.sleep(config.polling_interval)
+    if lease is not None and not lease.claim_action(
+        f'{buffer} {condition} {config.container_labels}', config.cooldown
+    ):
+        return task
 
+    ACTIONS.labels(buffer, condition, config.action.value).inc()
+    return asyncio.create_task(apply_watch_action(docker_client, config))
 
-async def watch_ingress(docker_client: DockerClient, buffer: str, config: FlowConfig):
-    await asyncio.sleep(config.polling_interval)
 
-    while True:
-        content = await get_metrics(buffer)
-        metrics = await parse_metrics(content)
+def check_queue(
+    buffer: str,
+    config: QueueConfig,
+    metrics: Dict[str, float],
+    history: Optional[MetricHistory] = None,
+) -> bool:
+    buffer_size = metrics[BUFFER_SIZE_METRIC]
+
+    if buffer_size > config.length:
+        logger.debug('Buffer %s is full, processing action %s', buffer, config.action)
+        return True
+
+    if config.time_to_full is None or history is None:
+        return False
+
+    fill_rate = history.slope(
+        BUFFER_SIZE_METRIC,
+        time.monotonic() - config.growth_window,
+        GROWTH_MIN_SAMPLES,
+    )
+    if fill_rate is None or fill_rate <= 0:
+        return False
 
-        last_received_message = metrics[LAST_RECEIVED_MESSAGE_METRIC]
-        now = time.time()
+    time_to_full = (config.length - buffer_size) / fill_rate
+    if time_to_full < config.time_to_full:
+        logger.debug(
+            'Buffer %s is filling at %.2f messages/s and is full in %.0f seconds, '
+            'processing action %s',
+            buffer,
+            fill_rate,
+            time_to_full,
+            config.action,
+        )
+        return True
+
+    return False
+
+
+def check_egress(
+    buffer: str,
+    config: FlowConfig,
+    metrics: Dict[str, float],
+    history: Optional[MetricHistory] = None,
+) -> bool:
+    last_sent_message = metrics[LAST_SENT_MESSAGE_METRIC]
+    now = time.time()
+
+    if now - last_sent_message > config.idle:
+        logger.debug(
+            'Egress flow %s is idle, processing action %s', buffer, config.action
+        )
+        return True
+
+    return False
+
+
+def check_ingress(
+    buffer: str,
+    config: FlowConfig,
+    metrics: Dict[str, float],
+    history: Optional[MetricHistory] = None,
+) -> bool:
+    last_received_message = metrics[LAST_RECEIVED_MESSAGE_METRIC]
+    now = time.time()
+
+    if now - last_received_message > config.idle:
+        logger.debug(
+            'Ingress flow %s is idle, processing action %s', buffer, config.action
+        )
+        return True
 
-        if now - last_received_message > config.idle:
+    return False
+
+
+def check_throughput(
+    buffer: str,
+    config: ThroughputConfig,
+    metrics: Dict[str, float],
+    history: Optional[MetricHistory] = None,
+) -> bool:
+    if history is None:
+        return False
+
+    since = time.monotonic() - config.window
+    egress_rate = history.rate(config.egress_metric, since, GROWTH_MIN_SAMPLES)
+    if egress_rate is None:
+        return False
+
+    if config.min_rate is not None and egress_rate < config.min_rate:
+        logger.debug(
+            'Buffer %s sends %.2f messages/s, below %s, processing action %s',
+            buffer,
+            egress_rate,
+            config.min_rate,
+            config.action,
+        )
+        return True
+
+    if config.min_ratio is not None:
+        ingress_rate = history.rate(config.ingress_metric, since, GROWTH_MIN_SAMPLES)
+        if ingress_rate and egress_rate < config.min_ratio * ingress_rate:
             logger.debug(
-                'Ingress flow %s is idle, processing action %s', buffer, config.action
+                'Buffer %s sends %.2f of %.2f received messages/s, '
+                'processing action %s',
+                buffer,
+                egress_rate,
+                ingress_rate,
+                config.action,
             )
-            await process_action(docker_client, config.action, config.container_labels)
-            await asyncio.sleep(config.cooldown)
+            return True
+
+    return False
+
+
+class _UnknownValue(Exception):
+    """Raised by the rule functions without enough samples in the window."""
+
+
+def check_rule(
+    buffer: str,
+    config: RuleConfig,
+    metrics: Dict[str, float],
+    history: Optional[MetricHistory] = None,
+) -> bool:
+    since = time.monotonic() - config.window
+
+    # a function without enough samples ends the evaluation, as neither
+    # the rule nor its negation is known to hold
+    def rate(name: str) -> float:
+        value = None
+        if history is not None:
+            value = history.rate(name, since, GROWTH_MIN_SAMPLES)
+        if value is None:
+            raise _UnknownValue()
+        return value
+
+    def slope(name: str) -> float:
+        value = None
+        if history is not None:
+            value = history.slope(name, since, GROWTH_MIN_SAMPLES)
+        if value is None:
+            raise _UnknownValue()
+        return value
+
+    def age(name: str) -> float:
+        return time.time() - metrics[name]
+
+    try:
+        violated = config.rule.evaluate(metrics, rate, slope, age)
+    except _UnknownValue:
+        return False
+
+    if violated:
+        logger.debug(
+            'Buffer %s violates rule %s (%s), processing action %s',
+            buffer,
+            config.name,
+            config.rule.expr,
+            config.action,
+        )
+        return True
+
+    return False
+
+
+def queue_proximity(config: QueueConfig, metrics: Dict[str, float]) -> Optional[float]:
+    buffer_size = metrics.get(BUFFER_SIZE_METRIC)
+    if buffer_size is None:
+        return None
+    return buffer_size / config.length if config.length > 0 else 1.0
+
+
+def egress_proximity(config: FlowConfig, metrics: Dict[str, float]) -> Optional[float]:
+    last_sent_message = metrics.get(LAST_SENT_MESSAGE_METRIC)
+    if last_sent_message is None:
+        return None
+    return (time.time() - last_sent_message) / config.idle if config.idle > 0 else 1.0
+
+
+def ingress_proximity(config: FlowConfig, metrics: Dict[str, float]) -> Optional[float]:
+    last_received_message = metrics.get(LAST_RECEIVED_MESSAGE_METRIC)
+    if last_received_message is None:
+        return None
+    return (
+        (time.time() - last_received_message) / config.idle if config.idle > 0 else 1.0
+    )
+
+
+@dataclass
+class Watch:
+    """Condition attached to a buffer and its scheduling state."""
+
+    config: Union[QueueConfig, FlowConfig, ThroughputConfig, RuleConfig]
+    """Condition configuration."""
+
+    check: Callable[
+        [
+            str,
+            Union[QueueConfig, FlowConfig, ThroughputConfig, RuleConfig],
+            Dict[str, float],
+            MetricHistory,
+        ],
+        bool,
+    ]
+    """Function that returns True when the condition is violated."""
+
+    metric_names: Tuple[str, ...]
+    """Names of the metrics the condition is checked against."""
+
+    matchers: Labels = ()
+    """Labels to select the buffer series."""
+
+    condition: str = ''
+    """Name of the condition, e.g. ``queue``."""
+
+    next_check: float = 0
+    """Monotonic time when the condition is due to be checked."""
+
+    cooldown_until: float = 0
+    """Monotonic time until which the condition is not checked after
+    an action."""
+
+    action_task: Optional[asyncio.Task] = None
+    """Task of the last action applied on the condition violation."""
+
+    history: Optional[MetricHistory] = None
+    """Recent samples of the buffer series, shared by the watches of the series."""
+
+    proximity: Optional[
+        Callable[[Union[QueueConfig, FlowConfig], Dict[str, float]], Optional[float]]
+    ] = None
+    """Function that returns how close the metrics are to the threshold of
+    the condition, from 0 when far from it to 1 at the threshold."""
+
+    skip_unchanged: bool = False
+    """Whether the check depends only on the sample, so that a sample with
+    the same exposition timestamp and values is not checked again."""
+
+    last_sample: Optional[tuple] = None
+    """Exposition timestamp and values of the last checked sample."""
+
+    triggered: bool = False
+    """Whether the condition is considered violated, i.e. the checks are
+    acted on until the condition recovers."""
+
+    streak: int = 0
+    """Number of checks in a row that disagree with ``triggered``."""
+
+
+def get_polling_interval(watch: Watch, metrics: Dict[str, float]) -> float:
+    """Returns the interval to the next check of the watch.
+
+    With ``min_polling_interval`` set, the interval shrinks linearly from
+    the polling interval to the minimum one as the watched metric approaches
+    the threshold, so that healthy buffers are scraped rarely and degrading
+    ones are checked often.
+    """
+
+    config = watch.config
+    min_polling_interval = getattr(config, 'min_polling_interval', None)
+    if min_polling_interval is None or watch.proximity is None:
+        return config.polling_interval
+
+    proximity = watch.proximity(config, metrics)
+    if proximity is None:
+        return config.polling_interval
+
+    headroom = 1 - min(max(proximity, 0.0), 1.0)
+    return (
+        min_polling_interval
+        + (config.polling_interval - min_polling_interval) * headroom
+    )
+
+
+def update_trigger(watch: Watch, violated: bool) -> bool:
+    """Applies the check result to the watch with hysteresis.
+
+    The watch is triggered after ``trigger_after`` violated checks in a row
+    and recovers after ``recover_after`` passed checks in a row, so that
+    a single noisy sample neither fires the action nor resets a violation.
+
+    :return: Whether the action is due, i.e. the check is violated and
+        the watch is triggered.
+    """
+
+    if violated == watch.triggered:
+        watch.streak = 0
+    else:
+        watch.streak += 1
+        if violated:
+            required = getattr(watch.config, 'trigger_after', 1)
         else:
-            await asyncio.sleep(config.polling_interval)
+            required = getattr(watch.config, 'recover_after', 1)
+        if watch.streak >= required:
+            watch.triggered = violated
+            watch.streak = 0
+
+    return violated and watch.triggered
+
+
+def to_watchdog_clock(metrics: Dict[str, float], offset: float) -> Dict[str, float]:
+    """Converts the message times of the buffer clock to the watchdog clock,
+    so that the idle times follow the buffer clock."""
+
+    converted = dict(metrics)
+    for name in (LAST_SENT_MESSAGE_METRIC, LAST_RECEIVED_MESSAGE_METRIC):
+        if name in converted:
+            converted[name] += offset
+    return converted
+
+
+def get_next_check(
+    watch: Watch,
+    metrics: Dict[str, float],
+    clock: SeriesClock,
+    now: float,
+    wall_now: float,
+) -> float:
+    """Returns the monotonic time of the next check of the watch.
+
+    With ``FOLLOW_BUFFER_CLOCK`` set, the check is moved to right after
+    the latest refresh of the buffer metrics expected within the polling
+    interval, so that it does not scrape the same sample again.
+    """
+
+    interval = get_polling_interval(watch, metrics)
+    if FOLLOW_BUFFER_CLOCK:
+        refresh = clock.next_refresh(wall_now, wall_now + interval)
+        if refresh is not None:
+            return now + refresh - wall_now + REFRESH_MARGIN
+    return now + interval
+
+
+def get_due_watches(watches: List[Watch], now: float) -> List[Watch]:
+    """Returns watches due at the moment, coalescing those due within
+    the window so that they share a single scrape."""
 
+    return [w for w in watches if w.next_check <= now + SCRAPE_COALESCE_WINDOW]
 
-async def watch_buffer(docker_client: DockerClient, config: WatchConfig):
+
+def create_watches(config: WatchConfig) -> List[Watch]:
     logger.info('Watching buffer [%s] metrics', config.buffer)
+    if config.metric_labels:
+        logger.info('Selecting series with labels: %s', config.metric_labels)
+    matchers = to_labels(config.metric_labels)
     watches = []
 
     if config.queue:
         logger.info('Watching queue: %s', config.queue)
-        watches.append(watch_queue(docker_client, config.buffer, config.queue))
+        watches.append(
+            Watch(
+                config.queue,
+                check_queue,
+                (BUFFER_SIZE_METRIC,),
+                matchers,
+                'queue',
+                proximity=queue_proximity,
+                skip_unchanged=True,
+            )
+        )
     if config.egress:
         logger.info('Watching egress flow: %s', config.egress)
-        watches.append(watch_egress(docker_client, config.buffer, config.egress))
+        watches.append(
+            Watch(
+                config.egress,
+                check_egress,
+                (LAST_SENT_MESSAGE_METRIC,),
+                matchers,
+                'egress',
+                proximity=egress_proximity,
+            )
+        )
     if config.ingress:
         logger.info('Watching ingress flow: %s', config.ingress)
-        watches.append(watch_ingress(docker_client, config.buffer, config.ingress))
+        watches.append(
+            Watch(
+                config.ingress,
+                check_ingress,
+                (LAST_RECEIVED_MESSAGE_METRIC,),
+                matchers,
+                'ingress',
+                proximity=ingress_proximity,
+            )
+        )
+    if config.throughput:
+        logger.info('Watching throughput: %s', config.throughput)
+        metric_names = (config.throughput.egress_metric,)
+        if config.throughput.min_ratio is not None:
+            metric_names += (config.throughput.ingress_metric,)
+        watches.append(
+            Watch(
+                config.throughput,
+                check_throughput,
+                metric_names,
+                matchers,
+                'throughput',
+                skip_unchanged=True,
+            )
+        )
+    for rule in config.rules:
+        logger.info('Watching rule: %s', rule)
+        watches.append(
+            Watch(
+                rule,
+                check_rule,
+                rule.rule.metric_names,
+                matchers,
+                f'rule:{rule.name}',
+                # the age of a metric grows with an unchanged sample
+                skip_unchanged='age' not in rule.rule.functions,
+            )
+        )
+
+    return watches
+
+
+def record_observation(buffer: str, watch: Watch, metrics: Dict[str, float]):
+    """Exposes the last observed buffer metrics of the watch."""
+
+    series = ','.join(f'{k}={v}' for k, v in watch.matchers)
+    for name in watch.metric_names:
+        value = metrics.get(name)
+        if value is None:
+            continue
+        if name == BUFFER_SIZE_METRIC:
+            BUFFER_SIZE.labels(buffer, series).set(value)
+        elif name in (LAST_SENT_MESSAGE_METRIC, LAST_RECEIVED_MESSAGE_METRIC):
+            BUFFER_IDLE.labels(buffer, series, watch.condition).set(time.time() - value)
+
+
+def log_history(buffer: str, watch: Watch):
+    """Logs the recent samples of the watched metrics for a post-mortem."""
+
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    for name in watch.metric_names:
+        timestamps, values = watch.history.window(name)
+        now = time.monotonic()
+        samples = ', '.join(
+            f'{value:g} ({now - timestamp:.0f}s ago)'
+            for timestamp, value in zip(
+                timestamps[-HISTORY_LOG_SAMPLES:], values[-HISTORY_LOG_SAMPLES:]
+            )
+        )
+        logger.debug('Buffer %s recent %s: %s', buffer, name, samples)
+
+
+def number_duplicates(keys: List[tuple]) -> List[tuple]:
+    """Appends the occurrence number to each key, so that duplicate keys
+    are told apart by their order."""
+
+    seen = Counter()
+    numbered = []
+    for key in keys:
+        numbered.append(key + (seen[key],))
+        seen[key] += 1
+    return numbered
+
+
+def get_unreachable_configs(
+    configs: List[WatchConfig],
+) -> Dict[tuple, UnreachableConfig]:
+    """Returns the unreachable configs of a buffer keyed by their series."""
+
+    configs = [x for x in configs if x.unreachable]
+    keys = number_duplicates([(to_labels(x.metric_labels),) for x in configs])
+    return {k: x.unreachable for k, x in zip(keys, configs)}
+
+
+def build_watches(
+    configs: List[WatchConfig],
+    now: float,
+    previous: List[Watch] = (),
+    phase: float = 0,
+) -> List[Watch]:
+    """Creates the watches of a buffer.
+
+    A watch of the same series and condition as a previous one takes over its
+    action in progress, trigger state and history, so that a reload keeps the
+    cooldown and trend state and the changed thresholds apply from the next
+    check. Its next check is kept during the cooldown, otherwise it is brought
+    forward to a shorter polling interval. Actions of the previous watches
+    that are gone are cancelled.
+
+    :param configs: Watch configs sharing the same buffer url.
+    :param now: Monotonic time to schedule the first check of new watches from.
+    :param previous: Watches of the buffer before the reload.
+    :param phase: Fraction of the polling interval to bring the first check
+        of new watches forward by, to spread the checks of the buffers.
+    """
+
+    watches = [w for config in configs for w in create_watches(config)]
+    previous_watches = dict(
+        zip(number_duplicates([(w.matchers, w.condition) for w in previous]), previous)
+    )
+
+    series_metrics: Dict[Labels, Dict[str, None]] = {}
+    for watch in watches:
+        names = series_metrics.setdefault(
+            watch.matchers, dict.fromkeys(HISTORY_METRICS)
+        )
+        names.update(dict.fromkeys(watch.metric_names))
+    previous_histories = {w.matchers: w.history for w in previous}
+    histories = {}
+    for matchers, names in series_metrics.items():
+        history = previous_histories.get(matchers)
+        if history is None:
+            history = MetricHistory(names, HISTORY_SIZE)
+        else:
+            history.extend(names)
+        histories[matchers] = history
+
+    keys = number_duplicates([(w.matchers, w.condition) for w in watches])
+    for key, watch in zip(keys, watches):
+        watch.history = histories[watch.matchers]
+        previous_watch = previous_watches.pop(key, None)
+        if previous_watch is None:
+            watch.next_check = now + watch.config.polling_interval * (1 - phase)
+        else:
+            watch.cooldown_until = previous_watch.cooldown_until
+            if now < previous_watch.cooldown_until:
+                watch.next_check = previous_watch.next_check
+            else:
+                watch.next_check = min(
+                    previous_watch.next_check, now + watch.config.polling_interval
+                )
+            watch.action_task = previous_watch.action_task
+            watch.triggered = previous_watch.triggered
+            watch.streak = previous_watch.streak
+
+    for watch in previous_watches.values():
+        if watch.action_task is not None:
+            watch.action_task.cancel()
+
+    return watches
+
+
+async def watch_buffer(
+    docker_client: DockerClient,
+    metrics_client: MetricsClient,
+    configs: List[WatchConfig],
+    updates: Optional[asyncio.Queue] = None,
+    lease: Optional[LeaderLease] = None,
+    scheduler: Optional[Scheduler] = None,
+    phase: float = 0,
+):
+    """Scrapes the buffer metrics once per tick and checks every condition
+    due at that tick against the same snapshot.
+
+    A standby runs the checks and cooldowns the same way as the leader,
+    only skipping the actions, so that it takes over with warm state.
+
+    :param configs: Watch configs sharing the same buffer url, e.g. different
+        series of one metrics endpoint.
+    :param updates: Queue of the reloaded watch configs of the buffer. They
+        are reloaded before the next tick, or at once when the sleeping watch
+        is woken up on the scheduler by the buffer url.
+    :param lease: Leader lease of the instance, actions are applied by
+        the leader only.
+    :param scheduler: Scheduler shared by the watches of all buffers to wait
+        for the next tick, the event loop timers are used if not set.
+    :param phase: Fraction of the polling interval to bring the first checks
+        forward by, see ``build_watches``.
+    """
+
+    buffer = configs[0].buffer
+    watches = build_watches(configs, time.monotonic(), phase=phase)
+    if scheduler is None:
+        sleep = asyncio.sleep
+    else:
+        sleep = functools.partial(scheduler.sleep, key=buffer)
+
+    if not watches and updates is None:
+        return
+
+    breaker = CircuitBreaker(SCRAPE_FAILURE_THRESHOLD, max_delay=SCRAPE_BACKOFF_MAX)
+    unreachable_configs = get_unreachable_configs(configs)
+    unreachable_next_action: Dict[tuple, float] = {}
+    unreachable_tasks: Dict[tuple, Optional[asyncio.Task]] = {}
+    clocks: Dict[Labels, SeriesClock] = {}
+
+    try:
+        while True:
+            next_check = min((w.next_check for w in watches), default=math.inf)
+            if breaker.is_open:
+                next_check = max(next_check, breaker.retry_at)
+            delay = max(next_check - time.monotonic(), 0)
+            if updates is None or updates.empty():
+                await sleep(delay)
+            # the scheduler wakes the watch up when the configs are reloaded
+            if updates is not None and not updates.empty():
+                configs = updates.get_nowait()
+                logger.info('Reloading buffer [%s] watches', buffer)
+                watches = build_watches(configs, time.monotonic(), watches, phase)
+                unreachable_configs = get_unreachable_configs(configs)
+                for key in list(unreachable_tasks):
+                    if key not in unreachable_configs:
+                        task = unreachable_tasks.pop(key)
+                        if task is not None:
+                            task.cancel()
+                        unreachable_next_action.pop(key, None)
+                continue
+
+            now = time.monotonic()
+            due_watches = get_due_watches(watches, now)
+            if not due_watches:
+                continue
+            if not breaker.is_open:
+                delay = now - min(w.next_check for w in due_watches)
+                CHECK_DELAY.labels(buffer).observe(max(delay, 0))
+
+            selectors = {(x, w.matchers) for w in due_watches for x in w.metric_names}
+            try:
+                samples = await metrics_client.scrape(buffer, selectors)
+            except Exception as e:
+                now = time.monotonic()
+                breaker.record_failure(now)
+                logger.warning(
+                    'Failed to retrieve buffer %s metrics (%s failures in a row). %s: %s',
+                    buffer,
+                    breaker.failures,
+                    type(e).__name__,
+                    e,
+                )
+                for watch in due_watches:
+                    watch.next_check = now + watch.config.polling_interval
+
+                unreachable_for = breaker.unreachable_for(now)
+                for key, config in unreachable_configs.items():
+                    if (
+                        unreachable_for >= config.duration
+                        and now >= unreachable_next_action.get(key, 0)
+                    ):
+                        logger.debug(
+                            'Buffer %s is unreachable, processing action %s',
+                            buffer,
+                            config.action,
+                        )
+                        unreachable_tasks[key] = start_watch_action(
+                            docker_client,
+                            buffer,
+                            'unreachable',
+                            config,
+                            unreachable_tasks.get(key),
+                            lease,
+                        )
+                        unreachable_next_action[key] = now + config.cooldown
+                continue
+
+            breaker.record_success()
+
+            now = time.monotonic()
+            wall_now = time.time()
+            series = {}
+            for watch in due_watches:
+                clock = clocks.setdefault(watch.matchers, SeriesClock())
+                selected = series.get(watch.matchers)
+                if selected is None:
+                    metrics = samples.select(watch.matchers)
+                    timestamp = samples.select_timestamp(watch.matchers)
+                    # a repeated sample would flatten the trends
+                    if clock.update(timestamp, metrics, wall_now):
+                        watch.history.append(now, metrics)
+                    if FOLLOW_BUFFER_CLOCK and clock.offset is not None:
+                        metrics = to_watchdog_clock(metrics, clock.offset)
+                    selected = series[watch.matchers] = (metrics, timestamp)
+                metrics, timestamp = selected
+
+                sample = (timestamp, tuple(metrics.get(x) for x in watch.metric_names))
+                if (
+                    watch.skip_unchanged
+                    and timestamp is not None
+                    and sample == watch.last_sample
+                    # a violation is acted on again after the cooldown
+                    and not watch.triggered
+                ):
+                    CHECKS_SKIPPED.labels(buffer).inc()
+                    watch.next_check = get_next_check(
+                        watch, metrics, clock, now, wall_now
+                    )
+                    continue
+                watch.last_sample = sample
+
+                try:
+                    violated = watch.check(buffer, watch.config, metrics, watch.history)
+                except Exception as e:
+                    logger.error(
+                        'Failed to check buffer %s metrics. %s: %s',
+                        buffer,
+                        type(e).__name__,
+                        e,
+                    )
+                    violated = False
+                record_observation(buffer, watch, metrics)
+
+                if update_trigger(watch, violated):
+                    log_history(buffer, watch)
+                    watch.action_task = start_watch_action(
+                        docker_client,
+                        buffer,
+                        watch.condition,
+                        watch.config,
+                        watch.action_task,
+                        lease,
+                    )
+                    watch.next_check = now + watch.config.cooldown
+                    watch.cooldown_until = watch.next_check
+                else:
+                    if violated:
+                        logger.debug(
+                            'Buffer %s %s check failed %s times in a row of %s',
+                            buffer,
+                            watch.condition,
+                            watch.streak,
+                            getattr(watch.config, 'trigger_after', 1),
+                        )
+                    watch.next_check = get_next_check(
+                        watch, metrics, clock, now, wall_now
+                    )
+    finally:
+        # actions in progress are cancelled together with the watch
+        tasks = [w.action_task for w in watches] + list(unreachable_tasks.values())
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL):
+    """Measures how late the event loop wakes up a sleeping task, i.e. how
+    long the watchdog blocks the loop."""
+
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.labels().observe(max(time.monotonic() - start - interval, 0))
+
 
-    await asyncio.gather(*watches)
+def load_buffers(
+    config_file_path: str, shard: int = 0, shards: int = 1
+) -> Dict[str, List[WatchConfig]]:
+    """Parses and validates the configuration file. With ``CONFIG_CACHE_DIR``
+    set, an unchanged file is loaded from the cache instead.
+
+    :param shard: Shard to return the buffers of.
+    :param shards: Number of shards, all buffers are returned if 1.
+    :return: Watch configs grouped by buffer url.
+    """
+
+    cache = ConfigCache(CONFIG_CACHE_DIR) if CONFIG_CACHE_DIR else None
+    key = cache.get_key(config_file_path) if cache else None
+    config = cache.get(key) if cache else None
+    if config is None:
+        config = ConfigParser(config_file_path).parse()
+        validate(config)
+        # the file may have changed while it was parsed
+        if cache and cache.get_key(config_file_path) == key:
+            try:
+                cache.put(key, config)
+            except OSError as e:
+                logger.warning(
+                    'Failed to cache configuration. %s: %s', type(e).__name__, e
+                )
+    else:
+        logger.info('Loaded configuration from cache')
+        validate(config)
+
+    # watch configs of the same buffer share scrapes
+    buffers = {}
+    for watch_config in config.watch_configs:
+        buffers.setdefault(watch_config.buffer, []).append(watch_config)
+
+    if shards > 1:
+        buffers = {k: v for k, v in buffers.items() if get_shard(k, shards) == shard}
+    return buffers
+
+
+class BufferWatches:
+    """Watch tasks of the buffers, updated with the reloaded configuration.
+
+    The watches wait for their checks on a shared scheduler, and the first
+    checks of each buffer are offset by a stable phase of the buffer url,
+    so that the scrapes are spread over the polling intervals instead of
+    all buffers started together being scraped at the same time.
+    """
+
+    def __init__(
+        self,
+        docker_client: DockerClient,
+        metrics_client: MetricsClient,
+        lease: Optional[LeaderLease] = None,
+    ):
+        self._docker_client = docker_client
+        self._metrics_client = metrics_client
+        self._lease = lease
+        self._scheduler = Scheduler(SCHEDULER_RESOLUTION)
+        self._configs: Dict[str, List[WatchConfig]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._updates: Dict[str, asyncio.Queue] = {}
+
+    def update(self, buffers: Dict[str, List[WatchConfig]]):
+        """Starts watching new buffers, stops watching removed ones and passes
+        the changed configs to the running watches, which keep their state.
+
+        :param buffers: Watch configs grouped by buffer url.
+        """
+
+        removed = [x for x in self._configs if x not in buffers]
+        for buffer in removed:
+            logger.info('Stopped watching buffer [%s]', buffer)
+            self._tasks.pop(buffer).cancel()
+            del self._updates[buffer]
+            del self._configs[buffer]
+
+        added = changed = 0
+        for buffer, configs in buffers.items():
+            previous = self._configs.get(buffer)
+            if previous is None:
+                self._start(buffer, configs)
+                added += 1
+            elif previous != configs:
+                self._updates[buffer].put_nowait(configs)
+                self._scheduler.wake(buffer)
+                changed += 1
+            self._configs[buffer] = configs
+
+        logger.info(
+            'Watching %s buffers: %s added, %s changed, %s removed',
+            len(self._configs),
+            added,
+            changed,
+            len(removed),
+        )
+
+    def _start(self, buffer: str, configs: List[WatchConfig]):
+        self._updates[buffer] = asyncio.Queue()
+        task = asyncio.create_task(
+            watch_buffer(
+                self._docker_client,
+                self._metrics_client,
+                configs,
+                self._updates[buffer],
+                self._lease,
+                self._scheduler,
+                get_phase(buffer),
+            )
+        )
+        task.add_done_callback(lambda x: self._on_done(buffer, x))
+        self._tasks[buffer] = task
+
+    @staticmethod
+    def _on_done(buffer: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            logger.error(
+                'Watch of buffer %s failed. %s: %s', buffer, type(e).__name__, e
+            )
+
+    async def run(self, buffers: Dict[str, List[WatchConfig]]):
+        """Watches the buffers until cancelled."""
+
+        self.update(buffers)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            tasks = list(self._tasks.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def watch_config_file(
+    config_file_path: str, interval: float, reload: Callable[[], Awaitable]
+):
+    """Polls the configuration file and reloads it when the file changes."""
+
+    def get_stamp() -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(config_file_path)
+        except OSError as e:
+            logger.warning(
+                'Failed to check configuration file. %s: %s', type(e).__name__, e
+            )
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    stamp = get_stamp()
+    while True:
+        await asyncio.sleep(interval)
+        current = get_stamp()
+        if current is not None and current != stamp:
+            stamp = current
+            logger.info('Configuration file %s changed', config_file_path)
+            await reload()
+
+
+async def lead(lease: LeaderLease):
+    """Stands by until the instance takes over the leader lease."""
+
+    LEADER.labels().set(0)
+    await lease.acquire()
+    LEADER.labels().set(1)
+
+
+def run_watches(
+    buffers: Dict[str, List[WatchConfig]],
+    action_lane: Optional[ActionLane] = None,
+    metrics_port: Optional[int] = None,
+    config_file_path: Optional[str] = None,
+    shard: int = 0,
+    shards: int = 1,
+):
+    """Watches the buffers on the current event loop until interrupted.
+
+    The configuration is reloaded on SIGHUP, and on changes of the file
+    every ``CONFIG_RELOAD_INTERVAL`` seconds if set. With ``WATCHDOG_LEASE_PATH``
+    set, actions are applied only while the instance holds the leader lease.
+
+    :param buffers: Watch configs grouped by buffer url.
+    :param action_lane: Lane to serialize actions with other processes.
+    :param metrics_port: Port to serve the watchdog metrics on, disabled if 0.
+        ``WATCHDOG_METRICS_PORT`` if None.
+    :param config_file_path: Configuration file to reload, reload is disabled
+        if None.
+    :param shard: Shard of the process, to reload only its buffers.
+    :param shards: Number of shards.
+    """
+
+    if metrics_port is None:
+        metrics_port = WATCHDOG_METRICS_PORT
+
+    action_budget = None
+    if ACTION_BUDGET or ACTION_BUDGET_PER_LABELS:
+        action_budget = ActionBudget(
+            ACTION_BUDGET,
+            ACTION_BUDGET_PER_LABELS,
+            ACTION_BUDGET_WINDOW,
+            # the shards share the budget
+            os.path.join(action_lane.path, BUDGET_FILE) if action_lane else None,
+        )
+    docker_client = DockerClient(
+        action_concurrency=ACTION_CONCURRENCY,
+        action_timeout=ACTION_TIMEOUT,
+        action_lane=action_lane,
+        action_budget=action_budget,
+        action_coalesce_window=ACTION_COALESCE_WINDOW,
+    )
+    metrics_client = MetricsClient(
+        connect_timeout=METRICS_CONNECT_TIMEOUT,
+        read_timeout=METRICS_READ_TIMEOUT,
+        scrape_timeout=METRICS_SCRAPE_TIMEOUT,
+        limit_per_host=METRICS_CONNECTION_LIMIT_PER_HOST,
+    )
+    lease = None
+    if WATCHDOG_LEASE_PATH:
+        # the instances elect a leader per shard
+        lease_path = (
+            f'{WATCHDOG_LEASE_PATH}.{shard}' if shards > 1 else WATCHDOG_LEASE_PATH
+        )
+        lease = LeaderLease(lease_path, WATCHDOG_LEASE_RETRY_INTERVAL)
+    buffer_watches = BufferWatches(docker_client, metrics_client, lease)
+
+    loop = asyncio.get_event_loop()
+    coroutines = [docker_client.watch_containers(), buffer_watches.run(buffers)]
+    if lease is not None:
+        coroutines.append(lead(lease))
+    metrics_server = None
+    if metrics_port:
+        metrics_server = loop.run_until_complete(
+            start_metrics_server(WATCHDOG_METRICS_HOST, metrics_port)
+        )
+        logger.info(
+            'Serving watchdog metrics on %s:%s', WATCHDOG_METRICS_HOST, metrics_port
+        )
+        coroutines.append(monitor_event_loop_lag())
+
+    if config_file_path:
+        reload_lock = asyncio.Lock()
+
+        async def reload():
+            # reloads are applied in order
+            async with reload_lock:
+                try:
+                    # parsing a large file would delay the checks
+                    reloaded = await loop.run_in_executor(
+                        None, load_buffers, config_file_path, shard, shards
+                    )
+                except Exception as e:
+                    logger.error(
+                        'Failed to reload configuration, keeping the current one. '
+                        '%s: %s',
+                        type(e).__name__,
+                        e,
+                    )
+                    return
+                buffer_watches.update(reloaded)
+
+        loop.add_signal_handler(signal.SIGHUP, lambda: loop.create_task(reload()))
+        if CONFIG_RELOAD_INTERVAL:
+            coroutines.append(
+                watch_config_file(config_file_path, CONFIG_RELOAD_INTERVAL, reload)
+            )
+
+    futures = asyncio.gather(*coroutines)
+    try:
+        loop.run_until_complete(futures)
+    except KeyboardInterrupt:
+        logger.error('Shutting down the pipeline watchdog')
+    finally:
+        if config_file_path:
+            loop.remove_signal_handler(signal.SIGHUP)
+        futures.cancel()
+        # let the watches handle the cancellation before the clients are closed
+        loop.run_until_complete(asyncio.gather(futures, return_exceptions=True))
+        # clients are closed on the same loop their connections were opened on
+        closing = [docker_client.close(), metrics_client.close()]
+        if metrics_server is not None:
+            closing.append(metrics_server.cleanup())
+        loop.run_until_complete(asyncio.gather(*closing))
+        loop.close()
+        if lease is not None:
+            lease.release()
+
+
+def run_shard(
+    shard: int,
+    shards: int,
+    buffers: Dict[str, List[WatchConfig]],
+    lane_path: str,
+    config_file_path: Optional[str] = None,
+):
+    """Entry point of a shard worker process."""
+
+    init_logging(LOG_LEVEL)
+    signal.signal(signal.SIGTERM, signal.getsignal(signal.SIGINT))
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    logger.info('Shard %s is watching %s buffers', shard, len(buffers))
+    # each shard serves its own metrics on the next port
+    metrics_port = WATCHDOG_METRICS_PORT + shard if WATCHDOG_METRICS_PORT else 0
+    run_watches(
+        buffers, ActionLane(lane_path), metrics_port, config_file_path, shard, shards
+    )
+
+
+def supervise_shards(
+    buffers: Dict[str, List[WatchConfig]],
+    shards: int,
+    config_file_path: Optional[str] = None,
+):
+    """Runs the buffer watches in worker processes, the buffers are consistently
+    hashed to the shards. Dead workers are restarted, and actions of all
+    the workers go through a shared lane, so that a container is never
+    restarted by two shards at the same time.
+
+    :param buffers: Watch configs grouped by buffer url.
+    :param shards: Number of worker processes.
+    :param config_file_path: Configuration file the workers reload on SIGHUP,
+        reload is disabled if None.
+    """
+
+    assigned = assign_shards(buffers, shards)
+    lane_path = tempfile.mkdtemp(prefix='pipeline-watchdog-lane-')
+    context = multiprocessing.get_context('spawn')
+    workers = {}
+
+    def start_worker(shard: int):
+        worker = context.Process(
+            target=run_shard,
+            args=(shard, shards, assigned[shard], lane_path, config_file_path),
+            name=f'pipeline-watchdog-shard-{shard}',
+            daemon=True,
+        )
+        worker.start()
+        workers[shard] = worker
+
+    def reload(signum, frame):
+        nonlocal assigned
+        try:
+            # restarted workers start with the reloaded buffers
+            assigned = assign_shards(load_buffers(config_file_path), shards)
+        except Exception as e:
+            logger.error(
+                'Failed to reload configuration, keeping the current one. %s: %s',
+                type(e).__name__,
+                e,
+            )
+        for worker in workers.values():
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGHUP)
+
+    # shards without buffers are started as well to pick up reloaded ones
+    for shard in range(shards):
+        start_worker(shard)
+    logger.info('Started %s shards', len(workers))
+
+    previous_handler = None
+    if config_file_path:
+        previous_handler = signal.signal(signal.SIGHUP, reload)
+
+    try:
+        while True:
+            multiprocessing.connection.wait([x.sentinel for x in workers.values()])
+            for shard, worker in list(workers.items()):
+                if worker.is_alive():
+                    continue
+                logger.error(
+                    'Shard %s exited with code %s. Restarting in %s seconds',
+                    shard,
+                    worker.exitcode,
+                    SHARD_RESTART_INTERVAL,
+                )
+                time.sleep(SHARD_RESTART_INTERVAL)
+                start_worker(shard)
+    except KeyboardInterrupt:
+        logger.error('Shutting down the pipeline watchdog shards')
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGHUP, previous_handler)
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.join(SHARD_SHUTDOWN_TIMEOUT)
+            if worker.is_alive():
+                logger.error(
+                    'Shard worker %s did not stop in %s seconds, killing it',
+                    worker.name,
+                    SHARD_SHUTDOWN_TIMEOUT,
+                )
+                worker.kill()
+                worker.join()
+        shutil.rmtree(lane_path, ignore_errors=True)
 
 
 def main():
+    init_logging(LOG_LEVEL)
     # To gracefully shutdown the adapter on SIGTERM (raise KeyboardInterrupt)
     signal.signal(signal.SIGTERM, signal.getsignal(signal.SIGINT))
 
@@ -175,28 +1656,43 @@ def main():
         )
         exit(1)
 
-    parser = ConfigParser(config_file_path)
+    if ACTION_CONCURRENCY < 1 or ACTION_TIMEOUT <= 0 or ACTION_COALESCE_WINDOW < 0:
+        logger.error(
+            'ACTION_CONCURRENCY and ACTION_TIMEOUT environment variables must be positive, '
+            'ACTION_COALESCE_WINDOW cannot be negative'
+        )
+        exit(1)
+
+    if ACTION_BUDGET < 0 or ACTION_BUDGET_PER_LABELS < 0 or ACTION_BUDGET_WINDOW <= 0:
+        logger.error(
+            'ACTION_BUDGET and ACTION_BUDGET_PER_LABELS environment variables '
+            'cannot be negative, ACTION_BUDGET_WINDOW must be positive'
+        )
+        exit(1)
+
+    if (
+        HISTORY_SIZE < 1
+        or WATCHDOG_SHARDS < 1
+        or WATCHDOG_LEASE_RETRY_INTERVAL <= 0
+        or CONFIG_RELOAD_INTERVAL < 0
+    ):
+        logger.error(
+            'HISTORY_SIZE, WATCHDOG_SHARDS and WATCHDOG_LEASE_RETRY_INTERVAL '
+            'environment variables must be positive, '
+            'CONFIG_RELOAD_INTERVAL cannot be negative'
+        )
+        exit(1)
 
     try:
-        config = parser.parse()
-        validate(config)
+        buffers = load_buffers(config_file_path)
     except Exception as e:
         logger.error('Invalid configuration. %s: %s', type(e).__name__, e)
         exit(1)
 
-    docker_client = DockerClient()
-
-    loop = asyncio.get_event_loop()
-    futures = asyncio.gather(
-        *[watch_buffer(docker_client, x) for x in config.watch_configs]
-    )
-    try:
-        loop.run_until_complete(futures)
-    except KeyboardInterrupt:
-        logger.error('Shutting down the pipeline watchdog')
-    finally:
-        loop.close()
-        asyncio.run(docker_client.close())
+    if WATCHDOG_SHARDS > 1:
+        supervise_shards(buffers, WATCHDOG_SHARDS, config_file_path)
+    else:
+        run_watches(buffers, config_file_path=config_file_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+import zlib
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+def get_phase(key: str) -> float:
+    """Returns a fraction of the polling interval to offset the checks of
+    the key by, stable across restarts and spread evenly over the keys."""
+
+    return zlib.crc32(key.encode()) / 2**32
+
+
+class Scheduler:
+    """Wakes up the sleeping watches of all buffers from a single timer.
+
+    Sleepers are kept in a heap by their deadline, and the event loop holds
+    one timer for the earliest of them. When it fires, all the sleepers due
+    within the resolution are woken up together, so that the number of timers
+    and wakeups of the loop does not grow with the number of watches. A sleeper
+    with a key can be woken up early, e.g. to deliver reloaded configs.
+    """
+
+    def __init__(self, resolution: float = 0.01):
+        """
+        :param resolution: Time in seconds within which the sleepers due
+            are woken up by the same timer.
+        """
+
+        self._resolution = resolution
+        self._heap: List[Tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_deadline = 0.0
+        self._sleepers: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def sleep(self, delay: float, key: Optional[Hashable] = None):
+        """Sleeps for the delay in seconds, like ``asyncio.sleep``.
+
+        :param delay: Time to sleep in seconds, forever if infinite.
+        :param key: Key to wake the sleeper up early by, see ``wake``.
+        """
+
+        future = self._schedule(delay)
+        if key is not None:
+            self._sleepers[key] = future
+        try:
+            await future
+        finally:
+            future.cancel()
+            if key is not None and self._sleepers.get(key) is future:
+                del self._sleepers[key]
+
+    def wake(self, key: Hashable):
+        """Wakes up the sleeper of the key, if it is sleeping."""
+
+        future = self._sleepers.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def _schedule(self, delay: float) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if delay == math.inf:
+            # woken up only by the key
+            return future
+        deadline = time.monotonic() + delay
+        heapq.heappush(self._heap, (deadline, next(self._counter), future))
+        if self._timer is None or deadline < self._timer_deadline:
+            self._set_timer(loop)
+        return future
+
+    def _set_timer(self, loop: asyncio.AbstractEventLoop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # cancelled sleepers are dropped when they reach the top of the heap
+        while self._heap and self._heap[0][2].done():
+            heapq.heappop(self._heap)
+        if self._heap:
+            self._timer_deadline = self._heap[0][0]
+            self._timer = loop.call_later(
+                max(self._timer_deadline - time.monotonic(), 0), self._fire, loop
+            )
+
+    def _fire(self, loop: asyncio.AbstractEventLoop):
+        self._timer = None
+        now = time.monotonic() + self._resolution
+        while self._heap and self._heap[0][0] <= now:
+            future = heapq.heappop(self._heap)[2]
+            if not future.done():
+                future.set_result(None)
+        self._set_timer(loop)
@@ -0,0 +1,77 @@
+import math
+from collections import deque
+from typing import Dict, Optional
+
+# Number of the recent clock offsets to estimate the buffer clock from
+OFFSET_SAMPLES = 10
+
+
+class SeriesClock:
+    """Follows the exposition timestamps of a buffer series.
+
+    The buffer refreshes its metrics periodically and stamps them with its
+    own clock. The clock tells a refreshed sample from a repeated one,
+    estimates the refresh period, and the offset of the watchdog clock from
+    the buffer one as the smallest recent difference between the time a
+    sample is received and its timestamp.
+    """
+
+    def __init__(self):
+        self.timestamp: Optional[float] = None
+        """Latest exposition timestamp in seconds."""
+
+        self.period: Optional[float] = None
+        """Smallest observed interval between the refreshes in seconds."""
+
+        self._offsets = deque(maxlen=OFFSET_SAMPLES)
+        self._metrics: Optional[Dict[str, float]] = None
+
+    @property
+    def offset(self) -> Optional[float]:
+        """Estimated offset of the watchdog clock from the buffer clock."""
+
+        return min(self._offsets) if self._offsets else None
+
+    def update(
+        self, timestamp: Optional[float], metrics: Dict[str, float], now: float
+    ) -> bool:
+        """Records a received sample.
+
+        :param timestamp: Exposition timestamp of the sample, None if the
+            buffer does not expose timestamps.
+        :param metrics: Values of the sample.
+        :param now: Wall time the sample is received at.
+        :return: Whether the sample is new, i.e. it is refreshed since
+            the previous one, has other values or has no timestamp.
+        """
+
+        previous, self._metrics = self._metrics, metrics
+        if timestamp is None:
+            return True
+
+        # the sample may be received any time after the refresh
+        self._offsets.append(now - timestamp)
+        if self.timestamp is not None and timestamp <= self.timestamp:
+            return metrics != previous
+
+        if self.timestamp is not None:
+            elapsed = timestamp - self.timestamp
+            self.period = elapsed if self.period is None else min(self.period, elapsed)
+        self.timestamp = timestamp
+        return True
+
+    def next_refresh(self, after: float, deadline: float) -> Optional[float]:
+        """Returns the wall time of the latest refresh expected after ``after``
+        and not later than ``deadline``, or of the first one after ``after``
+        if none is expected until the deadline.
+
+        :return: None if the refresh period is unknown.
+        """
+
+        if self.period is None:
+            return None
+
+        start = self.timestamp + self.offset
+        refreshes = math.floor((deadline - start) / self.period)
+        first = math.floor((after - start) / self.period) + 1
+        return start + max(refreshes, first) * self.period
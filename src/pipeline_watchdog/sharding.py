@@ -0,0 +1,68 @@
+import asyncio
+import fcntl
+import os
+import zlib
+from contextlib import asynccontextmanager
+from typing import Dict, List, TypeVar
+
+T = TypeVar('T')
+
+
+def get_shard(key: str, shards: int) -> int:
+    """Returns the shard of the key by rendezvous hashing.
+
+    The shard is stable across restarts, and when the number of shards
+    changes only the keys of the added or removed shards move.
+    """
+
+    return max(range(shards), key=lambda x: zlib.crc32(f'{x}/{key}'.encode()))
+
+
+def assign_shards(items: Dict[str, T], shards: int) -> List[Dict[str, T]]:
+    """Splits the items by the shard of their key."""
+
+    assigned = [{} for _ in range(shards)]
+    for key, item in items.items():
+        assigned[get_shard(key, shards)][key] = item
+    return assigned
+
+
+class ActionLane:
+    """Serializes actions on a container across processes.
+
+    Each container has a lock file in the lane directory, the lock is held
+    with ``flock`` while the action is applied and is released by the OS
+    if the process holding it dies.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.05):
+        """
+        :param path: Directory of the lock files shared by the processes.
+        :param poll_interval: Interval in seconds to retry a held lock.
+        """
+
+        self._path = path
+        self._poll_interval = poll_interval
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @asynccontextmanager
+    async def hold(self, container_id: str):
+        """Waits until no other process applies an action to the container."""
+
+        fd = os.open(
+            os.path.join(self._path, f'{container_id}.lock'), os.O_CREAT | os.O_RDWR
+        )
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(self._poll_interval)
+            yield
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
@@ -0,0 +1,302 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{k}="{escape_label_value(v)}"' for k, v in zip(names, values))
+    return f'{{{pairs}}}'
+
+
+class Value:
+    """Value of a counter or gauge series."""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class HistogramValue:
+    """Observations of a histogram series counted per bucket."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # the last count is for observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        """Observes the duration of the block, including failed ones."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Metric:
+    """Metric family with a series per label values."""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _create_value(self):
+        return Value()
+
+    def labels(self, *values: str):
+        """Returns the series with the label values, creating it if needed."""
+
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f'Metric {self.name} expects labels {self.labelnames}, got {values}'
+                )
+            series = self._series[values] = self._create_value()
+        return series
+
+    def remove(self, *values: str):
+        self._series.pop(values, None)
+
+    def series(self) -> list:
+        """Returns all series of the metric."""
+
+        return list(self._series.values())
+
+    def expose(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        for values, series in self._series.items():
+            labels = format_labels(self.labelnames, values)
+            lines.append(f'{self.name}{labels} {format_value(series.value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _create_value(self):
+        return HistogramValue(self.buckets)
+
+    def expose(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        names = self.labelnames + ('le',)
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series.counts):
+                cumulative += count
+                labels = format_labels(names, values + (format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {format_value(series.sum)}')
+            lines.append(f'{self.name}_count{labels} {series.count}')
+        return lines
+
+
+class Registry:
+    """Collection of metrics exposed in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def expose(self) -> str:
+        lines = [x for metric in self._metrics.values() for x in metric.expose()]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+SCRAPE_DURATION = REGISTRY.histogram(
+    'watchdog_scrape_duration_seconds',
+    'Time to retrieve and parse the buffer metrics.',
+    ('buffer',),
+)
+PARSE_DURATION = REGISTRY.histogram(
+    'watchdog_parse_duration_seconds',
+    'Time spent parsing the buffer metrics within a scrape.',
+    ('buffer',),
+)
+SCRAPE_ERRORS = REGISTRY.counter(
+    'watchdog_scrape_errors_total',
+    'Number of failed retrievals of the buffer metrics.',
+    ('buffer',),
+)
+CHECK_DELAY = REGISTRY.histogram(
+    'watchdog_check_delay_seconds',
+    'Delay of the buffer checks behind their polling schedule.',
+    ('buffer',),
+)
+CHECKS_SKIPPED = REGISTRY.counter(
+    'watchdog_checks_skipped_total',
+    'Number of checks skipped on a sample unchanged since the previous check.',
+    ('buffer',),
+)
+BUFFER_SIZE = REGISTRY.gauge(
+    'watchdog_buffer_size',
+    'Last observed number of messages in the buffer.',
+    ('buffer', 'series'),
+)
+BUFFER_IDLE = REGISTRY.gauge(
+    'watchdog_buffer_idle_seconds',
+    'Last observed time since the last message of the buffer flow.',
+    ('buffer', 'series', 'flow'),
+)
+ACTIONS = REGISTRY.counter(
+    'watchdog_actions_total',
+    'Number of actions fired on violated conditions.',
+    ('buffer', 'condition', 'action'),
+)
+ACTIONS_SUPPRESSED = REGISTRY.counter(
+    'watchdog_actions_suppressed_total',
+    'Number of actions on containers suppressed by the action budget.',
+    ('action',),
+)
+ACTIONS_COALESCED = REGISTRY.counter(
+    'watchdog_actions_coalesced_total',
+    'Number of actions on containers merged into or skipped for another action.',
+    ('action',),
+)
+ACTION_DURATION = REGISTRY.histogram(
+    'watchdog_action_duration_seconds',
+    'Time to apply an action to all matching containers.',
+    ('action',),
+)
+DOCKER_REQUEST_DURATION = REGISTRY.histogram(
+    'watchdog_docker_request_duration_seconds',
+    'Latency of the Docker API requests.',
+    ('operation',),
+)
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    'watchdog_event_loop_lag_seconds',
+    'Delay of the event loop in waking up a sleeping task.',
+)
+LEADER = REGISTRY.gauge(
+    'watchdog_leader',
+    'Whether the instance holds the leader lease and applies actions.',
+)
+
+
+async def start_metrics_server(
+    host: str, port: int, registry: Registry = REGISTRY
+) -> 'web.AppRunner':
+    """Serves the metrics on ``/metrics`` in the running event loop.
+
+    :return: Runner to stop the server with ``cleanup()``.
+    """
+
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.expose().encode(), headers={'Content-Type': CONTENT_TYPE}
+        )
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -1,5 +1,7 @@
+import importlib.util
 import logging
 import sys
+from types import ModuleType
 
 seconds_per_unit = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
 
@@ -20,3 +22,25 @@ def convert_to_seconds(s: str):
         raise ValueError('Invalid input')
 
     return seconds
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Returns the module, which is loaded on the first access to its attributes.
+
+    Heavy dependencies that are not needed to load the configuration are
+    imported lazily, so that processes not using them start faster.
+    """
+
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
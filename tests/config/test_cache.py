@@ -0,0 +1,68 @@
+import os
+from unittest import mock
+
+from src.pipeline_watchdog.config import Action, QueueConfig, WatchConfig
+from src.pipeline_watchdog.config.cache import ConfigCache
+from src.pipeline_watchdog.config.config import Config
+
+
+def create_config(length: int) -> Config:
+    queue = QueueConfig(
+        action=Action.RESTART,
+        length=length,
+        cooldown=60,
+        polling_interval=10,
+        container_labels=[['label1']],
+    )
+    return Config([WatchConfig('buffer1:8000', queue, None, None)])
+
+
+def test_cache(tmpdir):
+    config_file = tmpdir.join('config.yml')
+    config_file.write('watch: []')
+    cache = ConfigCache(str(tmpdir.join('cache')))
+    key = cache.get_key(str(config_file))
+    assert cache.get(key) is None
+
+    cache.put(key, create_config(10))
+
+    assert cache.get(key) == create_config(10)
+    assert cache.get_key(str(config_file)) == key
+
+    config_file.write('watch: [1]')
+    changed_key = cache.get_key(str(config_file))
+    assert changed_key != key
+    assert cache.get(changed_key) is None
+
+    # only the config of the last key is kept
+    cache.put(changed_key, create_config(20))
+    assert cache.get(key) is None
+    assert cache.get(changed_key) == create_config(20)
+
+
+def test_cache_key_environment(tmpdir):
+    plain_file = tmpdir.join('plain.yml')
+    plain_file.write('watch: []')
+    interpolated_file = tmpdir.join('interpolated.yml')
+    interpolated_file.write('watch: ${oc.env:WATCH}')
+
+    keys = []
+    for value in ('a', 'b'):
+        with mock.patch.dict(os.environ, {'WATCH': value}):
+            keys.append(
+                (
+                    ConfigCache.get_key(str(plain_file)),
+                    ConfigCache.get_key(str(interpolated_file)),
+                )
+            )
+
+    # the environment is a part of the key of the file with interpolations
+    assert keys[0][0] == keys[1][0]
+    assert keys[0][1] != keys[1][1]
+
+
+def test_cache_invalid(tmpdir):
+    cache = ConfigCache(str(tmpdir))
+    tmpdir.join('key.config.pickle').write('invalid')
+
+    assert cache.get('key') is None
@@ -3,8 +3,16 @@ import os
 import pytest
 from omegaconf import ListConfig
 
-from src.pipeline_watchdog.config import WatchConfig
+from src.pipeline_watchdog.config import (
+    Action,
+    RuleConfig,
+    ThroughputConfig,
+    UnreachableConfig,
+    WatchConfig,
+)
 from src.pipeline_watchdog.config.parser import ConfigParser
+from src.pipeline_watchdog.config.rule import Rule
+from tests.conftest import create_tmp_config_file
 
 
 def test_parse(config_file_path, watch_config):
@@ -38,7 +46,11 @@ def test_parse(config_file_path, watch_config):
 
     # check optional fields
     assert config.watch_configs[1] == WatchConfig(
-        buffer='buffer2:8002', queue=None, egress=None, ingress=None
+        buffer='buffer2:8002',
+        queue=None,
+        egress=None,
+        ingress=None,
+        metric_labels={'adapter': 'buffer2', 'source_id': 'source-1'},
     )
 
 
@@ -64,3 +76,383 @@ def test_parse_empty_labels(invalid_config_with_empty_labels):
         match='Container labels cannot be empty.',
     ):
         ConfigParser(invalid_config_with_empty_labels).parse()
+
+
+@pytest.mark.parametrize(
+    'metric_labels, expected',
+    [
+        (None, {}),
+        ('adapter=buffer', {'adapter': 'buffer'}),
+        (['adapter=buffer', 'empty='], {'adapter': 'buffer', 'empty': ''}),
+    ],
+)
+def test_parse_metric_labels(tmpdir, metric_labels, expected):
+    watch = {'buffer': 'buffer1:8000'}
+    if metric_labels is not None:
+        watch['metric_labels'] = metric_labels
+    config_file_path = create_tmp_config_file(tmpdir, {'watch': [watch]})
+
+    config = ConfigParser(config_file_path).parse()
+
+    assert config.watch_configs[0].metric_labels == expected
+
+
+@pytest.mark.parametrize('metric_labels', ['adapter', ['adapter=buffer', '=buffer']])
+def test_parse_invalid_metric_labels(tmpdir, metric_labels):
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'metric_labels': metric_labels}]}
+    )
+
+    with pytest.raises(
+        ValueError, match='Metric label ".*" must be in the format name=value.'
+    ):
+        ConfigParser(config_file_path).parse()
+
+
+def test_parse_unreachable(tmpdir):
+    config_file_path = create_tmp_config_file(
+        tmpdir,
+        {
+            'watch': [
+                {
+                    'buffer': 'buffer1:8000',
+                    'unreachable': {
+                        'action': 'stop',
+                        'duration': '1m',
+                        'cooldown': '30s',
+                        'concurrency': 2,
+                        'timeout': '20s',
+                        'container': [{'labels': 'label1'}],
+                    },
+                }
+            ]
+        },
+    )
+
+    config = ConfigParser(config_file_path).parse()
+
+    assert config.watch_configs[0].unreachable == UnreachableConfig(
+        action=Action.STOP,
+        duration=60,
+        cooldown=30,
+        container_labels=[['label1']],
+        concurrency=2,
+        timeout=20,
+    )
+
+
+@pytest.mark.parametrize(
+    'unreachable, error',
+    [
+        ({'action': 'stop'}, 'Field ".*" must be specified in the watch config.'),
+        (
+            {'action': 'stop', 'duration': '1m', 'cooldown': '1m', 'container': []},
+            'Container labels cannot be empty.',
+        ),
+    ],
+)
+def test_parse_invalid_unreachable(tmpdir, unreachable, error):
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'unreachable': unreachable}]}
+    )
+
+    with pytest.raises(ValueError, match=error):
+        ConfigParser(config_file_path).parse()
+
+
+@pytest.mark.parametrize(
+    'section, error',
+    [
+        ({'concurrency': 0}, 'Concurrency "0" must be a positive integer.'),
+        ({'concurrency': -1}, 'Concurrency "-1" must be a positive integer.'),
+        ({'concurrency': 1.5}, 'Concurrency "1.5" must be a positive integer.'),
+        ({'concurrency': 'all'}, 'Concurrency "all" must be a positive integer.'),
+        ({'timeout': '0s'}, 'Timeout "0s" must be positive.'),
+    ],
+)
+@pytest.mark.parametrize('name', ['queue', 'egress', 'unreachable'])
+def test_parse_invalid_action_limits(tmpdir, name, section, error):
+    config = {
+        'action': 'restart',
+        'length': 10,
+        'idle': '10s',
+        'duration': '10s',
+        'cooldown': '10s',
+        'polling_interval': '10s',
+        'container': [{'labels': 'label1'}],
+        **section,
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', name: config}]}
+    )
+
+    with pytest.raises(ValueError, match=error):
+        ConfigParser(config_file_path).parse()
+
+
+@pytest.mark.parametrize(
+    'growth, expected',
+    [
+        ({}, (None, None)),
+        ({'time_to_full': '1m'}, (60, 50)),
+        ({'time_to_full': '1m', 'growth_window': '2m'}, (60, 120)),
+    ],
+)
+def test_parse_queue_growth(tmpdir, growth, expected):
+    queue = {
+        'action': 'restart',
+        'length': 100,
+        'cooldown': '1m',
+        'polling_interval': '10s',
+        'container': [{'labels': 'label1'}],
+        **growth,
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'queue': queue}]}
+    )
+
+    config = ConfigParser(config_file_path).parse()
+
+    queue_config = config.watch_configs[0].queue
+    assert (queue_config.time_to_full, queue_config.growth_window) == expected
+
+
+def test_parse_throughput(tmpdir):
+    throughput = {
+        'action': 'restart',
+        'cooldown': '1m',
+        'polling_interval': '10s',
+        'min_rate': 5,
+        'min_ratio': 0.5,
+        'egress_metric': 'pushed_messages_total',
+        'container': [{'labels': 'label1'}],
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'throughput': throughput}]}
+    )
+
+    config = ConfigParser(config_file_path).parse()
+
+    assert config.watch_configs[0].throughput == ThroughputConfig(
+        action=Action.RESTART,
+        cooldown=60,
+        polling_interval=10,
+        window=50,
+        container_labels=[['label1']],
+        min_rate=5.0,
+        min_ratio=0.5,
+        egress_metric='pushed_messages_total',
+        ingress_metric='received_messages_total',
+    )
+
+
+@pytest.mark.parametrize(
+    'limits, error',
+    [
+        ({}, 'Throughput config must include min_rate or min_ratio.'),
+        ({'min_rate': 0}, 'Min rate "0.0" must be positive.'),
+        ({'min_ratio': 1.5}, r'Min ratio "1.5" must be in \(0, 1\].'),
+        ({'min_rate': 1, 'window': '0s'}, 'Window "0s" must be positive.'),
+    ],
+)
+def test_parse_invalid_throughput(tmpdir, limits, error):
+    throughput = {
+        'action': 'restart',
+        'cooldown': '1m',
+        'polling_interval': '10s',
+        'container': [{'labels': 'label1'}],
+        **limits,
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'throughput': throughput}]}
+    )
+
+    with pytest.raises(ValueError, match=error):
+        ConfigParser(config_file_path).parse()
+
+
+@pytest.mark.parametrize('condition', ['queue', 'egress', 'ingress'])
+def test_parse_min_polling_interval(tmpdir, condition):
+    watch = {
+        'action': 'restart',
+        'length': 100,
+        'idle': '1m',
+        'cooldown': '1m',
+        'polling_interval': '30s',
+        'min_polling_interval': '2s',
+        'container': [{'labels': 'label1'}],
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', condition: watch}]}
+    )
+
+    config = ConfigParser(config_file_path).parse()
+
+    assert getattr(config.watch_configs[0], condition).min_polling_interval == 2
+
+
+@pytest.mark.parametrize(
+    'min_polling_interval, error',
+    [
+        ('0s', 'Min polling interval "0s" must be positive.'),
+        ('1m', 'Min polling interval "60" cannot exceed polling interval "30".'),
+    ],
+)
+def test_parse_invalid_min_polling_interval(tmpdir, min_polling_interval, error):
+    queue = {
+        'action': 'restart',
+        'length': 100,
+        'cooldown': '1m',
+        'polling_interval': '30s',
+        'min_polling_interval': min_polling_interval,
+        'container': [{'labels': 'label1'}],
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'queue': queue}]}
+    )
+
+    with pytest.raises(ValueError, match=error):
+        ConfigParser(config_file_path).parse()
+
+
+@pytest.mark.parametrize('condition', ['queue', 'egress', 'ingress'])
+def test_parse_trigger_after(tmpdir, condition):
+    watch = {
+        'action': 'restart',
+        'length': 100,
+        'idle': '1m',
+        'cooldown': '1m',
+        'polling_interval': '30s',
+        'trigger_after': 3,
+        'recover_after': 2,
+        'container': [{'labels': 'label1'}],
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', condition: watch}]}
+    )
+
+    config = ConfigParser(config_file_path).parse()
+
+    assert getattr(config.watch_configs[0], condition).trigger_after == 3
+    assert getattr(config.watch_configs[0], condition).recover_after == 2
+
+
+@pytest.mark.parametrize(
+    'field, value, error',
+    [
+        ('trigger_after', 0, 'Trigger after "0" must be a positive integer.'),
+        ('recover_after', '2', 'Recover after "2" must be a positive integer.'),
+    ],
+)
+def test_parse_invalid_trigger_after(tmpdir, field, value, error):
+    queue = {
+        'action': 'restart',
+        'length': 100,
+        'cooldown': '1m',
+        'polling_interval': '30s',
+        field: value,
+        'container': [{'labels': 'label1'}],
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'queue': queue}]}
+    )
+
+    with pytest.raises(ValueError, match=error):
+        ConfigParser(config_file_path).parse()
+
+
+def test_parse_rules(tmpdir):
+    rules = [
+        {
+            'name': 'slow-drain',
+            'expr': 'buffer_size > 800 and rate(pushed_messages_total) < 5',
+            'action': 'restart',
+            'cooldown': '1m',
+            'polling_interval': '10s',
+            'trigger_after': 2,
+            'container': [{'labels': 'label1'}],
+        },
+        {
+            'name': 'stalled',
+            'expr': 'age(last_sent_message) > 100',
+            'action': 'stop',
+            'cooldown': '1m',
+            'polling_interval': '10s',
+            'window': '2m',
+            'timeout': '20s',
+            'container': [{'labels': 'label2'}],
+        },
+    ]
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'rules': rules}]}
+    )
+
+    config = ConfigParser(config_file_path).parse()
+
+    assert config.watch_configs[0].rules == [
+        RuleConfig(
+            name='slow-drain',
+            rule=Rule('buffer_size > 800 and rate(pushed_messages_total) < 5'),
+            action=Action.RESTART,
+            cooldown=60,
+            polling_interval=10,
+            window=50,
+            container_labels=[['label1']],
+            trigger_after=2,
+        ),
+        RuleConfig(
+            name='stalled',
+            rule=Rule('age(last_sent_message) > 100'),
+            action=Action.STOP,
+            cooldown=60,
+            polling_interval=10,
+            window=120,
+            container_labels=[['label2']],
+            timeout=20,
+        ),
+    ]
+
+
+@pytest.mark.parametrize(
+    'names, expr, error',
+    [
+        (['a', 'a'], 'buffer_size > 1', 'Rule name "a" is duplicated.'),
+        (['a'], 'buffer_size >', 'Rule "buffer_size >" is invalid: invalid syntax.'),
+        (['a'], 'len(x) > 1', 'Rule "len.*" is invalid: function len is not one'),
+    ],
+)
+def test_parse_invalid_rules(tmpdir, names, expr, error):
+    rules = [
+        {
+            'name': name,
+            'expr': expr,
+            'action': 'restart',
+            'cooldown': '1m',
+            'polling_interval': '10s',
+            'container': [{'labels': 'label1'}],
+        }
+        for name in names
+    ]
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'rules': rules}]}
+    )
+
+    with pytest.raises(ValueError, match=error):
+        ConfigParser(config_file_path).parse()
+
+
+def test_parse_invalid_unit(tmpdir):
+    queue = {
+        'action': 'restart',
+        'length': 100,
+        'cooldown': '1x',
+        'polling_interval': '10s',
+        'container': [{'labels': 'label1'}],
+    }
+    config_file_path = create_tmp_config_file(
+        tmpdir, {'watch': [{'buffer': 'buffer1:8000', 'queue': queue}]}
+    )
+
+    # an error of a present field is not reported as a missing one
+    with pytest.raises(KeyError, match='x'):
+        ConfigParser(config_file_path).parse()
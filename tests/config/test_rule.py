@@ -0,0 +1,76 @@
+import math
+import pickle
+
+import pytest
+
+from src.pipeline_watchdog.config.rule import Rule
+
+
+def constant(value):
+    return lambda name: value
+
+
+@pytest.mark.parametrize(
+    'expr, metrics, rate, expected',
+    [
+        ('buffer_size > 800 and rate(pushed) < 5', {'buffer_size': 900}, 1, True),
+        ('buffer_size > 800 and rate(pushed) < 5', {'buffer_size': 900}, 10, False),
+        ('buffer_size > 800 and rate(pushed) < 5', {'buffer_size': 100}, 1, False),
+        (
+            'not buffer_size / capacity <= 0.5',
+            {'buffer_size': 6, 'capacity': 10},
+            0,
+            True,
+        ),
+        ('-buffer_size + 1 < 0 or rate(pushed) == 0', {'buffer_size': 0}, 0, True),
+        ('0 < buffer_size < 10', {'buffer_size': 10}, 0, False),
+        # unknown rates fail every comparison
+        ('rate(pushed) < 5', {}, math.nan, False),
+    ],
+)
+def test_rule_evaluate(expr, metrics, rate, expected):
+    rule = Rule(expr)
+
+    assert rule.evaluate(metrics, constant(rate), constant(0), constant(0)) is expected
+
+
+def test_rule_functions():
+    rule = Rule('buffer_size > 1 and slope(buffer_size) > 0 or age(last_sent) > 60')
+
+    assert rule.metric_names == ('buffer_size', 'last_sent')
+    assert rule.functions == ('slope', 'age')
+    # the functions are called with the metric names
+    assert rule.evaluate({'buffer_size': 0}, str, str, lambda name: len(name) * 10)
+
+
+def test_rule_missing_metric():
+    with pytest.raises(KeyError, match='buffer_size'):
+        Rule('buffer_size > 1').evaluate({}, str, str, str)
+
+
+@pytest.mark.parametrize(
+    'expr, error',
+    [
+        ('buffer_size >', 'invalid syntax'),
+        ('__import__("os")', 'function __import__ is not one of rate, slope, age'),
+        ('buffer.size > 1', 'Attribute is not supported'),
+        ('buffer_size ** 2 > 1', 'BinOp is not supported'),
+        ('buffer_size in (1, 2)', 'Compare is not supported'),
+        ('buffer_size > "1"', "constant '1' is not a number"),
+        ('rate(1) > 1', 'function rate takes a metric name'),
+        ('rate > 1', 'function rate must be called'),
+    ],
+)
+def test_rule_invalid(expr, error):
+    with pytest.raises(ValueError, match=f'Rule ".*" is invalid: {error}'):
+        Rule(expr)
+
+
+def test_rule_pickle():
+    rule = Rule('rate(pushed) < 5')
+
+    unpickled = pickle.loads(pickle.dumps(rule))
+
+    assert unpickled == rule
+    assert unpickled.metric_names == ('pushed',)
+    assert unpickled.evaluate({}, constant(1), str, str)
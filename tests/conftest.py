@@ -18,6 +18,8 @@ def watch_config() -> WatchConfig:
             cooldown=60,
             polling_interval=10,
             container_labels=[['label1', 'label2=2'], ['some-label']],
+            concurrency=4,
+            timeout=30,
         ),
         egress=FlowConfig(
             action=Action.STOP,
@@ -0,0 +1,2 @@
+# Module loaded by test_lazy_import
+LOADED = True
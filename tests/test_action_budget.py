@@ -0,0 +1,66 @@
+from unittest import mock
+
+import pytest
+
+from src.pipeline_watchdog.action_budget import ActionBudget, take_token
+
+
+@pytest.mark.parametrize(
+    'bucket, now, expected',
+    [
+        (None, 100, [2, 100]),
+        ([1.5, 100], 100, [0.5, 100]),
+        ([0.5, 100], 100, None),
+        # a token is refilled every 20 seconds
+        ([0.5, 100], 110, [0, 110]),
+        ([0, 100], 1000, [2, 1000]),
+        ([0.5, 100], 50, None),
+    ],
+)
+def test_take_token(bucket, now, expected):
+    assert take_token(bucket, 3, 60, now) == expected
+
+
+@mock.patch('time.time', return_value=1000)
+def test_action_budget(time_mock):
+    budget = ActionBudget(3, 2, 60)
+    labels1 = [['app=a']]
+    labels2 = [['app=b']]
+
+    assert budget.try_take(labels1)
+    assert budget.try_take(labels1)
+    # the label sets budget is exhausted
+    assert not budget.try_take(labels1)
+    assert budget.try_take(labels2)
+    # the global budget is exhausted
+    assert not budget.try_take(labels2)
+
+    time_mock.return_value = 1020
+
+    assert budget.try_take(labels2)
+    assert not budget.try_take(labels1)
+
+
+@mock.patch('time.time', return_value=1000)
+def test_action_budget_per_labels_only(time_mock):
+    budget = ActionBudget(0, 1, 60)
+
+    assert budget.try_take([['app=a']])
+    assert not budget.try_take([['app=a']])
+    assert budget.try_take([['app=b']])
+
+
+@mock.patch('time.time', return_value=1000)
+def test_action_budget_shared(time_mock, tmpdir):
+    path = str(tmpdir / 'budget.json')
+    # budgets of different processes share the file
+    budgets = [ActionBudget(2, 0, 60, path) for _ in range(2)]
+
+    assert budgets[0].try_take([['app=a']])
+    assert budgets[1].try_take([['app=b']])
+    assert not budgets[0].try_take([['app=c']])
+
+    # a corrupted state resets the budget
+    (tmpdir / 'budget.json').write('invalid')
+
+    assert budgets[1].try_take([['app=a']])
@@ -0,0 +1,103 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src.pipeline_watchdog.action_coalescer import ActionCoalescer
+from src.pipeline_watchdog.config import Action
+
+
+@pytest.mark.asyncio
+async def test_submit_merged():
+    coalescer = ActionCoalescer(0.01)
+    restart1 = AsyncMock(return_value='restarted')
+    restart2 = AsyncMock(return_value='restarted again')
+    other = AsyncMock(return_value='other')
+
+    results = await asyncio.gather(
+        coalescer.submit('container1', Action.RESTART, restart1),
+        coalescer.submit('container1', Action.RESTART, restart2),
+        coalescer.submit('container2', Action.RESTART, other),
+    )
+
+    # the first request of a container is applied for the merged ones
+    assert results == ['restarted', 'restarted', 'other']
+    restart1.assert_awaited_once()
+    restart2.assert_not_awaited()
+    other.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'actions', [[Action.RESTART, Action.STOP], [Action.STOP, Action.RESTART]]
+)
+async def test_submit_stop_supersedes_restart(actions):
+    coalescer = ActionCoalescer(0.01)
+    applies = {x: AsyncMock(return_value=x.value) for x in actions}
+
+    results = await asyncio.gather(
+        *[coalescer.submit('container1', x, applies[x]) for x in actions]
+    )
+
+    assert results == ['stop', 'stop']
+    applies[Action.STOP].assert_awaited_once()
+    applies[Action.RESTART].assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_submit_running():
+    coalescer = ActionCoalescer(0)
+    released = asyncio.Event()
+
+    async def restart():
+        await released.wait()
+        return 'restarted'
+
+    stop = AsyncMock()
+    first = asyncio.create_task(coalescer.submit('container1', Action.RESTART, restart))
+    await asyncio.sleep(0.01)
+    # the container is being restarted
+    second = asyncio.create_task(coalescer.submit('container1', Action.STOP, stop))
+    await asyncio.sleep(0.01)
+    released.set()
+
+    assert await first == 'restarted'
+    assert await second == 'restarted'
+    stop.assert_not_awaited()
+
+    # the next action on the container is applied
+    await coalescer.submit('container1', Action.STOP, stop)
+    stop.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_submit_error():
+    coalescer = ActionCoalescer(0)
+    restart = AsyncMock(side_effect=RuntimeError('error'))
+
+    results = await asyncio.gather(
+        coalescer.submit('container1', Action.RESTART, restart),
+        coalescer.submit('container1', Action.RESTART, restart),
+        return_exceptions=True,
+    )
+
+    assert [str(x) for x in results] == ['error', 'error']
+    restart.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_submit_cancelled():
+    coalescer = ActionCoalescer(10)
+    restart = AsyncMock()
+    task = asyncio.create_task(coalescer.submit('container1', Action.RESTART, restart))
+    await asyncio.sleep(0)
+    # a cancelled request does not cancel the merged action
+    task.cancel()
+    other = asyncio.create_task(coalescer.submit('container1', Action.RESTART, restart))
+    await asyncio.sleep(0)
+
+    coalescer.close()
+
+    with pytest.raises(asyncio.CancelledError):
+        await other
+    restart.assert_not_awaited()
@@ -2,80 +2,317 @@ from unittest import mock
 from unittest.mock import AsyncMock, MagicMock, call
 
 import pytest
-from aiohttp import ClientResponse
+from aiohttp import ClientResponse, ClientTimeout
 
-from src.pipeline_watchdog.buffer_metrics import get_metrics, parse_metrics
+from src.pipeline_watchdog.buffer_metrics import (
+    MetricsClient,
+    MetricsParser,
+    Samples,
+    to_labels,
+)
+from src.pipeline_watchdog.telemetry import SCRAPE_DURATION, SCRAPE_ERRORS
+
+
+class StreamMock:
+    def __init__(self, content: bytes):
+        self.lines = content.splitlines(keepends=True)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.lines:
+            raise StopAsyncIteration
+        return self.lines.pop(0)
+
+    async def read(self):
+        rest = b''.join(self.lines)
+        self.lines = []
+        return rest
 
 
 @pytest.mark.asyncio
+@mock.patch('aiohttp.TCPConnector')
 @mock.patch('aiohttp.ClientSession', new_callable=MagicMock)
-async def test_get_metrics(session_mock: MagicMock):
-    session = session_mock()
-    response_mock = MagicMock(ClientResponse)
-    response = response_mock()
+async def test_scrape_session_reused(session_mock, connector_mock):
+    session = session_mock.return_value
+    session.closed = False
+    response_mock = MagicMock()
+    session.get = response_mock
+    response = response_mock.return_value.__aenter__.return_value
+    response.content = StreamMock(CONTENT)
 
-    session_in_with = session.__aenter__.return_value
-    session_in_with.get = response_mock
-    response_in_with: AsyncMock = response.__aenter__.return_value
-    response_in_with.text = AsyncMock(return_value='content')
+    client = MetricsClient(
+        connect_timeout=1, read_timeout=2, limit_per_host=3, dns_cache_ttl=4
+    )
 
-    result = await get_metrics('localhost:8080')
+    await client.scrape('localhost:8080', [('buffer_size', ())])
+    await client.scrape('localhost:8081', [('buffer_size', ())])
 
-    assert result == 'content'
-    assert response_mock.call_count == 2
-    assert response_mock.call_args_list[0] == call()  # initial call in test itself
-    assert response_mock.call_args_list[1] == call('http://localhost:8080/metrics')
+    # the session is created once and reused for all scrapes
+    connector_mock.assert_called_once_with(limit=100, limit_per_host=3, ttl_dns_cache=4)
+    session_mock.assert_called_once_with(
+        connector=connector_mock.return_value,
+        timeout=ClientTimeout(total=15, sock_connect=1, sock_read=2),
+    )
+    assert response_mock.call_args_list == [
+        call('http://localhost:8080/metrics'),
+        call('http://localhost:8081/metrics'),
+    ]
 
 
 @pytest.mark.asyncio
-async def test_get_metrics_session_exception():
+async def test_scrape_session_exception():
     with mock.patch('aiohttp.ClientSession', side_effect=RuntimeError('error')):
         with pytest.raises(RuntimeError, match='error'):
-            await get_metrics('localhost:8080')
+            await MetricsClient().scrape('localhost:8080', [('buffer_size', ())])
 
 
 @pytest.mark.asyncio
+@mock.patch('aiohttp.TCPConnector')
 @mock.patch('aiohttp.ClientSession', new_callable=MagicMock)
-async def test_get_metrics_response_exception(session_mock):
+async def test_scrape_response_exception(session_mock, connector_mock):
+    session = session_mock.return_value
+    session.closed = False
+    session.get = MagicMock(ClientResponse, side_effect=RuntimeError('error'))
+    errors = SCRAPE_ERRORS.labels('localhost:8080')
+    errors_before = errors.value
+
     with pytest.raises(RuntimeError, match='error'):
-        session = session_mock()
-        response_mock = MagicMock(ClientResponse, side_effect=RuntimeError('error'))
+        await MetricsClient().scrape('localhost:8080', [('buffer_size', ())])
 
-        session_in_with = session.__aenter__.return_value
-        session_in_with.get = response_mock
+    assert errors.value == errors_before + 1
 
-        await get_metrics('localhost:8080')
+
+@pytest.mark.asyncio
+@mock.patch('aiohttp.TCPConnector')
+@mock.patch('aiohttp.ClientSession', new_callable=MagicMock)
+async def test_close(session_mock, connector_mock):
+    session = session_mock.return_value
+    session.closed = False
+    session.close = AsyncMock()
+    session.get = MagicMock(side_effect=RuntimeError('error'))
+    client = MetricsClient()
+
+    with pytest.raises(RuntimeError, match='error'):
+        await client.scrape('localhost:8080', [('buffer_size', ())])
+    await client.close()
+
+    session.close.assert_awaited_once()
 
 
 @pytest.mark.asyncio
+async def test_close_without_session():
+    await MetricsClient().close()
+
+
+CONTENT = b'''# HELP buffer_size Number of messages in the buffer
+# TYPE buffer_size gauge
+buffer_size{adapter="buffer"} 12.0 1720441634544
+# HELP received_messages_total Number of messages received by the adapter
+# TYPE received_messages_total counter
+received_messages_total{adapter="buffer"} 120.0 1720441634544
+last_sent_message{adapter="buffer"} 1.720441634e+09 1720441634544
+invalid_value{adapter="buffer"} abc 1720441634544
+no_labels 1.0 1720441634544
+received_messages_total{adapter="other"} 7.0 1720441634544
+'''
+
+
+ADAPTER = (('adapter', 'buffer'),)
+TIMESTAMP = 1720441634.544
+
+
+def make_samples(*series, timestamp=None) -> Samples:
+    samples = Samples()
+    for name, labels, value in series:
+        samples.add(name, labels, value, timestamp)
+    return samples
+
+
+@pytest.mark.parametrize(
+    'selectors, expected, lines_fed',
+    [
+        (
+            [('buffer_size', ())],
+            make_samples(('buffer_size', ADAPTER, 12.0), timestamp=TIMESTAMP),
+            3,
+        ),
+        (
+            [('buffer_size', ()), ('last_sent_message', ADAPTER)],
+            make_samples(
+                ('buffer_size', ADAPTER, 12.0),
+                ('last_sent_message', ADAPTER, 1.720441634e09),
+                timestamp=TIMESTAMP,
+            ),
+            7,
+        ),
+        (
+            [('received_messages_total', (('adapter', 'other'),))],
+            make_samples(
+                ('received_messages_total', ADAPTER, 120.0),
+                ('received_messages_total', (('adapter', 'other'),), 7.0),
+                timestamp=TIMESTAMP,
+            ),
+            10,
+        ),
+        (
+            [('no_labels', ()), ('buffer_size', ())],
+            make_samples(
+                ('buffer_size', ADAPTER, 12.0),
+                ('no_labels', (), 1.0),
+                timestamp=TIMESTAMP,
+            ),
+            9,
+        ),
+        ([], Samples(), 0),
+    ],
+)
+def test_metrics_parser(selectors, expected, lines_fed):
+    parser = MetricsParser(selectors)
+
+    fed = 0
+    for line in CONTENT.splitlines(keepends=True):
+        if parser.done:
+            break
+        fed += 1
+        parser.feed(line)
+
+    assert parser.samples == expected
+    assert fed == lines_fed
+
+
+def test_metrics_parser_labels():
+    labels_cache = {}
+    parsers = [MetricsParser([('metric', ())], labels_cache) for _ in range(2)]
+
+    for parser in parsers:
+        parser.feed(b'metric{b="2",a="x\\"} y",c=""} 1.0 1720441634544')
+
+    expected = (('a', 'x"} y'), ('b', '2'), ('c', ''))
+    assert parsers[0].samples == make_samples(
+        ('metric', expected, 1.0), timestamp=TIMESTAMP
+    )
+    # equal label sets are parsed once and shared
+    assert list(labels_cache.values()) == [expected]
+    labels = [list(x.samples.series('metric'))[0] for x in parsers]
+    assert labels[0] is labels[1]
+
+
+def test_metrics_parser_no_labels():
+    parser = MetricsParser([('metric', ()), ('other', ())])
+
+    for line in (b'metric 1.0 1720441634544\n', b'metric\n', b'other{} 2.0\n'):
+        parser.feed(line)
+
+    # a sample without labels has the empty label set
+    expected = make_samples(('metric', (), 1.0), timestamp=TIMESTAMP)
+    expected.add('other', (), 2.0)
+    assert parser.samples == expected
+    assert parser.done
+
+
+@pytest.mark.parametrize(
+    'name, matchers, expected',
+    [
+        ('received_messages_total', (), 120.0),
+        ('received_messages_total', ADAPTER, 120.0),
+        ('received_messages_total', (('adapter', 'other'),), 7.0),
+        ('received_messages_total', (('adapter', 'missing'),), None),
+        ('missing', (), None),
+    ],
+)
+def test_samples_get(name, matchers, expected):
+    samples = make_samples(
+        ('buffer_size', ADAPTER, 12.0),
+        ('received_messages_total', ADAPTER, 120.0),
+        ('last_sent_message', ADAPTER, 1.720441634e09),
+        ('received_messages_total', (('adapter', 'other'),), 7.0),
+    )
+
+    if expected is None:
+        with pytest.raises(KeyError):
+            samples.get(name, matchers)
+    else:
+        assert samples.get(name, matchers) == expected
+
+
 @pytest.mark.parametrize(
-    'content, expected',
+    'matchers, expected',
     [
-        ('', {}),
-        ('no metrics', {}),
         (
-            '''
-            # HELP received_messages_total Number of messages received by the adapter
-            # TYPE received_messages_total counter
-            received_messages_total{adapter="buffer"} 120.0 1720441634544
-            # HELP pushed_messages_total Number of messages pushed to the buffer
-            # TYPE pushed_messages_total counter
-            pushed_messages_total{adapter="buffer"} 34.0 1720441634544
-            ''',
-            {'received_messages_total': 120.0, 'pushed_messages_total': 34.0},
+            ADAPTER,
+            {
+                'buffer_size': 12.0,
+                'received_messages_total': 120.0,
+                'last_sent_message': 1.720441634e09,
+            },
         ),
+        ((('adapter', 'other'),), {'received_messages_total': 7.0}),
+        ((('adapter', 'other'), ('source', 'x')), {}),
     ],
 )
-async def test_parse_metrics(content, expected):
-    result = await parse_metrics(content)
+def test_samples_select(matchers, expected):
+    samples = make_samples(
+        ('buffer_size', ADAPTER, 12.0),
+        ('received_messages_total', ADAPTER, 120.0),
+        ('last_sent_message', ADAPTER, 1.720441634e09),
+        ('received_messages_total', (('adapter', 'other'),), 7.0),
+    )
+
+    assert samples.select(matchers) == expected
+
+
+@pytest.mark.parametrize(
+    'line, expected',
+    [
+        (b'metric{a="1"} 1.0 1720441634544', TIMESTAMP),
+        (b'metric{a="1"} 1.0', None),
+        (b'metric{a="1"} 1.0 invalid', None),
+        (b'metric 1.0 1720441634544', TIMESTAMP),
+        (b'metric 1.0', None),
+    ],
+)
+def test_metrics_parser_timestamp(line, expected):
+    parser = MetricsParser([('metric', ())])
+
+    parser.feed(line)
 
-    assert result == expected
+    assert parser.samples.select_timestamp() == expected
+    assert parser.samples.get('metric') == 1.0
+
+
+def test_samples_select_timestamp():
+    samples = Samples()
+    samples.add('buffer_size', ADAPTER, 12.0, 100.0)
+    samples.add('last_sent_message', ADAPTER, 1.0, 101.0)
+    samples.add('buffer_size', (('adapter', 'other'),), 7.0)
+
+    assert samples.select_timestamp(ADAPTER) == 101.0
+    assert samples.select_timestamp((('adapter', 'other'),)) is None
+
+
+def test_to_labels():
+    assert to_labels({'b': '2', 'a': '1'}) == (('a', '1'), ('b', '2'))
 
 
 @pytest.mark.asyncio
-async def test_parse_metrics_invalid_content_type():
-    with pytest.raises(
-        RuntimeError,
-        match='Failed to parse metrics: expected string or bytes-like object',
-    ):
-        await parse_metrics(123)  # type: ignore
+@mock.patch('aiohttp.TCPConnector')
+@mock.patch('aiohttp.ClientSession', new_callable=MagicMock)
+async def test_scrape(session_mock, connector_mock):
+    session = session_mock.return_value
+    session.closed = False
+    response_mock = MagicMock()
+    session.get = response_mock
+    response = response_mock.return_value.__aenter__.return_value
+    response.content = StreamMock(CONTENT)
+    scrapes = SCRAPE_DURATION.labels('localhost:8080')
+    scrapes_before = scrapes.count
+
+    result = await MetricsClient().scrape('localhost:8080', [('buffer_size', ())])
+
+    assert result == make_samples(('buffer_size', ADAPTER, 12.0), timestamp=TIMESTAMP)
+    assert scrapes.count == scrapes_before + 1
+    response_mock.assert_called_once_with('http://localhost:8080/metrics')
+    # the rest of the response is drained
+    assert response.content.lines == []
@@ -0,0 +1,74 @@
+from unittest import mock
+
+import pytest
+
+from src.pipeline_watchdog.circuit_breaker import CircuitBreaker
+
+
+def test_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, jitter=0)
+
+    breaker.record_failure(0)
+    breaker.record_failure(1)
+
+    assert breaker.failures == 2
+    assert not breaker.is_open
+    assert breaker.retry_at is None
+
+    breaker.record_failure(2)
+
+    assert breaker.is_open
+    assert breaker.retry_at == 2 + 10
+
+
+def test_delay_capped():
+    breaker = CircuitBreaker(failure_threshold=1, base_delay=10, max_delay=50, jitter=0)
+    delays = []
+
+    for now in range(6):
+        breaker.record_failure(now)
+        delays.append(breaker.retry_at - now)
+
+    assert delays == [10, 20, 40, 50, 50, 50]
+
+
+@pytest.mark.parametrize('uniform', [0.8, 1.2])
+def test_jitter(uniform):
+    breaker = CircuitBreaker(failure_threshold=1, base_delay=10, jitter=0.2)
+
+    with mock.patch('random.uniform', return_value=uniform) as uniform_mock:
+        breaker.record_failure(0)
+
+    uniform_mock.assert_called_once_with(0.8, 1.2)
+    assert breaker.retry_at == pytest.approx(10 * uniform)
+
+
+def test_jitter_bounds():
+    breaker = CircuitBreaker(failure_threshold=1, base_delay=10, jitter=0.2)
+
+    for _ in range(100):
+        breaker.record_failure(0)
+        breaker.failures = 0
+        assert 8 <= breaker.retry_at <= 12
+
+
+def test_record_success():
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure(0)
+
+    breaker.record_success()
+
+    assert breaker.failures == 0
+    assert not breaker.is_open
+    assert breaker.unreachable_for(100) == 0
+
+
+def test_unreachable_for():
+    breaker = CircuitBreaker()
+
+    assert breaker.unreachable_for(10) == 0
+
+    breaker.record_failure(10)
+    breaker.record_failure(20)
+
+    assert breaker.unreachable_for(35) == 25
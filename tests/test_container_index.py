@@ -0,0 +1,53 @@
+import pytest
+
+from src.pipeline_watchdog.container_index import ContainerIndex
+
+
+@pytest.fixture
+def index() -> ContainerIndex:
+    index = ContainerIndex()
+    index.add('1', {'label1': 'a', 'label2': '2'})
+    index.add('2', {'label1': 'b'})
+    index.add('3', {'label2': '2', 'label3': ''})
+    return index
+
+
+@pytest.mark.parametrize(
+    'labels, expected',
+    [
+        ([], ['1', '2', '3']),
+        (['label1'], ['1', '2']),
+        (['label1=a'], ['1']),
+        (['label2=2'], ['1', '3']),
+        (['label1', 'label2=2'], ['1']),
+        (['label3='], ['3']),
+        (['label1=c'], []),
+        (['label1', 'missing'], []),
+    ],
+)
+def test_find(index, labels, expected):
+    assert index.find(labels) == expected
+
+
+def test_add_existing(index):
+    index.add('1', {'label3': 'x'})
+
+    assert len(index) == 3
+    assert index.find(['label1']) == ['2']
+    assert index.find(['label3']) == ['1', '3']
+
+
+def test_remove(index):
+    index.remove('1')
+    index.remove('missing')
+
+    assert len(index) == 2
+    assert index.find(['label2=2']) == ['3']
+    assert index.find(['label1=a']) == []
+
+
+def test_clear(index):
+    index.clear()
+
+    assert len(index) == 0
+    assert index.find([]) == []
@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import AsyncMock, Mock, call, patch
 
 import pytest
@@ -5,7 +6,11 @@ import pytest_asyncio
 from aiodocker import DockerError
 from aiodocker.containers import DockerContainer, DockerContainers
 
-from src.pipeline_watchdog.run import DockerClient
+from src.pipeline_watchdog.action_budget import ActionBudget
+from src.pipeline_watchdog.config import Action
+from src.pipeline_watchdog.run import ActionStatus, DockerClient, merge_label_sets
+from src.pipeline_watchdog.sharding import ActionLane
+from src.pipeline_watchdog.telemetry import ACTIONS_SUPPRESSED
 
 DOCKER_ERROR = DockerError('status', {'message': 'error'})
 RUNTIME_ERROR = RuntimeError('Test error')
@@ -44,6 +49,51 @@ async def test_get_containers(docker_mock):
     )
 
 
+@pytest.mark.asyncio
+async def test_get_containers_duplicates(docker_mock):
+    container1 = Mock(id='1')
+    container2 = Mock(id='2')
+    container3 = Mock(id='3')
+    containers = Mock(
+        DockerContainers,
+        list=AsyncMock(
+            side_effect=[[container1, container2], [container2, container3]]
+        ),
+    )
+    docker_mock.containers = containers
+
+    client = DockerClient()
+
+    result = await client.get_containers(
+        [['label1'], ['label2'], ['label1=a', 'label3']]
+    )
+
+    assert result == [container1, container2, container3]
+    # the last label set matches a subset of the first one
+    assert containers.list.call_args_list == [
+        call(all=True, filters={'label': ['label1']}),
+        call(all=True, filters={'label': ['label2']}),
+    ]
+
+
+@pytest.mark.parametrize(
+    'container_labels, expected',
+    [
+        ([], []),
+        ([['a'], ['b']], [['a'], ['b']]),
+        ([['a', 'b'], ['a']], [['a']]),
+        ([['a'], ['a', 'b']], [['a']]),
+        ([['a=1'], ['a']], [['a']]),
+        ([['a'], ['a=1']], [['a']]),
+        ([['a=1'], ['a=2']], [['a=1'], ['a=2']]),
+        ([['a', 'b'], ['b', 'a']], [['a', 'b']]),
+        ([['a=1', 'b'], ['a', 'b'], ['c']], [['a', 'b'], ['c']]),
+    ],
+)
+def test_merge_label_sets(container_labels, expected):
+    assert merge_label_sets(container_labels) == expected
+
+
 @pytest.mark.asyncio
 async def test_get_containers_empty_labels(docker_mock):
     containers = Mock(DockerContainers, list=AsyncMock(side_effect=[]))
@@ -149,3 +199,244 @@ async def test_stop_container_exception():
 
     with pytest.raises(RUNTIME_ERROR.__class__, match=str(RUNTIME_ERROR)):
         await DockerClient.stop_container(container)
+
+
+def container_event(action: str, container_id: str) -> dict:
+    return {'Type': 'container', 'Action': action, 'Actor': {'ID': container_id}}
+
+
+@pytest.mark.asyncio
+async def test_watch_containers(docker_mock):
+    listed = [
+        DockerContainer(docker_mock, id='1', Labels={'label1': 'a'}),
+        DockerContainer(docker_mock, id='2', Labels=None),
+    ]
+    created = DockerContainer(
+        docker_mock, id='3', Config={'Labels': {'label1': 'a', 'label2': 'b'}}
+    )
+    containers = Mock(
+        DockerContainers,
+        list=AsyncMock(return_value=listed),
+        get=AsyncMock(side_effect=[created, DOCKER_ERROR]),
+        container=lambda x: x,
+    )
+    docker_mock.containers = containers
+    client = DockerClient()
+    results = []
+    events = [
+        container_event('create', '3'),
+        container_event('destroy', '1'),
+        container_event('create', '4'),
+    ]
+
+    async def get_event():
+        if events:
+            return events.pop(0)
+        results.append(await client.get_containers([['label1=a'], ['label2']]))
+        raise asyncio.CancelledError()
+
+    docker_mock.events = Mock(
+        subscribe=Mock(return_value=Mock(get=get_event)), stop=AsyncMock()
+    )
+
+    with pytest.raises(asyncio.CancelledError):
+        await client.watch_containers()
+
+    # container 3 matches both label sets
+    assert results == [['3']]
+    containers.list.assert_awaited_once_with(all=True)
+    assert containers.get.await_args_list == [call('3'), call('4')]
+    docker_mock.events.subscribe.assert_called_once_with(
+        filters={
+            'type': ['container'],
+            'event': ['create', 'destroy', 'rename', 'update'],
+        }
+    )
+    docker_mock.events.stop.assert_awaited_once()
+
+    # falls back to listing containers when the stream is interrupted
+    await client.get_containers([['label1=a']])
+    containers.list.assert_awaited_with(all=True, filters={'label': ['label1=a']})
+
+
+@pytest.mark.asyncio
+async def test_watch_containers_resubscribe(docker_mock):
+    containers = Mock(DockerContainers, list=AsyncMock(side_effect=[DOCKER_ERROR, []]))
+    docker_mock.containers = containers
+    docker_mock.events = Mock(
+        subscribe=Mock(return_value=Mock(get=AsyncMock(return_value=None))),
+        stop=AsyncMock(),
+    )
+    client = DockerClient()
+
+    with patch('asyncio.sleep', side_effect=[None, asyncio.CancelledError]):
+        with pytest.raises(asyncio.CancelledError):
+            await client.watch_containers()
+
+    assert docker_mock.events.subscribe.call_count == 2
+    assert docker_mock.events.stop.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_watch_containers_cancelled_on_stop(docker_mock):
+    docker_mock.containers = Mock(DockerContainers, list=AsyncMock(return_value=[]))
+    stopping = asyncio.Event()
+
+    async def stop():
+        # the events stream swallows the cancellation of its task
+        stopping.set()
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            pass
+
+    docker_mock.events = Mock(
+        subscribe=Mock(return_value=Mock(get=AsyncMock(side_effect=DOCKER_ERROR))),
+        stop=stop,
+    )
+    client = DockerClient()
+    task = asyncio.create_task(client.watch_containers())
+    await stopping.wait()
+
+    task.cancel()
+
+    # the watch does not resubscribe after the cancellation
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(task, 0.5)
+    assert docker_mock.events.subscribe.call_count == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'action, method', [(Action.STOP, 'stop'), (Action.RESTART, 'restart')]
+)
+@pytest.mark.parametrize(
+    'side_effect, expected',
+    [(None, ActionStatus.DONE), (DOCKER_ERROR, ActionStatus.FAILED)],
+)
+async def test_apply_action(docker_mock, action, method, side_effect, expected):
+    container = Mock(DockerContainer, **{method: AsyncMock(side_effect=side_effect)})
+    client = DockerClient()
+
+    result = await client.apply_action(action, container)
+
+    assert result == expected
+    getattr(container, method).assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_apply_action_timeout(docker_mock):
+    async def restart():
+        await asyncio.sleep(1)
+
+    container = Mock(DockerContainer, restart=restart)
+    client = DockerClient(action_timeout=0.01)
+
+    result = await client.apply_action(Action.RESTART, container)
+
+    assert result == ActionStatus.TIMED_OUT
+
+
+@pytest.mark.asyncio
+async def test_apply_action_concurrency(docker_mock):
+    running = []
+    max_running = 0
+
+    async def restart():
+        nonlocal max_running
+        running.append(None)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0)
+        running.pop()
+
+    containers = [Mock(DockerContainer, restart=restart) for _ in range(5)]
+    client = DockerClient(action_concurrency=2)
+
+    await asyncio.gather(*[client.apply_action(Action.RESTART, x) for x in containers])
+
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_apply_action_lane(docker_mock, tmpdir):
+    lane = ActionLane(str(tmpdir), poll_interval=0.01)
+    container = Mock(DockerContainer, id='container1', restart=AsyncMock())
+    client = DockerClient(action_lane=lane, action_timeout=0.05)
+
+    # another process applies an action to the container
+    async with lane.hold('container1'):
+        result = await client.apply_action(Action.RESTART, container)
+
+    assert result == ActionStatus.TIMED_OUT
+    container.restart.assert_not_awaited()
+
+    result = await client.apply_action(Action.RESTART, container)
+
+    assert result == ActionStatus.DONE
+    container.restart.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@patch('time.time', return_value=1000)
+async def test_apply_action_budget(time_mock, docker_mock):
+    containers = [
+        Mock(DockerContainer, id=f'container{i}', restart=AsyncMock()) for i in range(3)
+    ]
+    client = DockerClient(action_budget=ActionBudget(2, 0, 60))
+    suppressed = ACTIONS_SUPPRESSED.labels('restart')
+    suppressed_before = suppressed.value
+
+    results = [
+        await client.apply_action(Action.RESTART, x, container_labels=[['label1']])
+        for x in containers
+    ]
+
+    assert results == [ActionStatus.DONE, ActionStatus.DONE, ActionStatus.SUPPRESSED]
+    assert suppressed.value == suppressed_before + 1
+    containers[2].restart.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_apply_action_coalesced(docker_mock):
+    container = Mock(
+        DockerContainer, id='container1', restart=AsyncMock(), stop=AsyncMock()
+    )
+    client = DockerClient(action_coalesce_window=0.01)
+
+    results = await asyncio.gather(
+        client.apply_action(Action.RESTART, container),
+        client.apply_action(Action.STOP, container),
+        client.apply_action(Action.RESTART, container),
+    )
+
+    assert results == [ActionStatus.DONE] * 3
+    container.stop.assert_awaited_once()
+    container.restart.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_apply_action_invalid(docker_mock):
+    client = DockerClient()
+
+    with pytest.raises(RuntimeError, match='Unknown action: invalid_action'):
+        await client.apply_action('invalid_action', Mock())  # type: ignore
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('error', [DOCKER_ERROR, RUNTIME_ERROR, asyncio.TimeoutError()])
+async def test_watch_containers_stream_error(docker_mock, error):
+    containers = Mock(DockerContainers, list=AsyncMock(return_value=[]))
+    docker_mock.containers = containers
+    docker_mock.events = Mock(
+        subscribe=Mock(return_value=Mock(get=AsyncMock(side_effect=error))),
+        # the failed events task re-raises its error on stop
+        stop=AsyncMock(side_effect=error),
+    )
+    client = DockerClient()
+
+    with patch('asyncio.sleep', side_effect=[None, asyncio.CancelledError]):
+        with pytest.raises(asyncio.CancelledError):
+            await client.watch_containers()
+
+    assert docker_mock.events.subscribe.call_count == 2
+    assert docker_mock.events.stop.await_count == 2
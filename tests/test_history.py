@@ -0,0 +1,117 @@
+import math
+
+import pytest
+
+from src.pipeline_watchdog.history import MetricHistory
+
+
+def test_history_append():
+    history = MetricHistory(['buffer_size', 'last_sent_message'], 3)
+
+    history.append(1, {'buffer_size': 10, 'last_sent_message': 100})
+    history.append(2, {'buffer_size': 20, 'other': 1})
+
+    assert len(history) == 2
+    assert history.window('buffer_size') == ([1, 2], [10, 20])
+    # missing values are skipped
+    assert history.window('last_sent_message') == ([1], [100])
+
+
+def test_history_overwrites_oldest():
+    history = MetricHistory(['buffer_size'], 3)
+
+    for i in range(5):
+        history.append(i, {'buffer_size': i * 10})
+
+    assert len(history) == 3
+    assert history.capacity == 3
+    assert history.window('buffer_size') == ([2, 3, 4], [20, 30, 40])
+
+
+@pytest.mark.parametrize(
+    'since, expected',
+    [(-math.inf, ([1, 2, 3], [10, 20, 30])), (2, ([2, 3], [20, 30])), (4, ([], []))],
+)
+def test_history_window_since(since, expected):
+    history = MetricHistory(['buffer_size'], 5)
+    for i in range(1, 4):
+        history.append(i, {'buffer_size': i * 10})
+
+    assert history.window('buffer_size', since) == expected
+
+
+def test_history_last():
+    history = MetricHistory(['buffer_size', 'last_sent_message'], 2)
+    assert history.last('buffer_size') is None
+
+    history.append(1, {'buffer_size': 10, 'last_sent_message': 100})
+    history.append(2, {'buffer_size': 20})
+    history.append(3, {'buffer_size': 30})
+
+    assert history.last('buffer_size') == (3, 30)
+    # the sample with the value is overwritten
+    assert history.last('last_sent_message') is None
+
+
+def test_history_extend():
+    history = MetricHistory(['buffer_size'], 3)
+    history.append(1, {'buffer_size': 10, 'last_sent_message': 100})
+
+    history.extend(['buffer_size', 'last_sent_message'])
+    history.append(2, {'buffer_size': 20, 'last_sent_message': 200})
+
+    assert history.names == ('buffer_size', 'last_sent_message')
+    assert history.window('buffer_size') == ([1, 2], [10, 20])
+    # the metric is kept from the extension on
+    assert history.window('last_sent_message') == ([2], [200])
+
+
+def test_history_unknown_metric():
+    history = MetricHistory(['buffer_size'], 2)
+
+    with pytest.raises(KeyError):
+        history.window('missing')
+
+
+def test_history_invalid_capacity():
+    with pytest.raises(ValueError, match='History capacity must be positive.'):
+        MetricHistory(['buffer_size'], 0)
+
+
+@pytest.mark.parametrize(
+    'samples, since, min_samples, expected',
+    [
+        ([(0, 0), (10, 5), (20, 10)], -math.inf, 2, 0.5),
+        ([(0, 10), (10, 0), (20, 2), (30, 0)], -math.inf, 2, -0.28),
+        ([(0, 100), (10, 0), (20, 10)], 5, 2, 1),
+        ([(0, 0), (10, 5)], -math.inf, 3, None),
+        ([(0, 0)], -math.inf, 1, None),
+        ([], -math.inf, 2, None),
+    ],
+)
+def test_history_slope(samples, since, min_samples, expected):
+    history = MetricHistory(['buffer_size'], 5)
+    for timestamp, value in samples:
+        history.append(timestamp, {'buffer_size': value})
+
+    result = history.slope('buffer_size', since, min_samples)
+
+    assert result == (pytest.approx(expected) if expected is not None else None)
+
+
+@pytest.mark.parametrize(
+    'values, since, expected',
+    [
+        ([0, 10, 30], -math.inf, 1.5),
+        ([100, 110, 5, 20], -math.inf, 1.0),
+        ([0, 100, 110, 120], 5, 1.0),
+        ([10], -math.inf, None),
+    ],
+)
+def test_history_rate(values, since, expected):
+    history = MetricHistory(['sent_messages_total'], 5)
+    for i, value in enumerate(values):
+        history.append(i * 10, {'sent_messages_total': value})
+
+    # a decrease is a counter reset
+    assert history.rate('sent_messages_total', since) == expected
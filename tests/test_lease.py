@@ -0,0 +1,72 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from src.pipeline_watchdog.lease import LeaderLease
+
+
+def test_leader_lease(tmpdir):
+    path = str(tmpdir / 'leader.lock')
+    # leases of different instances share the lease file
+    leader = LeaderLease(path)
+    standby = LeaderLease(path)
+
+    assert leader.try_acquire()
+    assert not standby.try_acquire()
+    assert leader.is_leader
+    assert not standby.is_leader
+
+    leader.release()
+
+    assert standby.try_acquire()
+    assert not leader.try_acquire()
+
+
+@pytest.mark.asyncio
+async def test_leader_lease_acquire(tmpdir):
+    path = str(tmpdir / 'leader.lock')
+    leader = LeaderLease(path)
+    standby = LeaderLease(path, retry_interval=0.01)
+    leader.try_acquire()
+
+    task = asyncio.create_task(standby.acquire())
+    await asyncio.sleep(0.05)
+    assert not task.done()
+
+    leader.release()
+    await asyncio.wait_for(task, 1)
+
+    assert standby.is_leader
+
+
+@mock.patch('time.time', return_value=1000)
+def test_claim_action(time_mock, tmpdir):
+    path = str(tmpdir / 'leader.lock')
+    leader = LeaderLease(path)
+    standby = LeaderLease(path)
+    leader.try_acquire()
+
+    assert not standby.claim_action('buffer queue', 60)
+    assert leader.claim_action('buffer queue', 60)
+    assert leader.claim_action('buffer egress', 10)
+    # the leader does not limit its own actions, the watches do
+    assert leader.claim_action('buffer queue', 60)
+
+    leader.release()
+    time_mock.return_value = 1030
+    standby.try_acquire()
+
+    # the queue action is in cooldown after the failover, the egress one is not
+    assert not standby.claim_action('buffer queue', 60)
+    assert standby.claim_action('buffer egress', 10)
+    assert standby.claim_action('buffer queue', 60)
+
+
+def test_claim_action_invalid_journal(tmpdir):
+    path = str(tmpdir / 'leader.lock')
+    (tmpdir / 'leader.lock.actions').write('invalid')
+    lease = LeaderLease(path)
+    lease.try_acquire()
+
+    assert lease.claim_action('buffer queue', 60)
@@ -1,58 +1,112 @@
 import asyncio
+import copy
+import os
 import sys
 import time
 from unittest import mock
-from unittest.mock import AsyncMock, call
+from unittest.mock import AsyncMock, Mock, call
 
 import pytest
 from aiodocker.containers import DockerContainer
 
 from src.pipeline_watchdog import run
-from src.pipeline_watchdog.config import Action
+from src.pipeline_watchdog.buffer_metrics import Samples
+from src.pipeline_watchdog.config import (
+    Action,
+    RuleConfig,
+    ThroughputConfig,
+    UnreachableConfig,
+)
+from src.pipeline_watchdog.config.rule import Rule
+from src.pipeline_watchdog.history import MetricHistory
+from src.pipeline_watchdog.lease import LeaderLease
 from src.pipeline_watchdog.run import (
+    ActionStatus,
+    Watch,
+    check_egress,
+    check_ingress,
+    check_queue,
+    check_rule,
+    check_throughput,
+    egress_proximity,
+    get_due_watches,
+    get_next_check,
+    get_polling_interval,
     process_action,
+    queue_proximity,
+    to_watchdog_clock,
+    update_trigger,
     watch_buffer,
-    watch_egress,
-    watch_ingress,
-    watch_queue,
 )
+from src.pipeline_watchdog.scheduler import get_phase
+from src.pipeline_watchdog.series_clock import SeriesClock
+from src.pipeline_watchdog.sharding import assign_shards, get_shard
+from src.pipeline_watchdog.telemetry import ACTIONS, BUFFER_SIZE, CHECKS_SKIPPED, LEADER
+from tests.conftest import create_tmp_config_file
+
+ASYNCIO_SLEEP = asyncio.sleep
 
 
 @pytest.mark.asyncio
 @mock.patch('src.pipeline_watchdog.run.DockerClient', autospec=True)
-async def test_process_action_stop(docker_client_mock):
+@pytest.mark.parametrize('action', [Action.STOP, Action.RESTART])
+async def test_process_action(docker_client_mock, action):
     docker_client = docker_client_mock()
-    docker_container1 = AsyncMock(DockerContainer)
-    docker_container2 = AsyncMock(DockerContainer)
+    docker_container1 = Mock(DockerContainer, id='1')
+    docker_container2 = Mock(DockerContainer, id='2')
     docker_client.get_containers = mock.AsyncMock(
         return_value=[docker_container1, docker_container2]
     )
+    docker_client.apply_action.return_value = ActionStatus.DONE
     container_labels = [['label1']]
 
-    await process_action(docker_client, Action.STOP, container_labels)
+    result = await process_action(docker_client, action, container_labels)
 
+    assert result == {'1': ActionStatus.DONE, '2': ActionStatus.DONE}
     docker_client.get_containers.assert_awaited_once_with(container_labels)
-    docker_client.stop_container.assert_has_awaits(
-        [call(docker_container1), call(docker_container2)]
+    docker_client.apply_action.assert_has_awaits(
+        [
+            call(action, docker_container1, None, container_labels),
+            call(action, docker_container2, None, container_labels),
+        ]
     )
 
 
 @pytest.mark.asyncio
 @mock.patch('src.pipeline_watchdog.run.DockerClient', autospec=True)
-async def test_process_action_restart(docker_client_mock):
+async def test_process_action_concurrency(docker_client_mock):
     docker_client = docker_client_mock()
-    docker_container1 = AsyncMock(DockerContainer)
-    docker_container2 = AsyncMock(DockerContainer)
-    docker_client.get_containers = mock.AsyncMock(
-        return_value=[docker_container1, docker_container2]
+    containers = [Mock(DockerContainer, id=str(i)) for i in range(5)]
+    docker_client.get_containers = mock.AsyncMock(return_value=containers)
+    running = []
+    max_running = 0
+
+    async def apply_action(action, container, timeout, container_labels):
+        nonlocal max_running
+        running.append(container)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0)
+        running.remove(container)
+        if container.id == '3':
+            raise RuntimeError('error')
+        return ActionStatus.TIMED_OUT if container.id == '4' else ActionStatus.DONE
+
+    docker_client.apply_action.side_effect = apply_action
+
+    result = await process_action(
+        docker_client, Action.RESTART, [['label1']], concurrency=2, timeout=5
     )
-    container_labels = [['label1']]
 
-    await process_action(docker_client, Action.RESTART, container_labels)
-
-    docker_client.get_containers.assert_awaited_once_with(container_labels)
-    docker_client.restart_container.assert_has_awaits(
-        [call(docker_container1), call(docker_container2)]
+    assert max_running == 2
+    assert result == {
+        '0': ActionStatus.DONE,
+        '1': ActionStatus.DONE,
+        '2': ActionStatus.DONE,
+        '3': ActionStatus.FAILED,
+        '4': ActionStatus.TIMED_OUT,
+    }
+    docker_client.apply_action.assert_has_awaits(
+        [call(Action.RESTART, x, 5, [['label1']]) for x in containers]
     )
 
 
@@ -70,9 +124,11 @@ async def test_process_action_empty_containers(docker_client_mock, action):
     docker_client.get_containers = mock.AsyncMock(return_value=[])
     container_labels = [['label1']]
 
-    await process_action(docker_client, action, container_labels)
+    result = await process_action(docker_client, action, container_labels)
 
+    assert result == {}
     docker_client.get_containers.assert_awaited_once_with(container_labels)
+    docker_client.apply_action.assert_not_awaited()
 
 
 @pytest.mark.asyncio
@@ -84,412 +140,1074 @@ async def test_process_action_invalid(docker_client_mock):
         await process_action(docker_client, 'invalid_action', [])  # type: ignore
 
 
+class FakeClock:
+    """Monotonic clock advanced by the patched asyncio.sleep."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        # let the background actions start before the time is advanced
+        await ASYNCIO_SLEEP(0)
+        self.now += delay
+
+    async def wait_for(self, awaitable, timeout):
+        task = asyncio.ensure_future(awaitable)
+        await ASYNCIO_SLEEP(0)
+        if task.done():
+            return task.result()
+        task.cancel()
+        self.now += timeout
+        raise asyncio.TimeoutError()
+
+
+@pytest.fixture
+def fake_clock():
+    clock = FakeClock()
+    time_mock = mock.Mock(wraps=time, monotonic=clock.monotonic)
+    with mock.patch('src.pipeline_watchdog.run.time', time_mock):
+        with mock.patch('asyncio.sleep', side_effect=clock.sleep):
+            with mock.patch('asyncio.wait_for', side_effect=clock.wait_for):
+                yield clock
+
+
+@pytest.mark.parametrize(
+    'buffer_size, expected',
+    [(0, False), (18, False), (19, True), (999, True)],
+)
+def test_check_queue(watch_config, buffer_size, expected):
+    result = check_queue(
+        watch_config.buffer, watch_config.queue, {'buffer_size': buffer_size}
+    )
+
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    'sizes, expected',
+    [
+        # 0.2 messages/s, full in 60 seconds
+        ([0, 2, 4, 6], False),
+        # 0.4 messages/s, full in 15 seconds
+        ([0, 4, 8, 12], True),
+        # the growth before the window is ignored
+        ([0, 12, 12, 12], False),
+        ([12, 8, 4, 0], False),
+        # too few samples in the window
+        ([None, None, 8, 12], False),
+    ],
+)
+def test_check_queue_growth(watch_config, fake_clock, sizes, expected):
+    config = copy.deepcopy(watch_config.queue)
+    config.time_to_full = 30
+    config.growth_window = 25
+    history = MetricHistory(['buffer_size'], 10)
+    for i, size in enumerate(sizes):
+        history.append(i * 10, {'buffer_size': size} if size is not None else {})
+    fake_clock.now = 30
+
+    result = check_queue(
+        watch_config.buffer, config, {'buffer_size': sizes[-1]}, history
+    )
+
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    'sent, received, min_rate, min_ratio, expected',
+    [
+        # 1 message/s sent
+        ([0, 10, 20, 30], [0, 10, 20, 30], 2, None, True),
+        ([0, 10, 20, 30], [0, 10, 20, 30], 0.5, None, False),
+        # 1 of 3 messages/s received
+        ([0, 10, 20, 30], [0, 30, 60, 90], None, 0.5, True),
+        ([0, 10, 20, 30], [0, 30, 60, 90], None, 0.3, False),
+        ([0, 10, 20, 30], [0, 0, 0, 0], None, 0.5, False),
+        # the counter is reset after a restart
+        ([600, 10, 20, 30], [0, 10, 20, 30], 0.5, 0.5, False),
+        # too few samples
+        ([None, None, 20, 30], [0, 10, 20, 30], 2, None, False),
+    ],
+)
+def test_check_throughput(fake_clock, sent, received, min_rate, min_ratio, expected):
+    config = ThroughputConfig(
+        action=Action.RESTART,
+        cooldown=60,
+        polling_interval=10,
+        window=50,
+        container_labels=[['label1']],
+        min_rate=min_rate,
+        min_ratio=min_ratio,
+    )
+    history = MetricHistory(['sent_messages_total', 'received_messages_total'], 10)
+    for i, (x, y) in enumerate(zip(sent, received)):
+        sample = {'received_messages_total': y}
+        if x is not None:
+            sample['sent_messages_total'] = x
+        history.append(i * 10, sample)
+    fake_clock.now = 30
+
+    assert check_throughput('buffer1:8000', config, {}, history) == expected
+
+
+def create_rule_config(expr: str) -> RuleConfig:
+    return RuleConfig(
+        name='rule1',
+        rule=Rule(expr),
+        action=Action.RESTART,
+        cooldown=60,
+        polling_interval=10,
+        window=50,
+        container_labels=[['label1']],
+    )
+
+
+@pytest.mark.parametrize(
+    'expr, sizes, expected',
+    [
+        # 1 message/s pushed
+        ('buffer_size > 800 and rate(pushed) < 2', [900] * 4, True),
+        ('buffer_size > 800 and rate(pushed) < 0.5', [900] * 4, False),
+        ('buffer_size > 800 and rate(pushed) < 2', [100] * 4, False),
+        # 10 messages/s queued
+        ('slope(buffer_size) >= 10', [0, 100, 200, 300], True),
+        ('slope(buffer_size) >= 10', [0, 0, 0, 300], False),
+        # too few samples
+        ('slope(buffer_size) >= 0', [None, None, 200, 300], False),
+    ],
+)
+def test_check_rule(fake_clock, expr, sizes, expected):
+    config = create_rule_config(expr)
+    history = MetricHistory(['buffer_size', 'pushed'], 10)
+    for i, size in enumerate(sizes):
+        sample = {'pushed': i * 10}
+        if size is not None:
+            sample['buffer_size'] = size
+        history.append(i * 10, sample)
+    fake_clock.now = 30
+    metrics = {'buffer_size': sizes[-1], 'pushed': 30}
+
+    assert check_rule('buffer1:8000', config, metrics, history) == expected
+
+
+@pytest.mark.parametrize(
+    'expr',
+    [
+        'not rate(pushed) > 5',
+        'rate(pushed) != 5',
+        'buffer_size > 800 or slope(buffer_size) != 0',
+    ],
+)
+def test_check_rule_unknown(fake_clock, expr):
+    config = create_rule_config(expr)
+    history = MetricHistory(['buffer_size', 'pushed'], 10)
+    fake_clock.now = 30
+
+    metrics = {'buffer_size': 0, 'pushed': 30}
+
+    # the rule is not violated until the rate and slope are known
+    assert not check_rule('buffer1:8000', config, metrics, history)
+    assert not check_rule('buffer1:8000', config, metrics)
+
+
+def test_check_rule_age():
+    config = create_rule_config('age(last_sent_message) > 100')
+
+    with mock.patch('time.time', return_value=1000):
+        assert check_rule('buffer1:8000', config, {'last_sent_message': 800})
+        assert not check_rule('buffer1:8000', config, {'last_sent_message': 950})
+
+
+def test_create_watches_rules(watch_config):
+    config = copy.deepcopy(watch_config)
+    config.queue = config.egress = config.ingress = None
+    config.rules = [
+        create_rule_config('buffer_size > 800 and rate(pushed) < 2'),
+        create_rule_config('age(last_sent_message) > 100'),
+    ]
+    config.rules[1].name = 'rule2'
+
+    watches = run.create_watches(config)
+
+    assert [(w.condition, w.metric_names, w.skip_unchanged) for w in watches] == [
+        ('rule:rule1', ('buffer_size', 'pushed'), True),
+        ('rule:rule2', ('last_sent_message',), False),
+    ]
+    assert all(w.check is check_rule for w in watches)
+
+
+def test_check_queue_growth_disabled(watch_config):
+    history = MetricHistory(['buffer_size'], 10)
+    for i in range(4):
+        history.append(i * 10, {'buffer_size': i * 4})
+
+    result = check_queue(
+        watch_config.buffer, watch_config.queue, {'buffer_size': 12}, history
+    )
+
+    assert not result
+
+
+@pytest.mark.parametrize('idle, expected', [(0, False), (999, True)])
+def test_check_egress(watch_config, idle, expected):
+    result = check_egress(
+        watch_config.buffer,
+        watch_config.egress,
+        {'last_sent_message': time.time() - idle},
+    )
+
+    assert result == expected
+
+
+@pytest.mark.parametrize('idle, expected', [(0, False), (999, True)])
+def test_check_ingress(watch_config, idle, expected):
+    result = check_ingress(
+        watch_config.buffer,
+        watch_config.ingress,
+        {'last_received_message': time.time() - idle},
+    )
+
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    'now, expected',
+    [(0, []), (8, []), (9, [0]), (10, [0]), (19, [0, 1]), (100, [0, 1])],
+)
+def test_get_due_watches(watch_config, now, expected):
+    watches = [
+        Watch(watch_config.queue, check_queue, ('buffer_size',), next_check=10),
+        Watch(watch_config.egress, check_egress, ('last_sent_message',), next_check=20),
+    ]
+
+    result = get_due_watches(watches, now)
+
+    assert result == [watches[i] for i in expected]
+
+
+@pytest.mark.parametrize(
+    'min_polling_interval, metrics, expected',
+    [
+        (None, {'buffer_size': 18}, 10),
+        (2, {}, 10),
+        (2, {'buffer_size': 0}, 10),
+        (2, {'buffer_size': 9}, 6),
+        (2, {'buffer_size': 18}, 2),
+        (2, {'buffer_size': 100}, 2),
+    ],
+)
+def test_get_polling_interval_queue(
+    watch_config, min_polling_interval, metrics, expected
+):
+    config = copy.deepcopy(watch_config.queue)
+    config.min_polling_interval = min_polling_interval
+    watch = Watch(config, check_queue, ('buffer_size',), proximity=queue_proximity)
+
+    assert get_polling_interval(watch, metrics) == expected
+
+
+@pytest.mark.parametrize('idle, expected', [(0, 20), (50, 11), (100, 2), (300, 2)])
+def test_get_polling_interval_egress(watch_config, idle, expected):
+    config = copy.deepcopy(watch_config.egress)
+    config.min_polling_interval = 2
+    watch = Watch(
+        config, check_egress, ('last_sent_message',), proximity=egress_proximity
+    )
+
+    with mock.patch('time.time', return_value=1000):
+        result = get_polling_interval(watch, {'last_sent_message': 1000 - idle})
+
+    assert result == expected
+
+
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.watch_ingress')
-@mock.patch('src.pipeline_watchdog.run.watch_egress')
-@mock.patch('src.pipeline_watchdog.run.watch_queue')
+@mock.patch('src.pipeline_watchdog.run.check_ingress', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.check_egress', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.check_queue', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.process_action')
+@mock.patch(
+    'src.pipeline_watchdog.run.MetricsClient',
+    return_value=Mock(
+        scrape=AsyncMock(side_effect=[Samples()] * 6 + [asyncio.CancelledError])
+    ),
+)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
 async def test_watch_buffer(
     docker_client_mock,
-    watch_queue_mock,
-    watch_egress_mock,
-    watch_ingress_mock,
+    metrics_client_mock,
+    process_action_mock,
+    check_queue_mock,
+    check_egress_mock,
+    check_ingress_mock,
     watch_config,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
-
-    await watch_buffer(docker_client, watch_config)
-    watch_queue_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.queue
+    metrics_client = metrics_client_mock()
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [watch_config])
+
+    # queue, egress and ingress are polled every 10, 20 and 60 seconds,
+    # one scrape per tick is shared by all due conditions
+    assert fake_clock.now == 70
+    assert metrics_client.scrape.await_count == 7
+    queue = ('buffer_size', ())
+    egress = ('last_sent_message', ())
+    ingress = ('last_received_message', ())
+    assert metrics_client.scrape.await_args_list[:6] == [
+        call(watch_config.buffer, {queue}),
+        call(watch_config.buffer, {queue, egress}),
+        call(watch_config.buffer, {queue}),
+        call(watch_config.buffer, {queue, egress}),
+        call(watch_config.buffer, {queue}),
+        call(watch_config.buffer, {queue, egress, ingress}),
+    ]
+    assert check_queue_mock.call_count == 6
+    check_queue_mock.assert_called_with(
+        watch_config.buffer, watch_config.queue, {}, mock.ANY
     )
-    watch_egress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.egress
+    assert check_egress_mock.call_count == 3
+    check_egress_mock.assert_called_with(
+        watch_config.buffer, watch_config.egress, {}, mock.ANY
     )
-    watch_ingress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.ingress
+    assert check_ingress_mock.call_count == 1
+    check_ingress_mock.assert_called_with(
+        watch_config.buffer, watch_config.ingress, {}, mock.ANY
     )
+    process_action_mock.assert_not_awaited()
 
 
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.watch_ingress')
-@mock.patch('src.pipeline_watchdog.run.watch_egress')
-@mock.patch('src.pipeline_watchdog.run.watch_queue')
+@mock.patch('src.pipeline_watchdog.run.check_queue', side_effect=[True, False])
+@mock.patch('src.pipeline_watchdog.run.process_action')
+@mock.patch(
+    'src.pipeline_watchdog.run.MetricsClient',
+    return_value=Mock(
+        scrape=AsyncMock(side_effect=[Samples()] * 2 + [asyncio.CancelledError])
+    ),
+)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_buffer_queue_only(
+async def test_watch_buffer_action(
     docker_client_mock,
-    watch_queue_mock,
-    watch_egress_mock,
-    watch_ingress_mock,
+    metrics_client_mock,
+    process_action_mock,
+    check_queue_mock,
     config_with_queue_only,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
-
+    metrics_client = metrics_client_mock()
     watch_config = config_with_queue_only.watch_configs[0]
+    actions = ACTIONS.labels(watch_config.buffer, 'queue', 'restart')
+    actions_before = actions.value
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [watch_config])
 
-    await watch_buffer(docker_client, watch_config)
-    watch_queue_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.queue
+    # polling interval, cooldown after the action, polling interval
+    assert fake_clock.now == 10 + 60 + 10
+    assert check_queue_mock.call_count == 2
+    assert actions.value == actions_before + 1
+    process_action_mock.assert_awaited_once_with(
+        docker_client,
+        watch_config.queue.action,
+        watch_config.queue.container_labels,
+        watch_config.queue.concurrency,
+        watch_config.queue.timeout,
     )
-    watch_egress_mock.assert_not_awaited()
-    watch_ingress_mock.assert_not_awaited()
 
 
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.watch_ingress')
-@mock.patch('src.pipeline_watchdog.run.watch_egress')
-@mock.patch('src.pipeline_watchdog.run.watch_queue')
+@mock.patch('src.pipeline_watchdog.run.check_queue', side_effect=[True, False])
+@mock.patch('src.pipeline_watchdog.run.process_action')
+@mock.patch(
+    'src.pipeline_watchdog.run.MetricsClient',
+    return_value=Mock(
+        scrape=AsyncMock(side_effect=[Samples()] * 2 + [asyncio.CancelledError])
+    ),
+)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_buffer_egress_only(
+async def test_watch_buffer_standby(
     docker_client_mock,
-    watch_queue_mock,
-    watch_egress_mock,
-    watch_ingress_mock,
-    config_with_egress_only,
+    metrics_client_mock,
+    process_action_mock,
+    check_queue_mock,
+    config_with_queue_only,
+    fake_clock,
+    tmpdir,
 ):
     docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
+    watch_config = config_with_queue_only.watch_configs[0]
+    actions = ACTIONS.labels(watch_config.buffer, 'queue', 'restart')
+    actions_before = actions.value
+    path = str(tmpdir / 'leader.lock')
+    leader = LeaderLease(path)
+    leader.try_acquire()
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(
+            docker_client, metrics_client, [watch_config], lease=LeaderLease(path)
+        )
+
+    # the standby keeps the cooldown after the violation without the action
+    assert fake_clock.now == 10 + 60 + 10
+    assert actions.value == actions_before
+    process_action_mock.assert_not_awaited()
+    leader.release()
 
-    watch_config = config_with_egress_only.watch_configs[0]
 
-    await watch_buffer(docker_client, watch_config)
-    watch_egress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.egress
-    )
-    watch_queue_mock.assert_not_awaited()
-    watch_ingress_mock.assert_not_awaited()
+@pytest.mark.parametrize(
+    'checks, expected',
+    [
+        # a single noisy sample is not acted on
+        ([True, False, True, False], [False] * 4),
+        ([True, True, True, True], [False, False, True, True]),
+        # a single passed check does not reset the violation
+        ([True, True, True, False, True], [False, False, True, False, True]),
+        # the watch recovers after two passed checks in a row
+        ([True, True, True, False, False, True], [False, False, True] + [False] * 3),
+    ],
+)
+def test_update_trigger(watch_config, checks, expected):
+    config = copy.deepcopy(watch_config.queue)
+    config.trigger_after = 3
+    config.recover_after = 2
+    watch = Watch(config, check_queue, ('buffer_size',))
+
+    assert [update_trigger(watch, x) for x in checks] == expected
 
 
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.watch_ingress')
-@mock.patch('src.pipeline_watchdog.run.watch_egress')
-@mock.patch('src.pipeline_watchdog.run.watch_queue')
+@mock.patch('src.pipeline_watchdog.run.check_queue', side_effect=[True, True, False])
+@mock.patch('src.pipeline_watchdog.run.process_action')
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_buffer_ingress_only(
+async def test_watch_buffer_trigger_after(
     docker_client_mock,
-    watch_queue_mock,
-    watch_egress_mock,
-    watch_ingress_mock,
-    config_with_ingress_only,
+    metrics_client_mock,
+    process_action_mock,
+    check_queue_mock,
+    config_with_queue_only,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
+    metrics_client.scrape.side_effect = [Samples()] * 3 + [asyncio.CancelledError]
+    watch_config = copy.deepcopy(config_with_queue_only.watch_configs[0])
+    watch_config.queue.trigger_after = 2
 
-    watch_config = config_with_ingress_only.watch_configs[0]
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [watch_config])
 
-    await watch_buffer(docker_client, watch_config)
-    watch_ingress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.ingress
-    )
-    watch_queue_mock.assert_not_awaited()
-    watch_egress_mock.assert_not_awaited()
+    # the action is taken on the second violation, then the cooldown applies
+    assert fake_clock.now == 10 + 10 + 60 + 10
+    process_action_mock.assert_awaited_once()
 
 
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.watch_ingress')
-@mock.patch('src.pipeline_watchdog.run.watch_egress')
-@mock.patch('src.pipeline_watchdog.run.watch_queue', side_effect=RuntimeError('error'))
+@mock.patch('src.pipeline_watchdog.run.check_queue', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_buffer_watch_queue_failed(
+async def test_watch_buffer_shared_endpoint(
     docker_client_mock,
-    watch_queue_mock,
-    watch_egress_mock,
-    watch_ingress_mock,
-    watch_config,
+    metrics_client_mock,
+    check_queue_mock,
+    config_with_queue_only,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
-
-    with pytest.raises(RuntimeError, match='error'):
-        await watch_buffer(docker_client, watch_config)
-
-    watch_queue_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.queue
-    )
-    watch_egress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.egress
-    )
-    watch_ingress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.ingress
+    metrics_client = metrics_client_mock()
+    samples = Samples()
+    samples.add('buffer_size', (('adapter', 'buffer1'),), 1)
+    samples.add('buffer_size', (('adapter', 'buffer2'),), 2)
+    metrics_client.scrape.side_effect = [samples, asyncio.CancelledError]
+    configs = []
+    for adapter in ('buffer1', 'buffer2'):
+        watch_config = copy.deepcopy(config_with_queue_only.watch_configs[0])
+        watch_config.metric_labels = {'adapter': adapter}
+        configs.append(watch_config)
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, configs)
+
+    metrics_client.scrape.assert_awaited_with(
+        configs[0].buffer,
+        {
+            ('buffer_size', (('adapter', 'buffer1'),)),
+            ('buffer_size', (('adapter', 'buffer2'),)),
+        },
     )
+    assert metrics_client.scrape.await_count == 2
+    assert check_queue_mock.call_args_list == [
+        call(configs[0].buffer, configs[0].queue, {'buffer_size': 1}, mock.ANY),
+        call(configs[1].buffer, configs[1].queue, {'buffer_size': 2}, mock.ANY),
+    ]
+    # the last observed values are exposed per series
+    assert BUFFER_SIZE.labels(configs[0].buffer, 'adapter=buffer1').value == 1
+    assert BUFFER_SIZE.labels(configs[0].buffer, 'adapter=buffer2').value == 2
 
 
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.watch_ingress')
-@mock.patch('src.pipeline_watchdog.run.watch_egress', side_effect=RuntimeError('error'))
-@mock.patch('src.pipeline_watchdog.run.watch_queue')
+@mock.patch.object(MetricHistory, 'append', autospec=True)
+@mock.patch('src.pipeline_watchdog.run.check_egress', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.check_queue', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_buffer_watch_egress_failed(
+async def test_watch_buffer_history(
     docker_client_mock,
-    watch_queue_mock,
-    watch_egress_mock,
-    watch_ingress_mock,
+    metrics_client_mock,
+    check_queue_mock,
+    check_egress_mock,
+    append_mock,
     watch_config,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
+    samples = Samples()
+    samples.add('buffer_size', (), 1)
+    samples.add('last_sent_message', (), 2)
+    metrics_client.scrape.side_effect = [samples] * 2 + [asyncio.CancelledError]
+    config = copy.deepcopy(watch_config)
+    config.ingress = None
 
-    with pytest.raises(RuntimeError, match='error'):
-        await watch_buffer(docker_client, watch_config)
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [config])
 
-    watch_queue_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.queue
-    )
-    watch_egress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.egress
-    )
-    watch_ingress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.ingress
-    )
+    # one sample per scrape is kept for the series shared by the watches
+    history = append_mock.call_args_list[0].args[0]
+    assert append_mock.call_args_list == [
+        call(history, 10, {'buffer_size': 1, 'last_sent_message': 2}),
+        call(history, 20, {'buffer_size': 1, 'last_sent_message': 2}),
+    ]
 
 
 @pytest.mark.asyncio
-@mock.patch(
-    'src.pipeline_watchdog.run.watch_ingress', side_effect=RuntimeError('error')
-)
-@mock.patch('src.pipeline_watchdog.run.watch_egress')
-@mock.patch('src.pipeline_watchdog.run.watch_queue')
+@mock.patch.object(MetricHistory, 'append', autospec=True)
+@mock.patch('src.pipeline_watchdog.run.check_queue', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_buffer_watch_ingress_failed(
+async def test_watch_buffer_unchanged_sample(
     docker_client_mock,
-    watch_queue_mock,
-    watch_egress_mock,
-    watch_ingress_mock,
-    watch_config,
+    metrics_client_mock,
+    check_queue_mock,
+    append_mock,
+    config_with_queue_only,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
+    scrapes = []
+    for timestamp in (100, 100, 110):
+        samples = Samples()
+        samples.add('buffer_size', (), 1, timestamp)
+        scrapes.append(samples)
+    metrics_client.scrape.side_effect = scrapes + [asyncio.CancelledError]
+    config = config_with_queue_only.watch_configs[0]
+    skipped = CHECKS_SKIPPED.labels(config.buffer).value
 
-    with pytest.raises(RuntimeError, match='error'):
-        await watch_buffer(docker_client, watch_config)
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [config])
 
-    watch_queue_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.queue
-    )
-    watch_egress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.egress
-    )
-    watch_ingress_mock.assert_awaited_once_with(
-        docker_client, watch_config.buffer, watch_config.ingress
-    )
+    # the sample scraped again is neither checked nor kept in the history
+    assert check_queue_mock.call_count == 2
+    assert [x.args[1] for x in append_mock.call_args_list] == [10, 30]
+    assert CHECKS_SKIPPED.labels(config.buffer).value == skipped + 1
+
+
+def test_to_watchdog_clock():
+    metrics = {'buffer_size': 1, 'last_sent_message': 100}
+
+    result = to_watchdog_clock(metrics, 0.5)
+
+    assert result == {'buffer_size': 1, 'last_sent_message': 100.5}
+    assert metrics['last_sent_message'] == 100
+
+
+@pytest.mark.parametrize(
+    'follow_buffer_clock, expected',
+    [(False, 60), (True, 57.6)],
+)
+def test_get_next_check(watch_config, follow_buffer_clock, expected):
+    watch = Watch(watch_config.queue, check_queue, ('buffer_size',))
+    clock = SeriesClock()
+    clock.update(95, {}, 95.5)
+    clock.update(100, {}, 100.5)
+
+    with mock.patch.object(run, 'FOLLOW_BUFFER_CLOCK', follow_buffer_clock):
+        result = get_next_check(watch, {'buffer_size': 0}, clock, 50, 103)
+
+    # the check follows the latest refresh within the polling interval
+    assert result == pytest.approx(expected)
 
 
 @pytest.mark.asyncio
 @mock.patch('src.pipeline_watchdog.run.process_action')
-@mock.patch('src.pipeline_watchdog.run.get_metrics', return_value='content')
-@mock.patch(
-    'src.pipeline_watchdog.run.parse_metrics', return_value={'buffer_size': 999}
-)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_queue(
+async def test_watch_buffer_adaptive_polling(
     docker_client_mock,
-    parse_metrics_mock,
-    get_metrics_mock,
+    metrics_client_mock,
     process_action_mock,
     watch_config,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
-
-    with mock.patch(
-        'asyncio.sleep', side_effect=[None, asyncio.CancelledError]
-    ) as sleep_mock:
-        try:
-            await watch_queue(docker_client, watch_config.buffer, watch_config.queue)
-        except asyncio.CancelledError:
-            sleep_mock.assert_has_awaits(
-                [
-                    call(watch_config.queue.polling_interval),
-                    call(watch_config.queue.cooldown),
-                ]
-            )
-            pass
-
-    get_metrics_mock.assert_awaited_once_with(watch_config.buffer)
-    parse_metrics_mock.assert_awaited_once_with('content')
-    process_action_mock.assert_awaited_once_with(
-        docker_client, watch_config.queue.action, watch_config.queue.container_labels
-    )
+    metrics_client = metrics_client_mock()
+    scrapes = []
+    for buffer_size in (0, 9, 18, 0):
+        samples = Samples()
+        samples.add('buffer_size', (), buffer_size)
+        scrapes.append(samples)
+    scraped_at = []
+
+    async def scrape(*args):
+        scraped_at.append(fake_clock.now)
+        if not scrapes:
+            raise asyncio.CancelledError()
+        return scrapes.pop(0)
+
+    metrics_client.scrape.side_effect = scrape
+    config = copy.deepcopy(watch_config)
+    config.egress = config.ingress = None
+    config.queue.min_polling_interval = 2
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [config])
+
+    # the interval tightens as the queue fills up and relaxes when it drains
+    assert scraped_at == [10, 20, 26, 28, 38]
+    process_action_mock.assert_not_awaited()
 
 
 @pytest.mark.asyncio
+@mock.patch('random.uniform', return_value=1)
 @mock.patch('src.pipeline_watchdog.run.process_action')
-@mock.patch('src.pipeline_watchdog.run.get_metrics', return_value='content')
-@mock.patch('src.pipeline_watchdog.run.parse_metrics', return_value={'buffer_size': 0})
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_queue_empty(
+async def test_watch_buffer_scrape_failed(
     docker_client_mock,
-    parse_metrics_mock,
-    get_metrics_mock,
+    metrics_client_mock,
     process_action_mock,
-    watch_config,
+    uniform_mock,
+    config_with_queue_only,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
-
-    with mock.patch(
-        'asyncio.sleep', side_effect=[None, asyncio.CancelledError]
-    ) as sleep_mock:
-        try:
-            await watch_queue(docker_client, watch_config.buffer, watch_config.queue)
-        except asyncio.CancelledError:
-            sleep_mock.assert_has_awaits(
-                [
-                    call(watch_config.queue.polling_interval),
-                    call(watch_config.queue.polling_interval),
-                ]
-            )
-            pass
-
-    get_metrics_mock.assert_awaited_once_with(watch_config.buffer)
-    parse_metrics_mock.assert_awaited_once_with('content')
-    process_action_mock.assert_not_awaited()
+    metrics_client = metrics_client_mock()
+    watch_config = copy.deepcopy(config_with_queue_only.watch_configs[0])
+    watch_config.unreachable = UnreachableConfig(
+        action=Action.STOP,
+        duration=25,
+        cooldown=50,
+        container_labels=[['label1']],
+    )
+    scrape_times = []
+    action_times = []
+
+    async def scrape(*args):
+        scrape_times.append(fake_clock.now)
+        if len(scrape_times) > 6:
+            raise asyncio.CancelledError()
+        raise RuntimeError('error')
+
+    async def action(*args):
+        action_times.append(fake_clock.now)
+
+    metrics_client.scrape.side_effect = scrape
+    process_action_mock.side_effect = action
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [watch_config])
+
+    # polling interval until the circuit opens after 3 failures,
+    # then the delay doubles: 10, 20, 40, 80 seconds
+    assert scrape_times == [10, 20, 30, 40, 60, 100, 180]
+    # unreachable since 10, the action is applied after 25 seconds
+    # and then not earlier than the cooldown
+    assert action_times == [40, 100]
+    process_action_mock.assert_awaited_with(
+        docker_client, Action.STOP, [['label1']], None, None
+    )
 
 
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.process_action')
-@mock.patch('src.pipeline_watchdog.run.get_metrics', return_value='content')
+@mock.patch('src.pipeline_watchdog.run.check_egress', side_effect=KeyError('x'))
+@mock.patch('src.pipeline_watchdog.run.check_queue', return_value=True)
 @mock.patch(
-    'src.pipeline_watchdog.run.parse_metrics',
-    return_value={'last_sent_message': time.time() - 999},
+    'src.pipeline_watchdog.run.process_action', side_effect=RuntimeError('error')
 )
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_egress(
+async def test_watch_buffer_failures_isolated(
     docker_client_mock,
-    parse_metrics_mock,
-    get_metrics_mock,
+    metrics_client_mock,
     process_action_mock,
+    check_queue_mock,
+    check_egress_mock,
+    config_with_queue_only,
     watch_config,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
+    metrics_client.scrape.side_effect = [Samples()] * 2 + [asyncio.CancelledError]
+    config = copy.deepcopy(watch_config)
+    config.ingress = None
 
-    with mock.patch(
-        'asyncio.sleep', side_effect=[None, asyncio.CancelledError]
-    ) as sleep_mock:
-        try:
-            await watch_egress(docker_client, watch_config.buffer, watch_config.egress)
-        except asyncio.CancelledError:
-            sleep_mock.assert_has_awaits(
-                [
-                    call(watch_config.egress.polling_interval),
-                    call(watch_config.egress.cooldown),
-                ]
-            )
-            pass
-
-    get_metrics_mock.assert_awaited_once_with(watch_config.buffer)
-    parse_metrics_mock.assert_awaited_once_with('content')
-    process_action_mock.assert_awaited_once_with(
-        docker_client, watch_config.egress.action, watch_config.egress.container_labels
-    )
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [config])
+
+    # failed action and failed check do not stop the watch
+    assert metrics_client.scrape.await_count == 3
+    check_queue_mock.assert_called_once()
+    check_egress_mock.assert_called_once()
+    process_action_mock.assert_awaited_once()
 
 
 @pytest.mark.asyncio
+@mock.patch('src.pipeline_watchdog.run.check_egress', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.check_queue', return_value=True)
 @mock.patch('src.pipeline_watchdog.run.process_action')
-@mock.patch('src.pipeline_watchdog.run.get_metrics', return_value='content')
-@mock.patch(
-    'src.pipeline_watchdog.run.parse_metrics',
-    return_value={'last_sent_message': time.time()},
-)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_egress_message_just_sent(
+async def test_watch_buffer_action_in_background(
     docker_client_mock,
-    parse_metrics_mock,
-    get_metrics_mock,
+    metrics_client_mock,
     process_action_mock,
+    check_queue_mock,
+    check_egress_mock,
     watch_config,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
-
-    with mock.patch(
-        'asyncio.sleep', side_effect=[None, asyncio.CancelledError]
-    ) as sleep_mock:
+    metrics_client = metrics_client_mock()
+    metrics_client.scrape.side_effect = [Samples()] * 5 + [asyncio.CancelledError]
+    config = copy.deepcopy(watch_config)
+    config.ingress = None
+    config.queue.cooldown = 20
+    started = asyncio.Event()
+    cancelled = False
+
+    async def action(*args):
+        nonlocal cancelled
+        started.set()
         try:
-            await watch_egress(docker_client, watch_config.buffer, watch_config.egress)
+            # the action hangs until the watch is cancelled
+            await asyncio.Event().wait()
         except asyncio.CancelledError:
-            sleep_mock.assert_has_awaits(
-                [
-                    call(watch_config.egress.polling_interval),
-                    call(watch_config.egress.polling_interval),
-                ]
-            )
-            pass
-
-    get_metrics_mock.assert_awaited_once_with(watch_config.buffer)
-    parse_metrics_mock.assert_awaited_once_with('content')
-    process_action_mock.assert_not_awaited()
+            cancelled = True
+            raise
+
+    process_action_mock.side_effect = action
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [config])
+
+    # the hanging action does not delay the egress checks every 20 seconds,
+    # the queue is rechecked after the cooldown but the action is not restarted
+    assert started.is_set()
+    assert metrics_client.scrape.await_count == 6
+    assert check_egress_mock.call_count == 2
+    assert check_queue_mock.call_count == 3
+    process_action_mock.assert_awaited_once()
+    await ASYNCIO_SLEEP(0)
+    assert cancelled
 
 
 @pytest.mark.asyncio
 @mock.patch('src.pipeline_watchdog.run.process_action')
-@mock.patch('src.pipeline_watchdog.run.get_metrics', return_value='content')
-@mock.patch(
-    'src.pipeline_watchdog.run.parse_metrics',
-    return_value={'last_received_message': time.time() - 999},
-)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_ingress(
+async def test_watch_buffer_reload(
     docker_client_mock,
-    parse_metrics_mock,
-    get_metrics_mock,
+    metrics_client_mock,
     process_action_mock,
     watch_config,
+    fake_clock,
 ):
     docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
+    config = copy.deepcopy(watch_config)
+    config.egress = config.ingress = None
+    reloaded = copy.deepcopy(watch_config)
+    reloaded.ingress = None
+    reloaded.queue.length = 5
+    updates = asyncio.Queue()
+    scrapes = []
+
+    async def scrape(buffer, selectors):
+        scrapes.append((fake_clock.now, selectors))
+        if len(scrapes) == 1:
+            updates.put_nowait([reloaded])
+        elif len(scrapes) == 3:
+            raise asyncio.CancelledError()
+        samples = Samples()
+        samples.add('buffer_size', (), 10)
+        return samples
+
+    metrics_client.scrape.side_effect = scrape
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(docker_client, metrics_client, [config], updates)
+
+    # the queue keeps its schedule and is checked against the new length,
+    # the added egress watch is scheduled from the reload
+    queue = ('buffer_size', ())
+    egress = ('last_sent_message', ())
+    assert scrapes == [(10, {queue}), (20, {queue}), (30, {egress})]
+    process_action_mock.assert_awaited_once()
+
+
+def test_build_watches(watch_config):
+    config = copy.deepcopy(watch_config)
+    config.ingress = None
+    previous = run.build_watches([config], 0)
+    queue, egress = previous
+    # the queue is in the cooldown of an action
+    queue.next_check = queue.cooldown_until = 50
+    queue.action_task = Mock()
+    queue.triggered = True
+    egress.action_task = Mock()
+    reloaded = copy.deepcopy(watch_config)
+    reloaded.egress = None
+    reloaded.queue.length = 5
+
+    watches = run.build_watches([reloaded], 30, previous)
+
+    assert [(w.condition, w.next_check) for w in watches] == [
+        ('queue', 50),
+        ('ingress', 90),
+    ]
+    assert watches[0].config.length == 5
+    assert watches[0].cooldown_until == 50
+    assert watches[0].action_task is queue.action_task
+    assert watches[0].triggered
+    # the history of the series is kept and extended with the ingress metric
+    assert all(w.history is queue.history for w in watches)
+    assert 'last_received_message' in queue.history.names
+    queue.action_task.cancel.assert_not_called()
+    egress.action_task.cancel.assert_called_once()
+
+
+def test_build_watches_phase(watch_config):
+    previous = run.build_watches([watch_config], 0, phase=0.25)
+    previous[0].next_check = 35
+
+    watches = run.build_watches([watch_config], 30, previous[:1], phase=0.25)
+
+    # the first checks are brought forward, the scheduled ones are kept
+    assert [(w.condition, w.next_check) for w in previous] == [
+        ('queue', 35),
+        ('egress', 15),
+        ('ingress', 45),
+    ]
+    assert [w.next_check for w in watches] == [35, 45, 75]
+
+
+def test_build_watches_polling_interval(watch_config):
+    previous = run.build_watches([watch_config], 0)
+    for watch in previous:
+        watch.next_check = 600
+    # the egress is in the cooldown of an action
+    previous[1].cooldown_until = 600
+    reloaded = copy.deepcopy(watch_config)
+    for config in (reloaded.queue, reloaded.egress, reloaded.ingress):
+        config.polling_interval = 5
+
+    watches = run.build_watches([reloaded], 30, previous)
+
+    # the shorter polling interval applies from the reload, not after
+    # the previously scheduled check
+    assert [(w.condition, w.next_check) for w in watches] == [
+        ('queue', 35),
+        ('egress', 600),
+        ('ingress', 35),
+    ]
 
-    with mock.patch(
-        'asyncio.sleep', side_effect=[None, asyncio.CancelledError]
-    ) as sleep_mock:
-        try:
-            await watch_ingress(
-                docker_client, watch_config.buffer, watch_config.ingress
-            )
-        except asyncio.CancelledError:
-            sleep_mock.assert_has_awaits(
-                [
-                    call(watch_config.ingress.polling_interval),
-                    call(watch_config.ingress.cooldown),
-                ]
-            )
-            pass
-
-    get_metrics_mock.assert_awaited_once_with(watch_config.buffer)
-    parse_metrics_mock.assert_awaited_once_with('content')
-    process_action_mock.assert_awaited_once_with(
-        docker_client,
-        watch_config.ingress.action,
-        watch_config.ingress.container_labels,
+
+@pytest.mark.asyncio
+@mock.patch('src.pipeline_watchdog.run.Scheduler.sleep')
+@mock.patch('src.pipeline_watchdog.run.check_queue', return_value=False)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
+@mock.patch('src.pipeline_watchdog.run.DockerClient')
+async def test_watch_buffer_scheduler(
+    docker_client_mock,
+    metrics_client_mock,
+    check_queue_mock,
+    sleep_mock,
+    config_with_queue_only,
+    fake_clock,
+):
+    docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
+    metrics_client.scrape.side_effect = [Samples(), asyncio.CancelledError]
+
+    async def sleep(delay, key):
+        await fake_clock.sleep(delay)
+
+    sleep_mock.side_effect = sleep
+    scheduler = run.Scheduler()
+
+    with pytest.raises(asyncio.CancelledError):
+        await watch_buffer(
+            docker_client,
+            metrics_client,
+            config_with_queue_only.watch_configs,
+            asyncio.Queue(),
+            scheduler=scheduler,
+            phase=0.5,
+        )
+
+    # the ticks are slept on the scheduler, the first one is offset
+    assert sleep_mock.call_args_list == [
+        mock.call(5, key='buffer1:8000'),
+        mock.call(10, key='buffer1:8000'),
+    ]
+    check_queue_mock.assert_called_once()
+
+
+@pytest.mark.asyncio
+@mock.patch('src.pipeline_watchdog.run.build_watches', wraps=run.build_watches)
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
+@mock.patch('src.pipeline_watchdog.run.DockerClient')
+async def test_watch_buffer_scheduler_reload(
+    docker_client_mock, metrics_client_mock, build_watches_mock, watch_config
+):
+    scheduler = run.Scheduler()
+    updates = asyncio.Queue()
+    task = asyncio.create_task(
+        watch_buffer(
+            docker_client_mock(),
+            metrics_client_mock(),
+            [watch_config],
+            updates,
+            scheduler=scheduler,
+        )
     )
+    await ASYNCIO_SLEEP(0)
+    reloaded = copy.deepcopy(watch_config)
+    reloaded.queue.length = 5
+
+    updates.put_nowait([reloaded])
+    scheduler.wake(watch_config.buffer)
+    await ASYNCIO_SLEEP(0)
+    await ASYNCIO_SLEEP(0)
+
+    # the sleeping watch reloads at once, well before its first check
+    assert build_watches_mock.call_count == 2
+    assert build_watches_mock.call_args.args[0] == [reloaded]
+    assert updates.empty()
+    metrics_client_mock().scrape.assert_not_called()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
 
 
 @pytest.mark.asyncio
-@mock.patch('src.pipeline_watchdog.run.process_action')
-@mock.patch('src.pipeline_watchdog.run.get_metrics', return_value='content')
-@mock.patch(
-    'src.pipeline_watchdog.run.parse_metrics',
-    return_value={'last_received_message': time.time()},
-)
+@mock.patch('src.pipeline_watchdog.run.watch_buffer')
+async def test_buffer_watches_update(watch_buffer_mock, watch_config):
+    started = {}
+
+    async def watch(
+        docker_client, metrics_client, configs, updates, lease, scheduler, phase
+    ):
+        started[configs[0].buffer] = updates
+        await asyncio.Event().wait()
+
+    watch_buffer_mock.side_effect = watch
+    buffer_watches = run.BufferWatches(Mock(), Mock())
+    configs = {}
+    for buffer in ('buffer1:8000', 'buffer2:8000', 'buffer3:8000'):
+        configs[buffer] = [copy.deepcopy(watch_config)]
+        configs[buffer][0].buffer = buffer
+    run_task = asyncio.create_task(buffer_watches.run(dict(list(configs.items())[:2])))
+    await ASYNCIO_SLEEP(0)
+    await ASYNCIO_SLEEP(0)
+    updates = dict(started)
+    tasks = dict(buffer_watches._tasks)
+
+    changed = copy.deepcopy(configs['buffer2:8000'])
+    changed[0].queue.length = 5
+    with mock.patch.object(buffer_watches._scheduler, 'wake') as wake_mock:
+        buffer_watches.update(
+            {'buffer2:8000': changed, 'buffer3:8000': configs['buffer3:8000']}
+        )
+    await ASYNCIO_SLEEP(0)
+    await ASYNCIO_SLEEP(0)
+
+    # the watch of the changed buffer is woken up to reload
+    wake_mock.assert_called_once_with('buffer2:8000')
+
+    assert tasks['buffer1:8000'].cancelled()
+    assert not tasks['buffer2:8000'].done()
+    assert updates['buffer2:8000'].get_nowait() == changed
+    assert set(started) == {'buffer1:8000', 'buffer2:8000', 'buffer3:8000'}
+
+    # unchanged configs are not passed again
+    buffer_watches.update(
+        {'buffer2:8000': changed, 'buffer3:8000': configs['buffer3:8000']}
+    )
+    assert updates['buffer2:8000'].empty()
+    assert watch_buffer_mock.call_count == 3
+
+    run_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await run_task
+    assert all(x.done() for x in buffer_watches._tasks.values())
+
+
+@pytest.mark.asyncio
+async def test_watch_config_file(tmpdir):
+    path = tmpdir.join('config.yml')
+    path.write('watch: []')
+    reload = AsyncMock()
+    changes = [None, lambda: path.write('watch: [1]'), None]
+
+    async def sleep(delay):
+        if not changes:
+            raise asyncio.CancelledError()
+        change = changes.pop(0)
+        if change is not None:
+            change()
+
+    with mock.patch('asyncio.sleep', side_effect=sleep):
+        with pytest.raises(asyncio.CancelledError):
+            await run.watch_config_file(str(path), 1, reload)
+
+    reload.assert_awaited_once()
+
+
+@pytest.mark.parametrize('shard', [0, 1])
+@mock.patch('src.pipeline_watchdog.run.validate')
+@mock.patch('src.pipeline_watchdog.run.ConfigParser')
+def test_load_buffers_shard(config_parser_mock, validate_mock, config, shard):
+    config_parser_mock.return_value.parse.return_value = config
+    buffer = config.watch_configs[0].buffer
+    expected = {buffer: config.watch_configs} if get_shard(buffer, 2) == shard else {}
+
+    assert run.load_buffers('config.yml', shard, 2) == expected
+
+
+@pytest.mark.asyncio
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient')
-async def test_watch_ingress_message_just_received(
-    docker_client_mock,
-    parse_metrics_mock,
-    get_metrics_mock,
-    process_action_mock,
-    watch_config,
+async def test_watch_buffer_no_watches(
+    docker_client_mock, metrics_client_mock, config_with_invalid_watch_config
 ):
     docker_client = docker_client_mock()
+    metrics_client = metrics_client_mock()
 
-    with mock.patch(
-        'asyncio.sleep', side_effect=[None, asyncio.CancelledError]
-    ) as sleep_mock:
-        try:
-            await watch_ingress(
-                docker_client, watch_config.buffer, watch_config.ingress
-            )
-        except asyncio.CancelledError:
-            sleep_mock.assert_has_awaits(
-                [
-                    call(watch_config.ingress.polling_interval),
-                    call(watch_config.ingress.polling_interval),
-                ]
-            )
-            pass
-
-    get_metrics_mock.assert_awaited_once_with(watch_config.buffer)
-    parse_metrics_mock.assert_awaited_once_with('content')
-    process_action_mock.assert_not_awaited()
+    await watch_buffer(
+        docker_client, metrics_client, config_with_invalid_watch_config.watch_configs
+    )
+
+    metrics_client.scrape.assert_not_awaited()
 
 
 @pytest.mark.parametrize('config', [None, ''])
@@ -501,6 +1219,21 @@ def test_main_no_config_file_path(environ_mock, config):
         run.main()
 
 
+@pytest.mark.parametrize('concurrency, timeout', [(0, 60), (-1, 60), (10, 0), (10, -5)])
+@mock.patch('src.pipeline_watchdog.run.ConfigParser')
+@mock.patch('os.environ.get', return_value='config.yml')
+def test_main_invalid_action_limits(
+    environ_mock, config_parser_mock, concurrency, timeout
+):
+    with mock.patch.multiple(
+        run, ACTION_CONCURRENCY=concurrency, ACTION_TIMEOUT=timeout
+    ):
+        with pytest.raises(SystemExit, match='1'):
+            run.main()
+
+    config_parser_mock.assert_not_called()
+
+
 @mock.patch('src.pipeline_watchdog.run.validate', side_effect=RuntimeError('error'))
 @mock.patch('src.pipeline_watchdog.run.ConfigParser')
 @mock.patch('os.environ.get', return_value='config.yml')
@@ -517,6 +1250,7 @@ def test_main_invalid_config(environ_mock, config_parser_mock, validate_mock):
 
 
 @mock.patch('src.pipeline_watchdog.run.watch_buffer')
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.DockerClient', autospec=True)
 @mock.patch('src.pipeline_watchdog.run.validate')
 @mock.patch('src.pipeline_watchdog.run.ConfigParser')
@@ -526,6 +1260,7 @@ def test_main_keyboard_interrupt(
     config_parser_mock,
     validate_mock,
     docker_client_mock,
+    metrics_client_mock,
     watch_buffer_mock,
     config,
 ):
@@ -543,10 +1278,228 @@ def test_main_keyboard_interrupt(
 
     assert loop.is_closed()
     docker_client_mock.return_value.close.assert_awaited_once()
+    metrics_client_mock.return_value.close.assert_awaited_once()
 
     config_parser_mock.assert_called_once_with('config.yml')
     config_parser.parse.assert_called_once()
     validate_mock.assert_called_once_with(config)
     watch_buffer_mock.assert_awaited_once_with(
-        docker_client_mock.return_value, config.watch_configs[0]
+        docker_client_mock.return_value,
+        metrics_client_mock.return_value,
+        [config.watch_configs[0]],
+        mock.ANY,
+        None,
+        mock.ANY,
+        get_phase(config.watch_configs[0].buffer),
     )
+
+
+@mock.patch('src.pipeline_watchdog.run.watch_buffer')
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
+@mock.patch('src.pipeline_watchdog.run.DockerClient', autospec=True)
+def test_run_watches_lease(
+    docker_client_mock, metrics_client_mock, watch_buffer_mock, config, tmpdir
+):
+    path = str(tmpdir / 'leader.lock')
+    buffers = {config.watch_configs[0].buffer: config.watch_configs[0:1]}
+
+    def raise_exception():
+        raise KeyboardInterrupt()
+
+    loop = asyncio.new_event_loop()
+    loop.call_later(0.1, raise_exception)
+    asyncio.set_event_loop(loop)
+
+    with mock.patch('src.pipeline_watchdog.run.WATCHDOG_LEASE_PATH', path):
+        run.run_watches(buffers)
+
+    lease = watch_buffer_mock.await_args.args[4]
+    assert isinstance(lease, LeaderLease)
+    assert LEADER.labels().value == 1
+    # the lease is released on shutdown
+    assert not lease.is_leader
+    assert LeaderLease(path).try_acquire()
+
+
+@mock.patch('src.pipeline_watchdog.run.WATCHDOG_METRICS_PORT', 8080)
+@mock.patch('src.pipeline_watchdog.run.monitor_event_loop_lag')
+@mock.patch('src.pipeline_watchdog.run.start_metrics_server')
+@mock.patch('src.pipeline_watchdog.run.watch_buffer')
+@mock.patch('src.pipeline_watchdog.run.MetricsClient', autospec=True)
+@mock.patch('src.pipeline_watchdog.run.DockerClient', autospec=True)
+@mock.patch('src.pipeline_watchdog.run.validate')
+@mock.patch('src.pipeline_watchdog.run.ConfigParser')
+@mock.patch('os.environ.get', return_value='config.yml')
+def test_main_metrics_server(
+    environ_mock,
+    config_parser_mock,
+    validate_mock,
+    docker_client_mock,
+    metrics_client_mock,
+    watch_buffer_mock,
+    start_metrics_server_mock,
+    monitor_event_loop_lag_mock,
+    config,
+):
+    config_parser_mock.return_value.parse.return_value = config
+    metrics_server = start_metrics_server_mock.return_value
+
+    def raise_exception():
+        raise KeyboardInterrupt()
+
+    loop = asyncio.new_event_loop()
+    loop.call_later(0.1, raise_exception)
+    asyncio.set_event_loop(loop)
+
+    run.main()
+
+    start_metrics_server_mock.assert_awaited_once_with('0.0.0.0', 8080)
+    monitor_event_loop_lag_mock.assert_awaited_once()
+    metrics_server.cleanup.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_monitor_event_loop_lag(fake_clock):
+    lag = run.EVENT_LOOP_LAG.labels()
+    count = lag.count
+
+    with mock.patch('asyncio.sleep', side_effect=[None, asyncio.CancelledError]):
+        with pytest.raises(asyncio.CancelledError):
+            await run.monitor_event_loop_lag(1)
+
+    assert lag.count == count + 1
+
+
+@mock.patch('src.pipeline_watchdog.run.WATCHDOG_SHARDS', 2)
+@mock.patch('src.pipeline_watchdog.run.run_watches')
+@mock.patch('src.pipeline_watchdog.run.supervise_shards')
+@mock.patch('src.pipeline_watchdog.run.validate')
+@mock.patch('src.pipeline_watchdog.run.ConfigParser')
+@mock.patch('os.environ.get', return_value='config.yml')
+def test_main_shards(
+    environ_mock,
+    config_parser_mock,
+    validate_mock,
+    supervise_shards_mock,
+    run_watches_mock,
+    config,
+):
+    config_parser_mock.return_value.parse.return_value = config
+
+    run.main()
+
+    supervise_shards_mock.assert_called_once_with(
+        {config.watch_configs[0].buffer: [config.watch_configs[0]]}, 2, 'config.yml'
+    )
+    run_watches_mock.assert_not_called()
+
+
+@mock.patch('src.pipeline_watchdog.run.WATCHDOG_SHARDS', 0)
+@mock.patch('src.pipeline_watchdog.run.ConfigParser')
+@mock.patch('os.environ.get', return_value='config.yml')
+def test_main_invalid_shards(environ_mock, config_parser_mock):
+    with pytest.raises(SystemExit, match='1'):
+        run.main()
+
+    config_parser_mock.assert_not_called()
+
+
+@mock.patch('src.pipeline_watchdog.run.ACTION_BUDGET', -1)
+@mock.patch('src.pipeline_watchdog.run.ConfigParser')
+@mock.patch('os.environ.get', return_value='config.yml')
+def test_main_invalid_action_budget(environ_mock, config_parser_mock):
+    with pytest.raises(SystemExit, match='1'):
+        run.main()
+
+    config_parser_mock.assert_not_called()
+
+
+@mock.patch('time.sleep')
+@mock.patch('multiprocessing.connection.wait')
+@mock.patch('multiprocessing.get_context')
+def test_supervise_shards(get_context_mock, wait_mock, sleep_mock):
+    buffers = {f'buffer{i}:8000': [f'watch{i}'] for i in range(10)}
+    assigned = assign_shards(buffers, 2)
+    workers = []
+
+    def create_worker(target, args, name, daemon):
+        worker = Mock(sentinel=len(workers), exitcode=1)
+        worker.is_alive.return_value = True
+        # the terminated worker stops within the timeout
+        worker.join.side_effect = lambda *_: setattr(
+            worker.is_alive, 'return_value', False
+        )
+        workers.append(worker)
+        return worker
+
+    get_context_mock.return_value.Process.side_effect = create_worker
+
+    def die(_):
+        # the first worker dies once, then the supervisor is interrupted
+        if len(workers) == 2:
+            workers[0].is_alive.return_value = False
+            return [workers[0].sentinel]
+        raise KeyboardInterrupt()
+
+    wait_mock.side_effect = die
+
+    run.supervise_shards(buffers, 2)
+
+    get_context_mock.assert_called_once_with('spawn')
+    process_calls = get_context_mock.return_value.Process.call_args_list
+    assert [x.kwargs['args'][:3] for x in process_calls] == [
+        (0, 2, assigned[0]),
+        (1, 2, assigned[1]),
+        (0, 2, assigned[0]),
+    ]
+    # the workers share the lane directory
+    lane_path = process_calls[0].kwargs['args'][3]
+    assert all(x.kwargs['args'][3] == lane_path for x in process_calls)
+    assert not os.path.exists(lane_path)
+    sleep_mock.assert_called_once_with(run.SHARD_RESTART_INTERVAL)
+    for worker in workers[1:]:
+        worker.terminate.assert_called_once()
+        worker.join.assert_called_once_with(run.SHARD_SHUTDOWN_TIMEOUT)
+    # the dead worker is replaced
+    workers[0].terminate.assert_not_called()
+    for worker in workers:
+        worker.kill.assert_not_called()
+
+
+@mock.patch('multiprocessing.connection.wait', side_effect=KeyboardInterrupt)
+@mock.patch('multiprocessing.get_context')
+def test_supervise_shards_kill(get_context_mock, wait_mock):
+    workers = [Mock(sentinel=i) for i in range(2)]
+    # the first worker ignores the termination
+    workers[0].is_alive.return_value = True
+    workers[1].is_alive.return_value = False
+    get_context_mock.return_value.Process.side_effect = workers
+
+    run.supervise_shards({'buffer:8000': ['watch']}, 2)
+
+    workers[0].kill.assert_called_once()
+    assert workers[0].join.call_args_list == [
+        mock.call(run.SHARD_SHUTDOWN_TIMEOUT),
+        mock.call(),
+    ]
+    workers[1].kill.assert_not_called()
+    workers[1].join.assert_called_once_with(run.SHARD_SHUTDOWN_TIMEOUT)
+
+
+@mock.patch('src.pipeline_watchdog.run.validate')
+def test_load_buffers_cache(validate_mock, tmpdir, config):
+    config_file_path = create_tmp_config_file(tmpdir, {'watch': []})
+    cache_dir = str(tmpdir.join('cache'))
+
+    with mock.patch.multiple(run, CONFIG_CACHE_DIR=cache_dir):
+        with mock.patch(
+            'src.pipeline_watchdog.run.ConfigParser', autospec=True
+        ) as config_parser_mock:
+            config_parser_mock.return_value.parse.return_value = config
+            first = run.load_buffers(config_file_path)
+            second = run.load_buffers(config_file_path)
+
+    # the unchanged file is parsed once, the cached config is validated again
+    config_parser_mock.assert_called_once_with(config_file_path)
+    assert first == second == {config.watch_configs[0].buffer: config.watch_configs}
+    assert validate_mock.call_count == 2
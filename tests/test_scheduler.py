@@ -0,0 +1,77 @@
+import asyncio
+import math
+
+import pytest
+
+from src.pipeline_watchdog.scheduler import Scheduler, get_phase
+
+
+@pytest.mark.asyncio
+async def test_scheduler_sleep():
+    scheduler = Scheduler()
+    woken = []
+
+    async def sleep(name, delay):
+        await scheduler.sleep(delay)
+        woken.append(name)
+
+    await asyncio.gather(sleep('c', 0.06), sleep('a', 0.02), sleep('b', 0.04))
+
+    assert woken == ['a', 'b', 'c']
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_single_timer():
+    scheduler = Scheduler(resolution=0.05)
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.create_task(scheduler.sleep(0.01 + i * 0.01)) for i in range(3)]
+    await asyncio.sleep(0)
+
+    # sleepers due within the resolution are woken up by the same timer
+    assert len(loop._scheduled) == 1
+    await asyncio.sleep(0.02)
+    assert all(x.done() for x in tasks)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_sleep_cancelled():
+    scheduler = Scheduler()
+    task = asyncio.create_task(scheduler.sleep(0.01))
+    await asyncio.sleep(0)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await scheduler.sleep(0.02)
+
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_wake():
+    scheduler = Scheduler()
+    task = asyncio.create_task(scheduler.sleep(math.inf, 'buffer1'))
+    other = asyncio.create_task(scheduler.sleep(10, 'buffer2'))
+    await asyncio.sleep(0)
+
+    scheduler.wake('buffer1')
+    # waking a key without a sleeper does nothing
+    scheduler.wake('buffer3')
+    await asyncio.sleep(0)
+
+    assert task.done()
+    assert not other.done()
+    other.cancel()
+    await asyncio.gather(other, return_exceptions=True)
+    assert scheduler._sleepers == {}
+
+
+def test_get_phase():
+    phases = [get_phase(f'buffer-{i}:8000') for i in range(1000)]
+
+    assert get_phase('buffer-0:8000') == phases[0]
+    assert all(0 <= x < 1 for x in phases)
+    # the phases are spread evenly over the interval
+    for i in range(10):
+        assert 70 < sum(i / 10 <= x < (i + 1) / 10 for x in phases) < 130
@@ -0,0 +1,56 @@
+import pytest
+
+from src.pipeline_watchdog.series_clock import SeriesClock
+
+
+def test_series_clock_update():
+    clock = SeriesClock()
+
+    assert clock.update(100, {'buffer_size': 1}, 100.5)
+    # the same sample scraped again
+    assert not clock.update(100, {'buffer_size': 1}, 102)
+    assert clock.update(105, {'buffer_size': 1}, 105.2)
+    assert clock.update(115, {'buffer_size': 2}, 116)
+
+    assert clock.timestamp == 115
+    assert clock.period == 5
+    assert clock.offset == pytest.approx(0.2)
+
+
+def test_series_clock_update_changed_values():
+    clock = SeriesClock()
+    clock.update(100, {'buffer_size': 1}, 100.5)
+
+    # a stale timestamp does not hide changed values
+    assert clock.update(100, {'buffer_size': 2}, 101)
+    assert clock.period is None
+
+
+def test_series_clock_update_no_timestamp():
+    clock = SeriesClock()
+
+    assert clock.update(None, {'buffer_size': 1}, 100)
+    assert clock.update(None, {'buffer_size': 1}, 101)
+    assert clock.offset is None
+    assert clock.next_refresh(100, 110) is None
+
+
+@pytest.mark.parametrize(
+    'after, deadline, expected',
+    [
+        # the latest refresh until the deadline
+        (100, 110, 105.5),
+        (100, 112, 110.5),
+        (100, 115.5, 115.5),
+        # the first refresh after a deadline before it
+        (100, 101, 100.5),
+        (100.5, 101, 105.5),
+    ],
+)
+def test_series_clock_next_refresh(after, deadline, expected):
+    clock = SeriesClock()
+    clock.update(90, {}, 90.5)
+    clock.update(95, {}, 96)
+    clock.update(100, {}, 101)
+
+    assert clock.next_refresh(after, deadline) == pytest.approx(expected)
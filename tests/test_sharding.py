@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from src.pipeline_watchdog.sharding import ActionLane, assign_shards, get_shard
+
+KEYS = [f'buffer{i}:8000' for i in range(200)]
+
+
+def test_get_shard():
+    shards = [get_shard(x, 4) for x in KEYS]
+
+    assert shards == [get_shard(x, 4) for x in KEYS]
+    assert set(shards) == {0, 1, 2, 3}
+    assert get_shard(KEYS[0], 1) == 0
+
+
+def test_get_shard_added():
+    before = [get_shard(x, 4) for x in KEYS]
+    after = [get_shard(x, 5) for x in KEYS]
+
+    # only the keys moving to the added shard change their shard
+    moved = [(x, y) for x, y in zip(before, after) if x != y]
+    assert moved
+    assert all(y == 4 for _, y in moved)
+
+
+def test_assign_shards():
+    items = {x: i for i, x in enumerate(KEYS[:10])}
+
+    result = assign_shards(items, 3)
+
+    assert sorted(x for shard in result for x in shard.values()) == list(range(10))
+    for shard, assigned in enumerate(result):
+        assert all(get_shard(x, 3) == shard for x in assigned)
+        assert all(items[x] == i for x, i in assigned.items())
+
+
+@pytest.mark.asyncio
+async def test_action_lane(tmpdir):
+    # lanes of different processes share the lock directory
+    lanes = [ActionLane(str(tmpdir), poll_interval=0.01) for _ in range(2)]
+    events = []
+
+    async def apply(lane: ActionLane, name: str, container_id: str):
+        async with lane.hold(container_id):
+            events.append(f'{name} started')
+            await asyncio.sleep(0.05)
+            events.append(f'{name} done')
+
+    await asyncio.gather(
+        apply(lanes[0], 'first', 'container1'),
+        apply(lanes[1], 'second', 'container1'),
+        apply(lanes[1], 'other', 'container2'),
+    )
+
+    # actions on the same container do not overlap, other containers are not held
+    assert events.index('first done') < events.index('second started')
+    assert events.index('other started') < events.index('first done')
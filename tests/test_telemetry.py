@@ -0,0 +1,80 @@
+import aiohttp
+import pytest
+
+from src.pipeline_watchdog.telemetry import Registry, start_metrics_server
+
+
+@pytest.fixture
+def registry():
+    registry = Registry()
+    counter = registry.counter('actions_total', 'Actions.', ('buffer', 'action'))
+    counter.labels('buffer1', 'restart').inc()
+    counter.labels('buffer1', 'restart').inc(2)
+    counter.labels('buf"fer\\2\n', 'stop').inc()
+    registry.gauge('lag_seconds', 'Lag.').labels().set(0.5)
+    histogram = registry.histogram('scrape_seconds', 'Scrape.', ('buffer',), (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.labels('buffer1').observe(value)
+    return registry
+
+
+def test_registry_expose(registry):
+    assert registry.expose() == (
+        '# HELP actions_total Actions.\n'
+        '# TYPE actions_total counter\n'
+        'actions_total{buffer="buffer1",action="restart"} 3.0\n'
+        'actions_total{buffer="buf\\"fer\\\\2\\n",action="stop"} 1.0\n'
+        '# HELP lag_seconds Lag.\n'
+        '# TYPE lag_seconds gauge\n'
+        'lag_seconds 0.5\n'
+        '# HELP scrape_seconds Scrape.\n'
+        '# TYPE scrape_seconds histogram\n'
+        'scrape_seconds_bucket{buffer="buffer1",le="0.1"} 2\n'
+        'scrape_seconds_bucket{buffer="buffer1",le="1.0"} 3\n'
+        'scrape_seconds_bucket{buffer="buffer1",le="+Inf"} 4\n'
+        'scrape_seconds_sum{buffer="buffer1"} 3.65\n'
+        'scrape_seconds_count{buffer="buffer1"} 4\n'
+    )
+
+
+def test_registry_duplicate():
+    registry = Registry()
+    registry.counter('actions_total', 'Actions.')
+
+    with pytest.raises(ValueError, match='Metric actions_total is already registered'):
+        registry.gauge('actions_total', 'Actions.')
+
+
+def test_metric_invalid_labels():
+    counter = Registry().counter('actions_total', 'Actions.', ('buffer',))
+
+    with pytest.raises(ValueError, match='Metric actions_total expects labels'):
+        counter.labels('buffer1', 'restart')
+
+
+def test_histogram_time():
+    histogram = Registry().histogram('action_seconds', 'Action.')
+
+    with pytest.raises(RuntimeError):
+        with histogram.labels().time():
+            raise RuntimeError('error')
+
+    # failed blocks are observed as well
+    assert histogram.labels().count == 1
+
+
+@pytest.mark.asyncio
+async def test_start_metrics_server(registry, unused_tcp_port):
+    runner = await start_metrics_server('127.0.0.1', unused_tcp_port, registry)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f'http://127.0.0.1:{unused_tcp_port}/metrics'
+            ) as response:
+                content_type = response.headers['Content-Type']
+                content = await response.text()
+    finally:
+        await runner.cleanup()
+
+    assert content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    assert content == registry.expose()
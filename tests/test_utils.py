@@ -3,7 +3,7 @@ from unittest import mock
 
 import pytest
 
-from src.pipeline_watchdog.utils import convert_to_seconds, init_logging
+from src.pipeline_watchdog.utils import convert_to_seconds, init_logging, lazy_import
 
 
 @mock.patch('logging.basicConfig')
@@ -47,3 +47,19 @@ def test_convert_to_seconds(string, expected):
 def test_convert_to_seconds_invalid_input(string, expected_error):
     with pytest.raises(expected_error):
         convert_to_seconds(string)
+
+
+def test_lazy_import():
+    sys.modules.pop('tests.lazy_module', None)
+
+    module = lazy_import('tests.lazy_module')
+
+    assert sys.modules['tests.lazy_module'] is module
+    # the module is executed on the first attribute access
+    assert module.LOADED
+    assert lazy_import('tests.lazy_module') is module
+
+
+def test_lazy_import_missing():
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import('tests.missing_module')